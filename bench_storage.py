@@ -0,0 +1,338 @@
+"""
+Storage micro-benchmarks for the bank/ledger modules.
+
+Usage:
+    python bench_storage.py            # run everything
+    python bench_storage.py normalize  # run one benchmark
+"""
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import careon_bank_v2 as bank
+import sld_persist
+import sld_serial
+import sld_tail
+from careon_txlog import TxLog
+
+
+SIZES = (100, 5_000, 100_000)
+
+
+def _fake_history(n: int) -> list:
+    types = ("earn", "spend", "fund", "phrase", "admin")
+    return [
+        {
+            "ts": f"2026-01-01T{(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}Z",
+            "type": types[i % len(types)],
+            "amount": i % 50,
+            "note": f"note-{i % 7}",
+        }
+        for i in range(n)
+    ]
+
+
+def _fake_bank(n: int) -> dict:
+    return {"balance": 10**9, "sld_network_fund": 0, "history": _fake_history(n), "meta": {}}
+
+
+def _ms(fn, repeat: int = 20) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def bench_normalize() -> None:
+    """spend+summarize on an already-normalized bank: full re-walk vs watermark."""
+    print(f"{'history':>10} {'full ms':>10} {'incr ms':>10} {'speedup':>8}")
+    for n in SIZES:
+        b = bank._normalize(_fake_bank(n))
+
+        def full():
+            b["meta"].pop("validated_len", None)
+            bank.spend(b, 1, "bench")
+            bank.summarize(b)
+
+        def incr():
+            bank.spend(b, 1, "bench")
+            bank.summarize(b)
+
+        f, i = _ms(full), _ms(incr)
+        print(f"{n:>10} {f:>10.3f} {i:>10.3f} {f / max(i, 1e-9):>7.0f}x")
+
+
+def _traced_bytes(build) -> tuple:
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    obj = build()
+    used = tracemalloc.get_traced_memory()[0] - base
+    tracemalloc.stop()
+    return obj, used
+
+
+def bench_txlog() -> None:
+    """Resident bytes per 10k txs: list of dicts (as parsed from JSON) vs TxLog."""
+    raw = json.dumps(_fake_history(10_000))
+    hist, list_bytes = _traced_bytes(lambda: json.loads(raw))
+    log, log_bytes = _traced_bytes(lambda: TxLog(hist))
+    assert log.to_list() == hist
+    print(f"list[dict]: {list_bytes / 1024:>8.0f} KiB per 10k txs")
+    print(f"TxLog:      {log_bytes / 1024:>8.0f} KiB per 10k txs ({list_bytes / max(log_bytes, 1):.1f}x smaller)")
+
+
+def bench_persist(threads: int = 8, saves: int = 25) -> None:
+    """Concurrent earn+save on one bank per durability mode: saves/s and writes coalesced."""
+    print(f"{'durability':>11} {'saves/s':>9} {'writes':>7} {'coalesced':>10}")
+    for mode in sld_persist.DURABILITY_MODES:
+        sld_persist.DURABILITY = mode
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "bank.json")
+            bank.ensure_bank_exists(path)
+            before = sld_persist.persist_stats()
+
+            def work():
+                for _ in range(saves):
+                    bank.update_bank(path, lambda b: bank.earn(b, 1, "bench"), retries=10_000)
+
+            ts = [threading.Thread(target=work) for _ in range(threads)]
+            t0 = time.perf_counter()
+            for t in ts:
+                t.start()
+            for t in ts:
+                t.join()
+            secs = time.perf_counter() - t0
+            after = sld_persist.persist_stats()
+            writes = after["writes"] - before["writes"]
+            coalesced = after["coalesced"] - before["coalesced"]
+            print(f"{mode:>11} {threads * saves / secs:>9.0f} {writes:>7} {coalesced:>10}")
+            bank.clear_cache()
+
+
+def bench_serialize() -> None:
+    """Bytes and ms per bank save: old pretty stdlib vs compact stdlib vs the active encoder."""
+    encoders = {
+        "pretty": lambda b: json.dumps(b, indent=2, ensure_ascii=False).encode("utf-8"),
+        "compact": lambda b: sld_serial._stdlib_dumps(b, False, None),
+        sld_serial.ENCODER: lambda b: sld_serial.dumps(b),
+    }
+    print(f"{'history':>10} " + " ".join(f"{name + ' KiB':>13} {name + ' ms':>11}" for name in encoders))
+    for n in SIZES:
+        b = bank._normalize(_fake_bank(n))
+        cells = []
+        for enc in encoders.values():
+            size = len(enc(b))
+            cells.append(f"{size / 1024:>13.0f} {_ms(lambda: enc(b), repeat=5):>11.2f}")
+        print(f"{n:>10} " + " ".join(cells))
+
+
+def bench_tail() -> None:
+    """Last 12 entries / last 12 phrases: parse the bank file vs mmap the tail."""
+    print(f"{'history':>10} {'parse ms':>10} {'tail ms':>9} {'phrases ms':>11}")
+    for n in SIZES + (1_000_000,):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "bank.json")
+            b = _fake_bank(n)
+            with open(path, "wb") as f:
+                f.write(sld_serial.dumps(b))
+            sld_tail.sync(path, b["history"], 0, 0, n)
+
+            def parse():
+                bank.clear_cache()
+                bank.recent_txs(bank.load_bank(path), 12)
+
+            parse_ms = _ms(parse, repeat=3)
+            tail_ms = _ms(lambda: sld_tail.read_last(path, 12))
+            phrase_ms = _ms(lambda: sld_tail.read_last(path, 12, types=("phrase",)))
+            print(f"{n:>10} {parse_ms:>10.2f} {tail_ms:>9.3f} {phrase_ms:>11.3f}")
+    bank.clear_cache()
+
+
+def bench_coldload() -> None:
+    """Cold load: checksum-verified snapshot vs untrusted file vs damaged file (.bak recovery)."""
+    print(f"{'history':>10} {'verified ms':>12} {'untrusted ms':>13} {'recover ms':>11}")
+    for n in SIZES:
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "bank.json")
+            b = bank._normalize(_fake_bank(n))
+            bank.save_bank(b, path)
+            bank.save_bank(b, path)  # second generation -> .bak
+            bank.clear_cache()
+
+            verified = _ms(lambda: bank._read_json_bank(path), repeat=5)
+            side = open(path + ".sum", "rb").read()
+            os.remove(path + ".sum")
+            untrusted = _ms(lambda: bank._read_json_bank(path), repeat=5)
+            with open(path + ".sum", "wb") as f:
+                f.write(side)
+            st = os.stat(path)
+            with open(path, "r+b") as f:
+                f.seek(st.st_size // 2)
+                f.write(b"#")
+            os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))  # media damage, not an edit
+            recover = _ms(lambda: bank._read_json_bank(path), repeat=5)
+            print(f"{n:>10} {verified:>12.2f} {untrusted:>13.2f} {recover:>11.2f}")
+    bank.clear_cache()
+
+
+def bench_replay() -> None:
+    """careon_bank_replay over archived + hot history: full decode vs index summaries."""
+    import careon_bank_replay as replay
+    import sld_archive
+
+    engines = ["python"] + (["numpy"] if replay.np is not None else [])
+    print(f"{'history':>10} " + " ".join(f"{e + ' ms':>10}" for e in engines) + f" {'quick ms':>10}")
+    np_mod = replay.np
+    for n in (100_000, 1_000_000):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "bank.json")
+            hist = _fake_history(n)
+            hot = n - bank.MAX_HISTORY
+            for i in range(0, hot, sld_archive.ARCHIVE_BLOCK):
+                sld_archive.write_segment(path, hist[i:i + sld_archive.ARCHIVE_BLOCK])
+            b = _fake_bank(0)
+            b["history"] = hist[hot:]
+            b["meta"] = {"archived": hot}
+            sld_persist.atomic_save_json(bank._normalize(b), path)
+            bank.clear_cache()
+
+            cells = []
+            for e in engines:
+                replay.np = np_mod if e == "numpy" else None
+                cells.append(f"{_ms(lambda: replay.replay(path), repeat=2):>10.0f}")
+            replay.np = np_mod
+            quick = _ms(lambda: replay.replay(path, quick=True), repeat=5)
+            print(f"{n:>10} " + " ".join(cells) + f" {quick:>10.1f}")
+    bank.clear_cache()
+
+
+def bench_chain() -> None:
+    """Hash-chain checks: incremental verify vs full audit (1 process / all cores)."""
+    import sld_archive
+    import sld_chain
+
+    print(f"{'history':>10} {'incr ms':>10} {'full 1p ms':>11} {'full ms':>10} {'cores':>6}")
+    for n in (100_000, 1_000_000):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "bank.json")
+            hist = _fake_history(n)
+            meta = {"archived": 0}
+            sld_chain.state(meta, 0)
+            sld_chain.catch_up(meta, hist, 0)
+            hot = n - bank.MAX_HISTORY
+            for i in range(0, hot, sld_archive.ARCHIVE_BLOCK):
+                sld_archive.write_segment(path, hist[i:i + sld_archive.ARCHIVE_BLOCK])
+            b = _fake_bank(0)
+            b["history"] = hist[hot:]
+            meta["archived"] = hot
+            b["meta"] = meta
+            b = bank._normalize(b)
+
+            sld_chain.audit(b["meta"], b["history"], hot, path, workers=1)  # marks verified
+            for _ in range(100):
+                bank.earn(b, 1, "bench")
+            incr = _ms(lambda: bank.verify_history(b, path), repeat=5)
+            full_1p = _ms(lambda: bank.verify_history(b, path, full=True, workers=1), repeat=1)
+            full = _ms(lambda: bank.verify_history(b, path, full=True), repeat=1)
+            print(f"{n:>10} {incr:>10.2f} {full_1p:>11.0f} {full:>10.0f} {os.cpu_count():>6}")
+
+
+def bench_mint() -> None:
+    """Minting a promo batch: mint_code in a loop (one save per code) vs mint_codes (one save)."""
+    import codes_ledger
+
+    print(f"{'codes':>10} {'loop ms':>10} {'batch ms':>10}")
+    for n in (1_000, 100_000):
+        with tempfile.TemporaryDirectory() as d:
+            path = os.path.join(d, "ledger.json")
+            loop = None
+            if n <= 1_000:  # O(n^2): only the small batch is timed
+                t0 = time.perf_counter()
+                for _ in range(n):
+                    codes_ledger.update_ledger(path, lambda l: codes_ledger.mint_code(l, 25))
+                loop = (time.perf_counter() - t0) * 1000
+            path = os.path.join(d, "batch.json")
+            t0 = time.perf_counter()
+            codes_ledger.mint_codes(codes_ledger.load_ledger(path), n, 25, path=path,
+                                    csv_path=os.path.join(d, "codes.csv"))
+            batch = (time.perf_counter() - t0) * 1000
+            print(f"{n:>10} {'-' if loop is None else f'{loop:.0f}':>10} {batch:>10.0f}")
+
+
+def bench_redeem() -> None:
+    """Redeem at the ledger path: unknown code (Bloom filter) and valid codes, JSON ledger vs SQLite."""
+    import codes_ledger
+
+    print(f"{'codes':>10} {'reject us':>10} {'json ms':>10} {'sqlite ms':>10}")
+    for n in (1_000, 100_000):
+        with tempfile.TemporaryDirectory() as d:
+            row = []
+            for path in (os.path.join(d, "ledger.json"), os.path.join(d, "ledger.db")):
+                minted = codes_ledger.mint_codes(codes_ledger.load_ledger(path), n, 25, path=path)
+                valid = iter(minted)
+                row.append(_ms(lambda: codes_ledger.redeem_at(path, next(valid)), repeat=5))
+            path = os.path.join(d, "ledger.json")
+            bogus = [codes_ledger.generate_code() for _ in range(1000)]
+            t0 = time.perf_counter()
+            for code in bogus:
+                codes_ledger.redeem_at(path, code)
+            reject = (time.perf_counter() - t0) * 1e6 / len(bogus)
+            print(f"{n:>10} {reject:>10.1f} {row[0]:>10.1f} {row[1]:>10.2f}")
+
+
+def bench_ledger() -> None:
+    """Code lookups on a loaded JSON ledger: whole-ledger validation pass vs per-entry checks."""
+    import codes_ledger
+
+    print(f"{'codes':>10} {'full ms':>10} {'lookup us':>10} {'redeem us':>10} {'mint us':>10}")
+    for n in (1_000, 100_000, 1_000_000):
+        ledger = codes_ledger.load_ledger(os.path.join(tempfile.gettempdir(), "bench-missing-ledger.json"))
+        minted = codes_ledger.mint_codes(ledger, n, 25)
+        full = _ms(lambda: codes_ledger._normalize(ledger), repeat=3)
+        probe = minted[n // 2]
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            codes_ledger.is_redeemed(ledger, probe)
+        lookup = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        for code in minted[:1000]:
+            codes_ledger.redeem_code(ledger, code)
+        redeem = (time.perf_counter() - t0) * 1000
+        t0 = time.perf_counter()
+        for _ in range(1000):
+            codes_ledger.mint_code(ledger, 25)
+        mint = (time.perf_counter() - t0) * 1000
+        print(f"{n:>10} {full:>10.1f} {lookup:>10.1f} {redeem:>10.1f} {mint:>10.1f}")
+
+
+BENCHES = {
+    "normalize": bench_normalize,
+    "txlog": bench_txlog,
+    "persist": bench_persist,
+    "serialize": bench_serialize,
+    "tail": bench_tail,
+    "coldload": bench_coldload,
+    "replay": bench_replay,
+    "chain": bench_chain,
+    "mint": bench_mint,
+    "redeem": bench_redeem,
+    "ledger": bench_ledger,
+}
+
+
+def main(argv: list) -> None:
+    names = argv or list(BENCHES)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHES[name]()
+        print()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,283 @@
+"""
+Replay a bank's transaction stream and check it against the stored totals.
+
+Usage:
+    python careon_bank_replay.py [bank path ...]        # default: careon_bank_v2.json
+    python careon_bank_replay.py --quick [bank path]     # archive from the index, incremental chain check
+    python careon_bank_replay.py --json [bank path]      # machine-readable report
+
+Exit status is 1 if any bank drifted.
+"""
+import os
+import sys
+import time
+from typing import Dict, Iterator, List, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # optional fast path
+    np = None
+
+import careon_bank_sqlite as _sqlite
+import careon_bank_v2 as _bank
+import sld_archive as _archive
+import sld_serial as _serial
+
+
+# ----------------------------
+# Replay engine
+# ----------------------------
+#
+# `balance` and `sld_network_fund` are stored next to the history; replay
+# recomputes both from the full stream (archive segments, then the hot
+# history) with careon_bank_v2.REPLAY_EFFECTS, starting from the balances of
+# a fresh bank. The stream is fed in column chunks (types, amounts): one
+# archive segment, the hot list, or a batch of SQLite rows. With NumPy each
+# chunk is reduced with unique/cumsum; without it a plain loop does the same.
+#
+# Besides the drift, the report records the first position where the
+# replayed balance goes negative (spend() never allows that, so it points at
+# lost or hand-made entries), whether meta.aggregates agrees and the result
+# of the hash-chain check (careon_bank_v2.verify_history).
+
+class _Replay:
+    """Running state of one replay; types are interned to small int codes."""
+
+    __slots__ = ("balance", "fund", "pos", "min_balance", "negative_at", "names", "ix", "counts", "sums", "invalid")
+
+    def __init__(self, balance: int, fund: int):
+        self.balance = balance
+        self.fund = fund
+        self.pos = 0
+        self.min_balance = balance
+        self.negative_at = None
+        self.names: List[str] = []
+        self.ix: Dict[str, int] = {}
+        self.counts: List[int] = []
+        self.sums: List[int] = []
+        self.invalid = 0
+
+    def code(self, t: str) -> int:
+        k = self.ix.get(t)
+        if k is None:
+            k = self.ix[t] = len(self.names)
+            self.names.append(t)
+            self.counts.append(0)
+            self.sums.append(0)
+        return k
+
+    def columns(self, entries) -> Tuple[List[int], list]:
+        """(type codes, amounts) for a chunk of tx dicts; malformed ones count as 0."""
+        codes, amounts = [], []
+        ix, code = self.ix, self.code
+        for tx in entries:
+            if not isinstance(tx, dict):
+                codes.append(code(""))
+                amounts.append(0)
+                self.invalid += 1
+                continue
+            t = tx.get("type", "")
+            k = ix.get(t) if type(t) is str else None
+            codes.append(k if k is not None else code(str(t)))
+            a = tx.get("amount", 0)
+            if type(a) is not int:
+                try:
+                    a = int(a or 0)
+                except Exception:
+                    a = 0
+                    self.invalid += 1
+            amounts.append(a)
+        return codes, amounts
+
+    def tally(self, t: str, n: int, total: int) -> None:
+        k = self.code(t)
+        self.counts[k] += n
+        self.sums[k] += total
+
+    def feed(self, codes: List[int], amounts: list) -> None:
+        if not codes:
+            return
+        if np is not None:
+            self._feed_numpy(codes, amounts)
+        else:
+            self._feed_python(codes, amounts)
+        self.pos += len(codes)
+
+    def _weights(self) -> tuple:
+        effects = _bank.REPLAY_EFFECTS
+        w = [effects.get(t, (0, 0)) for t in self.names]
+        return [b for b, _ in w], [f for _, f in w]
+
+    def _feed_numpy(self, codes: List[int], amounts: list) -> None:
+        try:
+            amt = np.asarray(amounts, dtype=np.int64)
+        except OverflowError:
+            return self._feed_python(codes, amounts)
+        c = np.asarray(codes, dtype=np.intp)
+        w_bal, w_fund = (np.asarray(w, dtype=np.int64) for w in self._weights())
+        for k in np.flatnonzero(np.bincount(c, minlength=len(self.names))):
+            hit = c == k
+            self.counts[k] += int(hit.sum())
+            self.sums[k] += int(amt[hit].sum())
+
+        run = np.cumsum(w_bal[c] * amt) + self.balance
+        low = int(run.min())
+        if low < self.min_balance:
+            self.min_balance = low
+        if self.negative_at is None and low < 0:
+            self.negative_at = self.pos + int(np.flatnonzero(run < 0)[0])
+        self.balance = int(run[-1])
+        self.fund += int((w_fund[c] * amt).sum())
+
+    def _feed_python(self, codes: List[int], amounts: list) -> None:
+        w_bal, w_fund = self._weights()
+        counts, sums = self.counts, self.sums
+        balance, fund = self.balance, self.fund
+        for i, (k, a) in enumerate(zip(codes, amounts)):
+            counts[k] += 1
+            sums[k] += a
+            balance += w_bal[k] * a
+            fund += w_fund[k] * a
+            if balance < self.min_balance:
+                self.min_balance = balance
+                if self.negative_at is None and balance < 0:
+                    self.negative_at = self.pos + i
+        self.balance, self.fund = balance, fund
+
+    def totals(self) -> tuple:
+        """({type: count}, {type: sum}) for the types seen."""
+        seen = [k for k, n in enumerate(self.counts) if n]
+        return ({self.names[k]: self.counts[k] for k in seen},
+                {self.names[k]: self.sums[k] for k in seen})
+
+
+# ----------------------------
+# Sources
+# ----------------------------
+
+def _json_chunks(bank: dict, path: str, quick: bool, rep: _Replay) -> Iterator[tuple]:
+    archived = int(bank["meta"].get("archived", 0))
+    for seg in _archive.read_index(path):
+        if int(seg.get("start", 0)) >= archived:
+            break  # archived after `bank` was loaded: its entries are in bank["history"]
+        if quick:
+            # trust the segment summary written at archive time
+            effects = _bank.REPLAY_EFFECTS
+            for t, n in (seg.get("counts") or {}).items():
+                total = int((seg.get("sums") or {}).get(t, 0))
+                rep.tally(t, int(n), total)
+                e = effects.get(t, (0, 0))
+                rep.balance += e[0] * total
+                rep.fund += e[1] * total
+            rep.pos += int(seg.get("count", 0))
+            continue
+        yield rep.columns(_archive.read_segment(path, seg))
+    yield rep.columns(bank["history"])
+
+
+def _sqlite_chunks(bank: _sqlite.SqliteBank, rep: _Replay) -> Iterator[tuple]:
+    for types, amounts in _sqlite.history_columns(bank):
+        yield [rep.code(t) for t in types], amounts
+
+
+def replay(path: str, quick: bool = False) -> dict:
+    """
+    Recompute balance and network fund of the bank at `path` from its full
+    history and report the drift against the stored values. quick=True takes
+    archived segments from their index summaries instead of decoding them
+    (negative_at then only covers the hot history).
+    """
+    t0 = time.perf_counter()
+    fresh = _bank._default_bank()
+    rep = _Replay(int(fresh["balance"]), int(fresh["sld_network_fund"]))
+
+    b = _bank.load_bank(path)
+    if isinstance(b, _sqlite.SqliteBank):
+        chunks = _sqlite_chunks(b, rep)
+        archived = 0
+        agg = None  # the SQLite backend computes aggregates from the same rows
+    else:
+        chunks = _json_chunks(b, path, quick, rep)
+        archived = int(b["meta"].get("archived", 0))
+        agg = _bank.aggregates(b, path)
+
+    for codes, amounts in chunks:
+        rep.feed(codes, amounts)
+    counts, sums = rep.totals()
+
+    stored_balance = int(b.get("balance", 0))
+    stored_fund = int(b.get("sld_network_fund", 0))
+    hot = len(b.get("history") or [])
+    report = {
+        "path": path,
+        "engine": "numpy" if np is not None else "python",
+        "quick": bool(quick),
+        "entries": rep.pos,
+        "expected_entries": archived + hot if agg is not None else rep.pos,
+        "balance": {"stored": stored_balance, "replayed": rep.balance, "drift": stored_balance - rep.balance},
+        "fund": {"stored": stored_fund, "replayed": rep.fund, "drift": stored_fund - rep.fund},
+        "min_balance": rep.min_balance,
+        "negative_at": rep.negative_at,
+        "invalid": rep.invalid,
+        "counts": counts,
+        "sums": sums,
+        "aggregates_ok": agg is None or (agg["counts"] == counts and agg["sums"] == sums),
+        # hash chain (sld_chain): full audit, or incremental with quick
+        "chain": _bank.verify_history(b, path, full=not quick),
+    }
+    report["ok"] = (
+        report["balance"]["drift"] == 0
+        and report["fund"]["drift"] == 0
+        and report["negative_at"] is None
+        and report["entries"] == report["expected_entries"]
+        and report["aggregates_ok"]
+        and (report["chain"] is None or report["chain"]["ok"])
+    )
+    report["elapsed_ms"] = (time.perf_counter() - t0) * 1000
+    return report
+
+
+def format_report(report: dict) -> str:
+    """Short human-readable summary (CLI + admin panel)."""
+    b, f = report["balance"], report["fund"]
+    lines = [
+        f"{report['path']}: {'OK' if report['ok'] else 'DRIFT'} • {report['entries']} txs replayed "
+        f"in {report['elapsed_ms']:.0f} ms ({report['engine']}{', quick' if report['quick'] else ''})",
+        f"  balance  stored {b['stored']}  replayed {b['replayed']}  drift {b['drift']:+d}",
+        f"  fund     stored {f['stored']}  replayed {f['replayed']}  drift {f['drift']:+d}",
+    ]
+    if report["negative_at"] is not None:
+        lines.append(f"  balance first goes negative at tx #{report['negative_at']} (min {report['min_balance']})")
+    if report["entries"] != report["expected_entries"]:
+        lines.append(f"  history has {report['entries']} txs, bank meta expects {report['expected_entries']}")
+    if report["invalid"]:
+        lines.append(f"  {report['invalid']} malformed entries counted as 0")
+    chain = report.get("chain")
+    if chain is not None:
+        if chain["ok"]:
+            lines.append(f"  chain    {chain['checked']} of {chain['upto'] - chain['start']} hashes checked ({chain['mode']}), "
+                         f"head {chain['head'][:12]}")
+        else:
+            at = chain["bad_at"] if chain["bad_at"] is not None else chain["broken"]
+            lines.append(f"  chain    BROKEN at tx #{at} ({chain['mode']} check)")
+    if not report["aggregates_ok"]:
+        lines.append("  meta.aggregates disagrees with the replay")
+    return "\n".join(lines)
+
+
+def main(argv: list) -> int:
+    quick = "--quick" in argv
+    as_json = "--json" in argv
+    paths = [a for a in argv if not a.startswith("--")] or [
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "careon_bank_v2.json")
+    ]
+    ok = True
+    for path in paths:
+        report = replay(path, quick=quick)
+        ok = ok and report["ok"]
+        print(_serial.dumps_str(report, pretty=True) if as_json else format_report(report))
+    return 0 if ok else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,511 @@
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Optional
+
+import sld_persist as _persist
+
+
+# ----------------------------
+# SQLite storage backend for careon_bank_v2
+# ----------------------------
+#
+# careon_bank_v2 dispatches here when the bank path ends in .db/.sqlite
+# (or SLD_BANK_BACKEND=sqlite). Banks are returned as `SqliteBank`, a plain
+# dict subclass that remembers its database, so the public API keeps its
+# signatures: spend/earn/award_once_per_round commit straight to the database
+# in one short transaction each, and save_bank only flushes edits made to the
+# dict by hand (extra history entries, balance/fund deltas).
+
+# How many recent history rows are mirrored into bank["history"] on load.
+HISTORY_WINDOW = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS bank (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    balance INTEGER NOT NULL,
+    fund INTEGER NOT NULL,
+    last_saved_utc TEXT
+);
+CREATE TABLE IF NOT EXISTS history (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    type TEXT NOT NULL,
+    amount INTEGER NOT NULL,
+    note TEXT NOT NULL DEFAULT '',
+    extra TEXT
+);
+CREATE INDEX IF NOT EXISTS history_type_id ON history(type, id);
+CREATE INDEX IF NOT EXISTS history_type_note_id ON history(type, note, id);
+CREATE INDEX IF NOT EXISTS history_ts ON history(ts);
+"""
+
+# Running per-type totals, kept by triggers in the same transaction as every
+# history insert/delete, so aggregates() never scans the history. Databases
+# created before this get the table, the triggers and a one-time backfill in
+# a single write transaction (see _ensure_aggregates).
+_AGG_SCHEMA = (
+    """CREATE TABLE IF NOT EXISTS aggregates (
+        type TEXT PRIMARY KEY,
+        n INTEGER NOT NULL,
+        total INTEGER NOT NULL
+    )""",
+    """CREATE TRIGGER history_agg_insert AFTER INSERT ON history BEGIN
+        INSERT INTO aggregates(type, n, total) VALUES (NEW.type, 1, NEW.amount)
+        ON CONFLICT(type) DO UPDATE SET n = n + 1, total = total + excluded.total;
+    END""",
+    """CREATE TRIGGER history_agg_delete AFTER DELETE ON history BEGIN
+        UPDATE aggregates SET n = n - 1, total = total - OLD.amount WHERE type = OLD.type;
+    END""",
+    "DELETE FROM aggregates",
+    "INSERT INTO aggregates(type, n, total) SELECT type, COUNT(*), COALESCE(SUM(amount), 0) FROM history GROUP BY type",
+)
+
+_CORE_KEYS = ("ts", "type", "amount", "note")
+
+
+class SqliteBank(dict):
+    """Bank dict bound to the SQLite file it was loaded from."""
+
+    def __init__(self, db_path: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.db_path = db_path
+
+
+def _now_utc() -> str:
+    return datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+
+# ----------------------------
+# Connections
+# ----------------------------
+
+_local = threading.local()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """One autocommit connection per (thread, db); transactions are explicit."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        folder = os.path.dirname(db_path) or "."
+        os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        _ensure_aggregates(conn)
+        conns[db_path] = conn
+    return conn
+
+
+def _has_aggregates(conn: sqlite3.Connection) -> bool:
+    return conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'trigger' AND name = 'history_agg_insert'"
+    ).fetchone() is not None
+
+
+def _ensure_aggregates(conn: sqlite3.Connection) -> None:
+    if _has_aggregates(conn):
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        if not _has_aggregates(conn):  # another process may have won the race
+            for stmt in _AGG_SCHEMA:
+                conn.execute(stmt)
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+@contextmanager
+def _write_tx(db_path: str):
+    """
+    BEGIN IMMEDIATE ... COMMIT, rolled back on any exception.
+    Inside an open `transaction()` this joins the outer transaction instead.
+    """
+    conn = _connect(db_path)
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+# ----------------------------
+# Row <-> tx dict
+# ----------------------------
+
+def _tx_row(tx: dict) -> tuple:
+    extra = {k: v for k, v in tx.items() if k not in _CORE_KEYS}
+    return (
+        str(tx.get("ts") or _now_utc()),
+        str(tx.get("type") or ""),
+        int(tx.get("amount", 0) or 0),
+        str(tx.get("note") or ""),
+        json.dumps(extra, ensure_ascii=False) if extra else None,
+    )
+
+
+def _row_tx(row: tuple) -> dict:
+    ts, t, amount, note, extra = row
+    tx = {"ts": ts, "type": t, "amount": amount, "note": note}
+    if extra:
+        try:
+            tx.update(json.loads(extra))
+        except Exception:
+            pass
+    return tx
+
+
+def _insert_txs(conn: sqlite3.Connection, txs) -> None:
+    """Insert `txs` (any iterable, consumed lazily) in order."""
+    conn.executemany(
+        "INSERT INTO history(ts, type, amount, note, extra) VALUES (?, ?, ?, ?, ?)",
+        (_tx_row(tx) for tx in txs),
+    )
+
+
+def _read_state(conn: sqlite3.Connection) -> tuple:
+    row = conn.execute("SELECT balance, fund, last_saved_utc FROM bank WHERE id = 1").fetchone()
+    return row if row else (25, 0, None)
+
+
+# ----------------------------
+# Dict bookkeeping
+# ----------------------------
+
+def _sync(bank: SqliteBank, conn: sqlite3.Connection) -> None:
+    """Refresh balance/fund from the database and mark the dict as persisted."""
+    balance, fund, saved = _read_state(conn)
+    bank["balance"] = int(balance)
+    bank["sld_network_fund"] = int(fund)
+    meta = bank.setdefault("meta", {})
+    meta["last_saved_utc"] = saved
+    meta["sqlite"] = {
+        "mark": len(bank.get("history", [])),
+        "balance": int(balance),
+        "fund": int(fund),
+    }
+
+
+def _flush_pending(bank: SqliteBank, conn: sqlite3.Connection) -> None:
+    """Write hand-made edits (history past the mark, balance/fund deltas) inside `conn`'s tx."""
+    meta = bank.get("meta") or {}
+    s = meta.get("sqlite") or {}
+    hist = bank.get("history") or []
+    mark = int(s.get("mark", len(hist)))
+
+    new = [
+        tx for tx in hist[mark:]
+        if isinstance(tx, dict) and "type" in tx and "amount" in tx and "ts" in tx
+    ]
+    _insert_txs(conn, new)
+
+    d_balance = int(bank.get("balance", 0)) - int(s.get("balance", bank.get("balance", 0)))
+    d_fund = int(bank.get("sld_network_fund", 0)) - int(s.get("fund", bank.get("sld_network_fund", 0)))
+    if d_balance or d_fund:
+        conn.execute(
+            "UPDATE bank SET balance = balance + ?, fund = fund + ? WHERE id = 1",
+            (d_balance, d_fund),
+        )
+
+
+def _append(bank: SqliteBank, conn: sqlite3.Connection, tx: dict) -> None:
+    _insert_txs(conn, [tx])
+    bank.setdefault("history", []).append(tx)
+
+
+def _tx(t: str, amount: int, note: str, meta: Optional[dict] = None) -> dict:
+    tx = {"ts": _now_utc(), "type": t, "amount": int(amount), "note": str(note)}
+    if meta:
+        tx["meta"] = dict(meta)
+    return tx
+
+
+# ----------------------------
+# Public API (mirrors careon_bank_v2)
+# ----------------------------
+
+def ensure_seeded(db_path: str, seed: Optional[Callable[[], Optional[dict]]] = None) -> None:
+    """
+    Create the bank row if the database has none yet, filled from seed(): a
+    normalized JSON bank whose "history" may be any iterable (careon_bank_v2
+    passes the archive-aware one). seed is only called for a database that
+    has never been initialized, whoever opened it first.
+    """
+    conn = _connect(db_path)
+    if conn.execute("SELECT 1 FROM bank WHERE id = 1").fetchone() is not None:
+        return
+    with _write_tx(db_path) as c:
+        if c.execute("SELECT 1 FROM bank WHERE id = 1").fetchone() is not None:
+            return  # another connection seeded it first
+        data = (seed() if seed else None) or {}
+        c.execute(
+            "INSERT INTO bank(id, balance, fund, last_saved_utc) VALUES (1, ?, ?, ?)",
+            (int(data.get("balance", 25)), int(data.get("sld_network_fund", 0)), None),
+        )
+        _insert_txs(c, (tx for tx in data.get("history", []) if isinstance(tx, dict)))
+
+
+def load_bank(db_path: str) -> SqliteBank:
+    """Load the bank row plus the last HISTORY_WINDOW history rows."""
+    ensure_seeded(db_path)
+    conn = _connect(db_path)
+    rows = conn.execute(
+        "SELECT ts, type, amount, note, extra FROM history ORDER BY id DESC LIMIT ?",
+        (HISTORY_WINDOW,),
+    ).fetchall()
+
+    bank = SqliteBank(db_path, {
+        "balance": 0,
+        "sld_network_fund": 0,
+        "history": [_row_tx(r) for r in reversed(rows)],
+        "meta": {"schema": 1, "last_saved_utc": None, "backend": "sqlite"},
+    })
+    _sync(bank, conn)
+    return bank
+
+
+def _unchanged(bank: SqliteBank) -> bool:
+    """True if the dict holds no hand edits past its last sync."""
+    s = (bank.get("meta") or {}).get("sqlite")
+    if not isinstance(s, dict) or "mark" not in s:
+        return False
+    return (
+        len(bank.get("history") or []) == s["mark"]
+        and int(bank.get("balance", 0)) == s.get("balance")
+        and int(bank.get("sld_network_fund", 0)) == s.get("fund")
+    )
+
+
+def save_bank(bank: SqliteBank, db_path: Optional[str] = None) -> None:
+    db_path = db_path or bank.db_path
+    if db_path == bank.db_path and _unchanged(bank):
+        _persist.skip_write()  # spend/earn/... already committed; nothing to flush
+        return
+    with _write_tx(db_path) as conn:
+        _flush_pending(bank, conn)
+        conn.execute("UPDATE bank SET last_saved_utc = ? WHERE id = 1", (_now_utc(),))
+        _sync(bank, conn)
+
+
+def replace_bank(bank: dict, db_path: str) -> SqliteBank:
+    """Overwrite the database with a plain (e.g. imported) bank dict."""
+    _connect(db_path)
+    with _write_tx(db_path) as conn:
+        conn.execute("DELETE FROM history")
+        conn.execute(
+            "INSERT OR REPLACE INTO bank(id, balance, fund, last_saved_utc) VALUES (1, ?, ?, ?)",
+            (int(bank.get("balance", 25)), int(bank.get("sld_network_fund", 0)), _now_utc()),
+        )
+        _insert_txs(conn, [tx for tx in bank.get("history", []) if isinstance(tx, dict)])
+    return load_bank(db_path)
+
+
+@contextmanager
+def transaction(db_path: str):
+    """One write transaction around several spend/earn/award calls on the yielded bank."""
+    with _write_tx(db_path):
+        bank = load_bank(db_path)
+        yield bank
+        save_bank(bank, db_path)
+
+
+def spend(bank: SqliteBank, cost: int, note: str = "spend") -> bool:
+    """Single-row debit: balance -> fund, only if the stored balance covers it."""
+    cost = int(cost)
+    if cost <= 0:
+        return True
+    with _write_tx(bank.db_path) as conn:
+        _flush_pending(bank, conn)
+        cur = conn.execute(
+            "UPDATE bank SET balance = balance - ?, fund = fund + ? WHERE id = 1 AND balance >= ?",
+            (cost, cost, cost),
+        )
+        ok = cur.rowcount == 1
+        if ok:
+            _append(bank, conn, _tx("spend", cost, note))
+        _sync(bank, conn)
+    return ok
+
+
+def earn(bank: SqliteBank, amount: int, note: str = "earn") -> None:
+    amount = int(amount)
+    if amount <= 0:
+        return
+    with _write_tx(bank.db_path) as conn:
+        _flush_pending(bank, conn)
+        conn.execute("UPDATE bank SET balance = balance + ? WHERE id = 1", (amount,))
+        _append(bank, conn, _tx("earn", amount, note))
+        _sync(bank, conn)
+
+
+def fund(bank: SqliteBank, amount: int, note: str = "fund") -> None:
+    amount = int(amount)
+    if amount <= 0:
+        return
+    with _write_tx(bank.db_path) as conn:
+        _flush_pending(bank, conn)
+        conn.execute("UPDATE bank SET fund = fund + ? WHERE id = 1", (amount,))
+        _append(bank, conn, _tx("fund", amount, note))
+        _sync(bank, conn)
+
+
+def record(bank: SqliteBank, t: str, note: str, amount: int = 0, meta: Optional[dict] = None) -> None:
+    with _write_tx(bank.db_path) as conn:
+        _flush_pending(bank, conn)
+        _append(bank, conn, _tx(t, amount, note, meta))
+        _sync(bank, conn)
+
+
+def award_once_per_round(bank: SqliteBank, note: str, amount: int) -> bool:
+    """Indexed check for an earn with `note` after the last spend, then earn."""
+    amount = int(amount)
+    with _write_tx(bank.db_path) as conn:
+        _flush_pending(bank, conn)
+        last_spend = conn.execute(
+            "SELECT COALESCE(MAX(id), 0) FROM history WHERE type = 'spend'"
+        ).fetchone()[0]
+        seen = conn.execute(
+            "SELECT 1 FROM history WHERE type = 'earn' AND note = ? AND id > ? LIMIT 1",
+            (str(note), last_spend),
+        ).fetchone()
+        if seen is None and amount > 0:
+            conn.execute("UPDATE bank SET balance = balance + ? WHERE id = 1", (amount,))
+            _append(bank, conn, _tx("earn", amount, note))
+        _sync(bank, conn)
+    return seen is None
+
+
+def fund_total(db_path: str) -> int:
+    """Stored network fund, read straight from the bank row."""
+    return int(_read_state(_connect(db_path))[1])
+
+
+def recent_txs(bank: SqliteBank, keep: int = 12, types=None) -> list:
+    """Newest `keep` rows (only `types` if given, via history_type_id), oldest first."""
+    keep = max(0, int(keep))
+    if keep == 0:
+        return []
+    if types is None:
+        rows = _connect(bank.db_path).execute(
+            "SELECT ts, type, amount, note, extra FROM history ORDER BY id DESC LIMIT ?",
+            (keep,),
+        ).fetchall()
+    else:
+        types = [str(t) for t in types]
+        rows = _connect(bank.db_path).execute(
+            "SELECT ts, type, amount, note, extra FROM history WHERE type IN (%s) ORDER BY id DESC LIMIT ?"
+            % ",".join("?" * len(types)),
+            (*types, keep),
+        ).fetchall()
+    return [_row_tx(r) for r in reversed(rows)]
+
+
+def iter_history(bank: SqliteBank, batch: int = 1000):
+    """Lazily yield every history row, oldest first, `batch` rows per query."""
+    conn = _connect(bank.db_path)
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, ts, type, amount, note, extra FROM history WHERE id > ? ORDER BY id LIMIT ?",
+            (last, batch),
+        ).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield _row_tx(row[1:])
+        last = rows[-1][0]
+
+
+def history_columns(bank: SqliteBank, batch: int = 50_000):
+    """Yield (types, amounts) lists for the whole history, oldest first, `batch` rows at a time."""
+    conn = _connect(bank.db_path)
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, type, amount FROM history WHERE id > ? ORDER BY id LIMIT ?",
+            (last, batch),
+        ).fetchall()
+        if not rows:
+            return
+        _, types, amounts = zip(*rows)
+        yield list(types), list(amounts)
+        last = rows[-1][0]
+
+
+def txs_between(bank: SqliteBank, start: Optional[str], end: Optional[str], batch: int = 1000):
+    """Rows with start <= ts < end (None = open), oldest first, via the ts index."""
+    conn = _connect(bank.db_path)
+    bound, args = "", []
+    if end is not None:
+        bound = " AND ts < ?"
+        args.append(end)
+    # Keyset on (ts, id): history_ts carries the rowid, so this walks the
+    # index in order instead of scanning rowids for matches.
+    rows = conn.execute(
+        "SELECT id, ts, type, amount, note, extra FROM history WHERE ts >= ?" + bound
+        + " ORDER BY ts, id LIMIT ?",
+        (start if start is not None else "", *args, batch),
+    ).fetchall()
+    while rows:
+        for row in rows:
+            yield _row_tx(row[1:])
+        last_id, last_ts = rows[-1][0], rows[-1][1]
+        rows = conn.execute(
+            "SELECT id, ts, type, amount, note, extra FROM history WHERE (ts, id) > (?, ?)" + bound
+            + " ORDER BY ts, id LIMIT ?",
+            (last_ts, last_id, *args, batch),
+        ).fetchall()
+
+
+def txs_page(bank: SqliteBank, cursor: Optional[int], limit: int = 50, newest_first: bool = False) -> tuple:
+    """Keyset page; the cursor is a row id (exclusive), None on the last page."""
+    limit = max(1, int(limit))
+    conn = _connect(bank.db_path)
+    if newest_first:
+        rows = conn.execute(
+            "SELECT id, ts, type, amount, note, extra FROM history WHERE id < ? ORDER BY id DESC LIMIT ?",
+            (cursor if cursor is not None else 2 ** 62, limit + 1),
+        ).fetchall()
+    else:
+        rows = conn.execute(
+            "SELECT id, ts, type, amount, note, extra FROM history WHERE id > ? ORDER BY id LIMIT ?",
+            (cursor if cursor is not None else 0, limit + 1),
+        ).fetchall()
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return [_row_tx(r[1:]) for r in rows], (rows[-1][0] if more else None)
+
+
+def aggregates(bank: SqliteBank) -> dict:
+    """Same shape as careon_bank_v2.aggregates, read from the running aggregates table."""
+    conn = _connect(bank.db_path)
+    counts, sums = {}, {}
+    for t, n, total in conn.execute("SELECT type, n, total FROM aggregates WHERE n > 0"):
+        counts[t] = n
+        sums[t] = total
+    first_ts, last_ts = conn.execute(
+        "SELECT (SELECT ts FROM history ORDER BY id LIMIT 1), (SELECT ts FROM history ORDER BY id DESC LIMIT 1)"
+    ).fetchone()
+    return {
+        "schema": 1,
+        "upto": sum(counts.values()),
+        "counts": counts,
+        "sums": sums,
+        "first_ts": first_ts,
+        "last_ts": last_ts,
+        "rounds": counts.get("spend", 0),
+    }
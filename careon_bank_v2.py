@@ -1,8 +1,27 @@
+import atexit
+import bisect
+import collections
+import copy
+import itertools
 import json
 import os
-from datetime import datetime
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
 from typing import Any, Dict, Optional
 
+import careon_bank_sqlite as _sqlite
+import sld_archive as _archive
+import sld_chain as _chain
+import sld_lock as _lock
+import sld_persist as _persist
+import sld_serial as _serial
+import sld_tail as _tail
+import user_profile as _profile
+from sld_lock import StaleWriteError
+from careon_txlog import TxLog
+
 
 # ----------------------------
 # Defaults + normalization
@@ -14,12 +33,50 @@ def _default_bank() -> dict:
         "sld_network_fund": 0,
         "history": [],  # list[dict]
         "meta": {
-            "schema": 1,
+            "schema": SCHEMA,
             "last_saved_utc": None,
+            "validated_len": 0,
+            "version": 0,
         },
     }
 
 
+# Hot history cap. On save, whole blocks of the oldest entries beyond this are
+# moved to gzip archive segments (see sld_archive) instead of being dropped.
+# Set to 0/None to keep everything in the hot file.
+MAX_HISTORY = 5000
+
+# Keep loaded history in a compact array-backed TxLog instead of a list of
+# dicts (see careon_txlog). Files on disk are unchanged.
+COMPACT_HISTORY = os.getenv("SLD_BANK_COMPACT", "").strip().lower() in ("1", "true", "yes", "on")
+
+# schema 2 banks carry meta.validated_len: history[:validated_len] has already
+# passed _valid_tx, so later calls only check entries appended since then.
+SCHEMA = 2
+
+# How each tx type moves money, as (balance, fund) multipliers of its amount.
+# Types not listed (phrase, admin, ...) are informational. careon_bank_replay
+# recomputes balance/fund from the history with these rules.
+REPLAY_EFFECTS = {
+    "earn": (1, 0),
+    "spend": (-1, 1),
+    "fund": (0, 1),
+}
+
+
+def _valid_tx(tx) -> bool:
+    return isinstance(tx, dict) and "type" in tx and "amount" in tx and "ts" in tx
+
+
+def _validated_len(meta: dict, n: int) -> int:
+    if meta.get("schema") != SCHEMA:
+        return 0
+    v = meta.get("validated_len")
+    if isinstance(v, int) and not isinstance(v, bool) and 0 <= v <= n:
+        return v
+    return 0
+
+
 def _normalize(bank: dict) -> dict:
     if not isinstance(bank, dict):
         bank = {}
@@ -40,70 +97,481 @@ def _normalize(bank: dict) -> dict:
     except Exception:
         bank["sld_network_fund"] = 0
 
-    if not isinstance(bank["history"], list):
+    if not isinstance(bank["history"], (list, TxLog)):
         bank["history"] = []
 
     # meta safety
     if not isinstance(bank["meta"], dict):
         bank["meta"] = {}
-    bank["meta"].setdefault("schema", 1)
-    bank["meta"].setdefault("last_saved_utc", None)
-
-    # Ensure all tx items are dict-ish; drop garbage
-    cleaned = []
-    for tx in bank["history"]:
-        if isinstance(tx, dict) and "type" in tx and "amount" in tx and "ts" in tx:
-            cleaned.append(tx)
-    bank["history"] = cleaned
-
-    # optional: keep history from growing forever (safe cap)
-    # if you want unlimited, delete this.
-    MAX_HISTORY = 5000
-    if len(bank["history"]) > MAX_HISTORY:
-        bank["history"] = bank["history"][-MAX_HISTORY:]
+    meta = bank["meta"]
+    meta.setdefault("last_saved_utc", None)
+
+    # Ensure tx items appended since the watermark are dict-ish; drop garbage
+    hist = bank["history"]
+    start = _validated_len(meta, len(hist))
+    if start < len(hist) and isinstance(hist, list):  # TxLog entries are valid by construction
+        tail = hist[start:]
+        cleaned = [tx for tx in tail if _valid_tx(tx)]
+        if len(cleaned) != len(tail):
+            del hist[start:]
+            hist.extend(cleaned)
 
+    for k in ("archived", "version"):
+        try:
+            meta[k] = max(0, int(meta.get(k, 0)))
+        except Exception:
+            meta[k] = 0
+
+    meta["schema"] = SCHEMA
+    meta["validated_len"] = len(hist)
     return bank
 
 
+def _untrusted(data: dict) -> dict:
+    """Data from disk/import: forget stored watermarks/indexes so they are rebuilt."""
+    if isinstance(data.get("meta"), dict):
+        data["meta"].pop("validated_len", None)
+        data["meta"].pop("round", None)
+        data["meta"].pop("fingerprint", None)
+    return data
+
+
 # ----------------------------
-# Atomic file ops (stability)
+# Round index
 # ----------------------------
 
-def _read_json(path: str) -> Optional[dict]:
-    """Return dict if read succeeds, else None."""
+# meta.round tracks the current round (everything after the last spend):
+#   upto      absolute history position covered (archived + hot length)
+#   spend_at  absolute position of the last spend, -1 if none
+#   awarded   {note: 1} for earn notes seen since that spend
+# _log keeps it current; anything else (hand-appended txs, fresh loads) is
+# caught up lazily, so award_once_per_round is O(1) in the round length.
+
+def _round_valid(r, n_abs: int) -> bool:
+    return (
+        isinstance(r, dict)
+        and isinstance(r.get("upto"), int)
+        and isinstance(r.get("spend_at"), int)
+        and isinstance(r.get("awarded"), dict)
+        and 0 <= r["upto"] <= n_abs
+    )
+
+
+def _round_absorb(r: dict, pos: int, tx: dict) -> None:
+    t = tx.get("type")
+    if t == "spend":
+        r["spend_at"] = pos
+        r["awarded"] = {}
+    elif t == "earn":
+        r["awarded"][str(tx.get("note"))] = 1
+    r["upto"] = pos + 1
+
+
+def _round_index(bank: dict) -> dict:
+    """Return meta.round brought up to date with the (normalized) history."""
+    meta = bank["meta"]
+    hist = bank["history"]
+    base = meta["archived"]
+    n_abs = base + len(hist)
+    r = meta.get("round")
+
+    if not _round_valid(r, n_abs) or r["upto"] < base:
+        # rebuild: walk back to the last spend only
+        r = {"upto": n_abs, "spend_at": -1, "awarded": {}}
+        earned = []
+        for i in range(len(hist) - 1, -1, -1):
+            tx = hist[i]
+            if tx.get("type") == "spend":
+                r["spend_at"] = base + i
+                break
+            if tx.get("type") == "earn":
+                earned.append(str(tx.get("note")))
+        r["awarded"] = {note: 1 for note in earned}
+        meta["round"] = r
+        return r
+
+    for i in range(r["upto"] - base, len(hist)):
+        _round_absorb(r, base + i, hist[i])
+    return r
+
+
+# ----------------------------
+# Running aggregates
+# ----------------------------
+
+# meta.aggregates holds totals over the full history (archived + hot):
+#   schema    AGG_SCHEMA; anything else is rebuilt
+#   upto      absolute history position covered
+#   counts    {type: n}     sums {type: amount}
+#   first_ts / last_ts
+#   rounds    number of rounds started (spends)
+# Like meta.round, _log keeps it current and anything else is caught up from
+# the hot tail, so reading totals does not depend on history length. A full
+# rebuild uses the archive index for archived entries.
+
+AGG_SCHEMA = 1
+
+
+def _agg_valid(a, n_abs: int) -> bool:
+    if not isinstance(a, dict) or a.get("schema") != AGG_SCHEMA:
+        return False
+    if not isinstance(a.get("upto"), int) or not 0 <= a["upto"] <= n_abs:
+        return False
+    if not isinstance(a.get("rounds"), int) or a["rounds"] < 0:
+        return False
+    for k in ("counts", "sums"):
+        d = a.get(k)
+        if not isinstance(d, dict) or not all(isinstance(v, int) for v in d.values()):
+            return False
+    return True
+
+
+def _agg_absorb(a: dict, tx: dict) -> None:
+    t = str(tx.get("type", ""))
+    a["counts"][t] = a["counts"].get(t, 0) + 1
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
+        a["sums"][t] = a["sums"].get(t, 0) + int(tx.get("amount", 0) or 0)
     except Exception:
-        return None
+        pass
+    if t == "spend":
+        a["rounds"] += 1
+    ts = tx.get("ts")
+    if a["first_ts"] is None:
+        a["first_ts"] = ts
+    a["last_ts"] = ts
+    a["upto"] += 1
+
+
+def _agg_rebuild(bank: dict, path: Optional[str]) -> dict:
+    a = {"schema": AGG_SCHEMA, "upto": 0, "counts": {}, "sums": {}, "first_ts": None, "last_ts": None, "rounds": 0}
+    if path and bank["meta"]["archived"]:
+        for seg in _archive.read_index(path):
+            for k in ("counts", "sums"):
+                for t, v in (seg.get(k) or {}).items():
+                    try:
+                        a[k][t] = a[k].get(t, 0) + int(v)
+                    except Exception:
+                        pass
+            if a["first_ts"] is None:
+                a["first_ts"] = seg.get("first_ts")
+            a["last_ts"] = seg.get("last_ts") or a["last_ts"]
+        a["rounds"] = a["counts"].get("spend", 0)
+    a["upto"] = bank["meta"]["archived"]  # the hot part is absorbed by the caller
+    return a
+
 
+def _aggregates(bank: dict, path: Optional[str] = None) -> dict:
+    """Return meta.aggregates brought up to date with the (normalized) history."""
+    meta = bank["meta"]
+    hist = bank["history"]
+    base = meta["archived"]
+    a = meta.get("aggregates")
 
-def _atomic_save_json(data: dict, path: str) -> None:
+    if not _agg_valid(a, base + len(hist)) or a["upto"] < base:
+        a = _agg_rebuild(bank, path)
+        meta["aggregates"] = a
+
+    for i in range(a["upto"] - base, len(hist)):
+        _agg_absorb(a, hist[i])
+    return a
+
+
+def aggregates(bank: dict, path: Optional[str] = None) -> dict:
     """
-    Atomic write with backup:
-    - writes to .tmp
-    - rotates existing file to .bak
-    - replaces final path atomically
+    Totals over the whole history: counts/sums per tx type, first/last ts,
+    rounds. `path` is only needed if they must be rebuilt for an archived bank.
     """
-    folder = os.path.dirname(path) or "."
-    os.makedirs(folder, exist_ok=True)
+    if isinstance(bank, _sqlite.SqliteBank):
+        return _sqlite.aggregates(bank)
+    bank = _normalize(bank)
+    return copy.deepcopy(_aggregates(bank, path))
+
+
+# ----------------------------
+# File ops (see sld_persist)
+# ----------------------------
+
+def _read_json(path: str) -> Optional[dict]:
+    """Return dict if read succeeds, else None."""
+    return _persist.read_json(path)
 
-    tmp = path + ".tmp"
-    bak = path + ".bak"
 
-    # write tmp
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
+def _json_default(obj):
+    if isinstance(obj, TxLog):
+        return obj.to_list()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
 
-    # rotate current -> bak (best effort)
-    if os.path.exists(path):
+
+# ----------------------------
+# Journal mode (append-only saves)
+# ----------------------------
+
+# When enabled, save_bank appends one JSONL record per save to `path.journal`
+# (fsynced) instead of rewriting the whole file. Every JOURNAL_SNAPSHOT_EVERY
+# records the full bank is snapshotted to `path` and the journal is compacted.
+# load_bank always replays a journal tail if one exists, so switching the mode
+# off never loses writes.
+JOURNAL_MODE = os.getenv("SLD_BANK_JOURNAL", "").strip().lower() in ("1", "true", "yes", "on")
+JOURNAL_SNAPSHOT_EVERY = 500
+
+
+def _journal_path(path: str) -> str:
+    return path + ".journal"
+
+
+def _journal_state(bank: dict) -> dict:
+    """
+    meta.journal bookkeeping:
+      seq      last journal record covered by this bank
+      mark     history entries already persisted (snapshot or journal)
+      pending  journal records written since the last snapshot
+      balance/fund  values as of the last persisted record
+    """
+    j = bank["meta"].get("journal")
+    if not isinstance(j, dict):
+        j = {}
+    for k in ("seq", "mark", "pending"):
         try:
-            os.replace(path, bak)
+            j[k] = max(0, int(j.get(k, 0)))
+        except Exception:
+            j[k] = 0
+    j.setdefault("balance", bank["balance"])
+    j.setdefault("fund", bank["sld_network_fund"])
+    bank["meta"]["journal"] = j
+    return j
+
+
+def _replay_journal(bank: dict, path: str) -> dict:
+    """Apply journal records newer than the snapshot's seq, then re-mark."""
+    jpath = _journal_path(path)
+    j = _journal_state(bank)
+
+    if os.path.exists(jpath):
+        try:
+            with open(jpath, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        rec = _serial.loads(line)
+                    except Exception:
+                        break  # torn tail write; everything after it is unusable
+                    if not isinstance(rec, dict):
+                        break
+                    seq = int(rec.get("seq", 0))
+                    if seq <= j["seq"]:
+                        continue
+                    txs = rec.get("txs") or []
+                    if isinstance(txs, list):
+                        bank["history"].extend(txs)
+                    if "balance" in rec:
+                        bank["balance"] = rec["balance"]
+                    if "fund" in rec:
+                        bank["sld_network_fund"] = rec["fund"]
+                    if "version" in rec:
+                        bank["meta"]["version"] = rec["version"]
+                    j["seq"] = seq
+                    j["pending"] += 1
         except Exception:
             pass
 
-    # promote tmp -> final
-    os.replace(tmp, path)
+    bank = _normalize(bank)
+    j["mark"] = len(bank["history"])
+    j["balance"] = bank["balance"]
+    j["fund"] = bank["sld_network_fund"]
+    return bank
+
+
+def _archive_overflow(bank: dict, path: str) -> None:
+    """Roll the oldest hot entries past MAX_HISTORY into archive segments."""
+    moved = _archive.archive_overflow(bank["history"], path, MAX_HISTORY, amount_key="amount")
+    if moved:
+        meta = bank["meta"]
+        meta["archived"] = int(meta.get("archived", 0)) + moved
+        meta["validated_len"] = max(0, int(meta.get("validated_len", 0)) - moved)
+
+
+def _snapshot_bank(bank: dict, path: str) -> _persist.Ticket:
+    """
+    Queue a full rewrite of `path`; the journal is dropped once the snapshot
+    covering it is on disk. Returns the write ticket (see sld_persist).
+    """
+    _aggregates(bank, path)  # persist them current, before entries move to the archive
+    _archive_overflow(bank, path)
+    j = _journal_state(bank)
+    if j["fund"] != bank["sld_network_fund"]:
+        _mark_contribution(path)  # shards: fold the new contribution (see _fold_fund)
+    j["pending"] = 0
+    j["mark"] = len(bank["history"])
+    j["balance"] = bank["balance"]
+    j["fund"] = bank["sld_network_fund"]
+
+    jpath = _journal_path(path)
+    covered = j["seq"]
+
+    def drop_journal():
+        # records appended after this snapshot was queued must survive it
+        with _persist.hold(jpath):
+            try:
+                with open(jpath, "rb") as f:
+                    lines = f.readlines()
+            except FileNotFoundError:
+                return
+            keep = []
+            for line in lines:
+                try:
+                    if int(_serial.loads(line).get("seq", 0)) > covered:
+                        keep.append(line)
+                except Exception:
+                    pass
+            try:
+                if keep:
+                    _persist.replace_bytes(jpath, b"".join(keep))
+                else:
+                    os.remove(jpath)
+            except Exception:
+                pass
+
+    payload = _persist.dumps(_persist.unstamped(bank), default=_json_default)
+    return _persist.submit(path, payload, "replace", on_durable=drop_journal, schema=SCHEMA)
+
+
+def _journal_save(bank: dict, path: str) -> Optional[_persist.Ticket]:
+    """
+    Queue history entries past the persisted mark (plus resulting balance/fund)
+    as a single fsynced JSONL record. Cost depends on the new entries only.
+    Expects a normalized bank; returns None when there was nothing to write.
+    """
+    j = _journal_state(bank)
+    new = bank["history"][j["mark"]:]
+    stamp = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+    if not os.path.exists(path) or j["pending"] + 1 >= JOURNAL_SNAPSHOT_EVERY:
+        bank["meta"]["last_saved_utc"] = stamp
+        return _snapshot_bank(bank, path)
+
+    if not new and j["balance"] == bank["balance"] and j["fund"] == bank["sld_network_fund"]:
+        return None  # nothing to persist
+
+    rec = {
+        "seq": j["seq"] + 1,
+        "ts": stamp,
+        "txs": new,
+        "balance": bank["balance"],
+        "fund": bank["sld_network_fund"],
+        "version": bank["meta"]["version"],
+    }
+    if j["fund"] != bank["sld_network_fund"]:
+        _mark_contribution(path)
+    line = _serial.dumps(rec) + b"\n"
+    ticket = _persist.submit(_journal_path(path), line, "append")
+
+    j["seq"] = rec["seq"]
+    j["pending"] += 1
+    j["mark"] = len(bank["history"])
+    j["balance"] = bank["balance"]
+    j["fund"] = bank["sld_network_fund"]
+    bank["meta"]["last_saved_utc"] = stamp
+    return ticket
+
+
+def compact_journal(path: str) -> dict:
+    """Fold the journal into a fresh snapshot now (e.g. from an admin action)."""
+    with _lock.file_lock(path):
+        b = load_bank(path)
+        b["meta"]["last_saved_utc"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        pin = _hand_off(path, b, _snapshot_bank(b, path))
+    _finish(path, pin)
+    return b
+
+
+# ----------------------------
+# Load cache (process-wide)
+# ----------------------------
+
+# path -> (file signature, normalized bank). A signature is the
+# (mtime_ns, size, inode) of the bank file, its .bak and its journal, so any
+# write by this or another process forces a re-parse.
+_CACHE_LOCK = threading.Lock()
+_CACHE: Dict[str, tuple] = {}
+_CACHE_STATS = {"hits": 0, "misses": 0}
+
+
+def _file_sig(path: str) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+
+def _bank_sig(path: str) -> tuple:
+    return (_file_sig(path), _file_sig(path + ".bak"), _file_sig(_journal_path(path)))
+
+
+def _cow_copy(bank: dict) -> dict:
+    """
+    Cheap private copy: new top-level dict, history list and meta.
+    Tx dicts are shared with the cache, so treat existing entries as read-only
+    (append new ones; never edit old ones in place).
+    """
+    out = dict(bank)
+    hist = bank.get("history", [])
+    out["history"] = hist.copy() if isinstance(hist, TxLog) else list(hist)
+    out["meta"] = copy.deepcopy(bank.get("meta", {}))
+    return out
+
+
+def _invalidate_cache(path: str) -> None:
+    with _CACHE_LOCK:
+        _CACHE.pop(path, None)
+
+
+def clear_cache() -> None:
+    with _CACHE_LOCK:
+        _CACHE.clear()
+        _CACHE_STATS["hits"] = 0
+        _CACHE_STATS["misses"] = 0
+
+
+def cache_stats() -> dict:
+    """Hit/miss counters for load_bank (a miss is one disk parse)."""
+    with _CACHE_LOCK:
+        return {**_CACHE_STATS, "entries": len(_CACHE)}
+
+
+# ----------------------------
+# Backend selection
+# ----------------------------
+
+# "json" (default) or "sqlite". With sqlite, a .json bank path maps to a
+# sibling .db file, seeded from the JSON bank on first use. Paths ending in
+# .db/.sqlite/.sqlite3 always use SQLite.
+#
+# Seeding happens in _sqlite_path, which every entry point goes through
+# (load, save, transaction, tail/fund reads), so whichever of them touches the
+# database first fills it from the JSON bank. It keys off the bank row, not
+# the file: _connect creates the file (and schema) on any first access.
+BACKEND = os.getenv("SLD_BANK_BACKEND", "json").strip().lower()
+_SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+_SEEDED: set = set()
+
+
+def _sqlite_path(path: str) -> Optional[str]:
+    if path.lower().endswith(_SQLITE_SUFFIXES):
+        return path
+    if BACKEND != "sqlite":
+        return None
+    db = os.path.splitext(path)[0] + ".db"
+    if db not in _SEEDED:
+        _sqlite.ensure_seeded(db, lambda: _sqlite_seed(path))
+        _SEEDED.add(db)
+    return db
+
+
+def _sqlite_seed(path: str) -> dict:
+    seed = _load_json_bank(path)
+    # archived segments first, then the hot entries, streamed into the database
+    seed["history"] = iter_history(seed, path)
+    return seed
 
 
 # ----------------------------
@@ -117,32 +585,432 @@ def load_bank(path: str) -> dict:
       1) path
       2) path.bak
       3) default
+    Any journal tail newer than the loaded snapshot is replayed on top.
     """
-    if os.path.exists(path):
-        data = _read_json(path)
-        if isinstance(data, dict):
-            return _normalize(data)
+    db = _sqlite_path(path)
+    if db:
+        return _sqlite.load_bank(db)
 
-    bak = path + ".bak"
-    if os.path.exists(bak):
-        data = _read_json(bak)
-        if isinstance(data, dict):
-            return _normalize(data)
+    return _load_json_bank(path)
 
-    return _default_bank()
 
+def _peek_json_bank(path: str) -> dict:
+    """Current bank for `path` (shared object: do not mutate)."""
+    sig = _bank_sig(path)
+    with _CACHE_LOCK:
+        dirty = _DIRTY.get(path)
+        if dirty is not None:
+            _CACHE_STATS["hits"] += 1
+            return dirty[1]
+        pin = _PINS.get(path)
+        if pin is not None:
+            _CACHE_STATS["hits"] += 1
+            return pin[1]
+        hit = _CACHE.get(path)
+        if hit is not None and hit[0] == sig:
+            _CACHE_STATS["hits"] += 1
+            return hit[1]
+        _CACHE_STATS["misses"] += 1
+
+    bank = _read_json_bank(path)
+    with _CACHE_LOCK:
+        _CACHE[path] = (sig, bank)
+    return bank
+
+
+# path -> (ticket, bank): newest state handed to sld_persist. While any write
+# for the path is still in flight (_INFLIGHT) the disk may hold a mix of
+# generations, so the pin stays authoritative for this process until the
+# last of them lands.
+_PINS: Dict[str, tuple] = {}
+_INFLIGHT: Dict[str, int] = {}
+
+
+def _hand_off(path: str, bank: dict, ticket) -> Optional[tuple]:
+    """
+    Called with the file lock held after queueing a write: pin the new state
+    and keep the cross-process lock until the write is durable (_finish).
+    """
+    if ticket is None:
+        return None
+    with _CACHE_LOCK:
+        pin = (ticket, _cow_copy(bank))
+        _PINS[path] = pin
+        _INFLIGHT[path] = _INFLIGHT.get(path, 0) + 1
+    _lock.retain(path)
+    return pin
+
+
+def _finish(path: str, pin: Optional[tuple]) -> None:
+    """Wait for the pinned write outside the thread lock, then settle the pin."""
+    if pin is None:
+        return
+    ok = False
+    try:
+        _persist.complete(pin[0])
+        ok = True
+    finally:
+        with _CACHE_LOCK:
+            _INFLIGHT[path] -= 1
+            if not ok:
+                # unknown mix on disk: drop what we believed and re-read next time
+                _PINS.pop(path, None)
+                _CACHE.pop(path, None)
+            elif not _INFLIGHT[path] and path in _PINS:
+                # everything queued is on disk (and the flock still held, so
+                # nobody else has written): the pin becomes a plain cache entry
+                _CACHE[path] = (_bank_sig(path), _PINS.pop(path)[1])
+        _lock.release(path)
+
+
+def _fingerprint(bank: dict) -> str:
+    """
+    Dirty-check digest: history length, balance, fund and the newest entry.
+    History is append-only (see _cow_copy), so these change with every
+    mutation the bank API makes.
+    """
+    hist = bank["history"]
+    return _persist.fingerprint(
+        bank["meta"]["archived"] + len(hist), bank["balance"], bank["sld_network_fund"],
+        hist[-1] if len(hist) else None,
+    )
+
+
+def _load_json_bank(path: str) -> dict:
+    return _cow_copy(_peek_json_bank(path))
+
+
+def _read_json_bank(path: str) -> dict:
+    # newest generation whose checksum matches (file, .bak, .bak.2, ...);
+    # a verified snapshot keeps its watermark and indexes, so nothing is re-walked
+    data, trusted, gen = _persist.read_generation(path, schema=SCHEMA)
+    if isinstance(data, dict):
+        bank = _normalize(data if trusted else _untrusted(data))
+    else:
+        bank = _default_bank()
+        if _shard_of(path):
+            bank["balance"] = 0  # shards start empty (see "Per-user shards")
+    bank["meta"].pop("fingerprint", None)
+
+    bank = _replay_journal(bank, path)
+
+    # a crash between archiving and rewriting the hot file leaves the block in both
+    meta = bank["meta"]
+    archived = _archive.reconcile(bank["history"], meta["archived"], path)
+    if archived != meta["archived"]:
+        meta["archived"] = archived
+        meta["validated_len"] = len(bank["history"])
+        meta["journal"]["mark"] = len(bank["history"])
+
+    _aggregates(bank, path)
+    # journal records were chained when saved: link them on (or mark the chain broken)
+    _chain.catch_up(meta, bank["history"], meta["archived"], sealed=True)
+
+    if COMPACT_HISTORY:
+        bank["history"] = TxLog(bank["history"])
+    if gen == path:
+        # only a readable main file counts as persisted; a missing file or a
+        # recovery from .bak must be written out by the next save
+        meta["fingerprint"] = _fingerprint(bank)
+    return bank
+
+
+def save_bank(bank: dict, path: str, overwrite: bool = False) -> None:
+    """
+    Save under the bank file lock. Raises StaleWriteError if the bank on disk
+    has moved past the version this copy was loaded at; overwrite=True
+    (restoring an import or backup) replaces it instead, as its next version.
+    """
+    db = _sqlite_path(path)
+    if db:
+        with _shard_sqlite_lock(db):
+            synced = ((bank.get("meta") or {}).get("sqlite") or {}).get("fund")
+            if int(bank.get("sld_network_fund", 0)) != synced:
+                _mark_contribution(db)
+            if isinstance(bank, _sqlite.SqliteBank) and bank.db_path == db:
+                _sqlite.save_bank(bank, db)
+            else:
+                _sqlite.replace_bank(_normalize(bank), db)
+        return
 
-def save_bank(bank: dict, path: str) -> None:
     bank = _normalize(bank)
-    bank["meta"]["last_saved_utc"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
-    _atomic_save_json(bank, path)
+    meta = bank["meta"]
+    _chain.catch_up(meta, bank["history"], meta["archived"])  # entries appended by hand
+    fp = _fingerprint(bank)
+    if not overwrite and _persist.unchanged(meta, fp):
+        return  # same state as loaded/last saved: no write, no .bak rotation
+    if overwrite and WRITE_BEHIND:
+        flush()  # queued saves must not land on top of the restored bank
+
+    pin = None
+    try:
+        # version check and write under one lock: nobody may commit in between
+        with _lock.file_lock(path):
+            # optimistic concurrency: refuse to overwrite a newer generation
+            disk_meta = _peek_json_bank(path)["meta"]
+            on_disk = disk_meta.get("version", 0)
+            if overwrite:
+                _adopt_disk_state(bank, disk_meta, path)
+                fp = _fingerprint(bank)
+            elif on_disk != meta["version"]:
+                raise StaleWriteError(
+                    f"bank at {path} is at version {on_disk}, this copy was loaded at {meta['version']}"
+                )
+
+            meta["version"] += 1
+            meta["fingerprint"] = fp
+            if WRITE_BEHIND and not overwrite:
+                meta["last_saved_utc"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+                _wb_mark_dirty(path, bank)
+            else:
+                if TAIL_MODE:
+                    _sync_tail(bank, path, rebuild=overwrite)
+                if JOURNAL_MODE and not overwrite:
+                    ticket = _journal_save(bank, path)
+                else:
+                    meta["last_saved_utc"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+                    ticket = _snapshot_bank(bank, path)
+                if ticket is None:
+                    meta["version"] -= 1
+                pin = _hand_off(path, bank, ticket)
+
+        if WRITE_BEHIND and not overwrite:
+            _wb_enqueue(path)
+            return
+        # other sessions may queue behind us here and share the next write
+        _finish(path, pin)
+    except Exception:
+        meta.pop("fingerprint", None)  # not on disk: the next save must write
+        raise
+
+
+def _adopt_disk_state(bank: dict, disk_meta: dict, path: str) -> None:
+    """
+    save_bank(overwrite=True): continue from the generation on disk, so the
+    restored bank is written as its next version (always as a snapshot) and
+    no journal record or archived entry on disk is applied on top of it again.
+    """
+    meta = bank["meta"]
+    meta["version"] = int(disk_meta.get("version", 0))
+    _journal_state(bank)["seq"] = int((disk_meta.get("journal") or {}).get("seq", 0))
+    archived = _archive.reconcile(bank["history"], meta["archived"], path)
+    if archived != meta["archived"]:
+        meta["archived"] = archived
+        meta["validated_len"] = len(bank["history"])
+
+
+# ----------------------------
+# Write-behind (SLD_BANK_WRITE_BEHIND=1)
+# ----------------------------
+#
+# save_bank only records the new state as this process's authoritative copy
+# (_DIRTY, served by load_bank) and queues the path; one background thread
+# writes the newest state per path, coalescing saves that pile up meanwhile.
+# Writes use the normal journal/snapshot code under the file lock and bump
+# meta.version, so a copy loaded before a write cannot be saved over it
+# (StaleWriteError, which update_bank retries). Meant for
+# a single app process owning its banks: other processes see the state only
+# once it is written, and if one of them wrote the bank meanwhile the
+# unwritten state is dropped rather than written over theirs (counted as a
+# conflict). flush() is the barrier (also run at exit); write_behind_stats()
+# reports queue depth, conflicts and durability lag.
+
+WRITE_BEHIND = os.getenv("SLD_BANK_WRITE_BEHIND", "").strip().lower() in ("1", "true", "yes", "on")
+WRITE_BEHIND_DEPTH = 64  # queued banks before save_bank waits (backpressure)
+
+# path -> (generation, bank) not yet handed to the disk
+_DIRTY: Dict[str, tuple] = {}
+_WB_SINCE: Dict[str, float] = {}  # path -> time of its oldest unwritten save
+_WB_BASE: Dict[str, int] = {}  # path -> meta.version on disk the unwritten saves build on
+_WB_GEN = [0]
+_WB_COND = threading.Condition(_CACHE_LOCK)
+_WB_PENDING: collections.deque = collections.deque()  # paths, each at most once
+_WB_QUEUED: set = set()
+_WB_STATS = {"saves": 0, "writes": 0, "errors": 0, "conflicts": 0,
+             "last_lag_ms": 0.0, "max_lag_ms": 0.0, "last_error": None}
+_WB_THREAD = [None]
+
+
+def _wb_mark_dirty(path: str, bank: dict) -> None:
+    with _CACHE_LOCK:
+        _WB_GEN[0] += 1
+        _DIRTY[path] = (_WB_GEN[0], _cow_copy(bank))
+        _WB_BASE.setdefault(path, bank["meta"]["version"] - 1)  # save_bank already bumped it
+        _WB_SINCE.setdefault(path, time.monotonic())
+        _WB_STATS["saves"] += 1
+
+
+def _wb_enqueue(path: str) -> None:
+    with _WB_COND:
+        if path not in _WB_QUEUED:
+            _WB_QUEUED.add(path)
+            _WB_PENDING.append(path)
+            _WB_COND.notify_all()
+        if _WB_THREAD[0] is None or not _WB_THREAD[0].is_alive():
+            t = threading.Thread(target=_wb_loop, name="bank-write-behind", daemon=True)
+            _WB_THREAD[0] = t
+            t.start()
+        # backpressure, except inside transaction(): the writer may need our lock
+        if not _lock.held(path):
+            while len(_WB_PENDING) > WRITE_BEHIND_DEPTH:
+                _WB_COND.wait()
+
+
+def _wb_write(path: str) -> None:
+    # the whole write, durability included, runs under the lock: no save can
+    # slip in while the persisted bookkeeping (journal marks, archive
+    # watermark) is moving, and a failed write leaves _DIRTY as it was
+    with _lock.file_lock(path):
+        with _CACHE_LOCK:
+            entry = _DIRTY.get(path)
+        if entry is None:
+            return
+        gen, state = entry
+        on_disk = _disk_version(path)
+        if on_disk != _WB_BASE.get(path, on_disk):
+            with _WB_COND:
+                _DIRTY.pop(path, None)
+                _WB_SINCE.pop(path, None)
+                _WB_BASE.pop(path, None)
+                _WB_STATS["conflicts"] += 1
+                _WB_COND.notify_all()
+            raise StaleWriteError(f"bank at {path} was written by another process (version {on_disk})")
+        b = _cow_copy(state)
+        # a write is a new generation: copies loaded before it carry the old
+        # bookkeeping and must fail the version check instead of saving over it
+        b["meta"]["version"] += 1
+        if TAIL_MODE:
+            _sync_tail(b, path)
+        ticket = _journal_save(b, path) if JOURNAL_MODE else _snapshot_bank(b, path)
+        if ticket is None:
+            b["meta"]["version"] -= 1
+        _finish(path, _hand_off(path, b, ticket))
+        with _CACHE_LOCK:
+            _DIRTY[path] = (gen, _cow_copy(b))
+            if ticket is not None:
+                _WB_BASE[path] = b["meta"]["version"]
+
+    with _WB_COND:
+        _WB_STATS["writes"] += 1
+        if _DIRTY.get(path, (None,))[0] == gen:
+            _DIRTY.pop(path, None)
+            _WB_BASE.pop(path, None)
+            lag = (time.monotonic() - _WB_SINCE.pop(path, time.monotonic())) * 1000
+            _WB_STATS["last_lag_ms"] = lag
+            _WB_STATS["max_lag_ms"] = max(_WB_STATS["max_lag_ms"], lag)
+        _WB_COND.notify_all()
+
+
+def _disk_version(path: str) -> int:
+    """meta.version of what is on disk now (cache entry if the files are unchanged)."""
+    sig = _bank_sig(path)
+    with _CACHE_LOCK:
+        hit = _CACHE.get(path)
+    if hit is None or hit[0] != sig:
+        hit = (sig, _read_json_bank(path))
+        with _CACHE_LOCK:
+            _CACHE[path] = hit
+    return hit[1]["meta"].get("version", 0)
+
+
+def _wb_loop() -> None:
+    while True:
+        with _WB_COND:
+            while not _WB_PENDING:
+                _WB_COND.wait()
+            path = _WB_PENDING.popleft()
+            _WB_QUEUED.discard(path)
+            _WB_COND.notify_all()
+        try:
+            _wb_write(path)
+        except Exception as e:
+            with _CACHE_LOCK:
+                _WB_STATS["errors"] += 1
+                _WB_STATS["last_error"] = repr(e)
+            time.sleep(0.5)
+        with _WB_COND:
+            if path in _DIRTY and path not in _WB_QUEUED:
+                # saved again while we were writing (or the write failed)
+                _WB_QUEUED.add(path)
+                _WB_PENDING.append(path)
+
+
+def flush(timeout: Optional[float] = None) -> bool:
+    """Block until every write-behind save is on disk. False on timeout."""
+    deadline = None if timeout is None else time.monotonic() + timeout
+    with _WB_COND:
+        while _DIRTY:
+            left = None if deadline is None else deadline - time.monotonic()
+            if left is not None and left <= 0:
+                return False
+            _WB_COND.wait(left)
+    return True
+
+
+def write_behind_stats() -> dict:
+    """Saves vs physical writes, queue depth and durability lag (ms)."""
+    with _CACHE_LOCK:
+        out = dict(_WB_STATS)
+        out["dirty"] = len(_DIRTY)
+        out["queued"] = len(_WB_PENDING)
+        oldest = min(_WB_SINCE.values()) if _WB_SINCE else None
+    out["lag_ms"] = 0.0 if oldest is None else (time.monotonic() - oldest) * 1000
+    return out
+
+
+atexit.register(flush, 10.0)
+
+
+def update_bank(path: str, fn, retries: int = 5):
+    """
+    Optimistic read-modify-write: load, fn(bank), save; if another writer got
+    there first (StaleWriteError), reload and re-apply fn. Returns fn's result.
+    After `retries` lost races the last attempt runs under the file lock, so a
+    busy bank slows a writer down but never fails it.
+    """
+    for _ in range(max(0, int(retries) - 1)):
+        b = load_bank(path)
+        result = fn(b)
+        try:
+            save_bank(b, path)
+            return result
+        except StaleWriteError:
+            pass
+    with _lock.file_lock(path):
+        b = load_bank(path)
+        result = fn(b)
+        save_bank(b, path)
+        return result
+
+
+@contextmanager
+def transaction(path: str):
+    """
+    Unit of work for bank mutations:
+
+        with bank.transaction(BANK_PATH) as b:
+            bank.spend(b, 5, note="rapid charge")
+            bank.award_once_per_round(b, note="rapid-success-20", amount=20)
+
+    Loads once and saves once on a clean exit. If the block raises, nothing is
+    written (SQLite banks roll the database transaction back).
+    """
+    db = _sqlite_path(path)
+    if db:
+        with _shard_sqlite_lock(db), _sqlite.transaction(db) as b:
+            yield b
+        return
+
+    # holding the lock from load to save means no other writer can interleave
+    with _lock.file_lock(path):
+        b = load_bank(path)
+        yield b
+        save_bank(b, path)
 
 
 def ensure_bank_exists(path: str) -> dict:
     """Create a valid bank file if missing or corrupted."""
-    b = load_bank(path)
-    save_bank(b, path)
-    return b
+    return update_bank(path, lambda b: b)
 
 
 def summarize(bank: dict) -> str:
@@ -150,20 +1018,46 @@ def summarize(bank: dict) -> str:
     return f"Balance: {bank.get('balance', 0)} Ȼ • 🌐 Fund: {bank.get('sld_network_fund', 0)} Ȼ"
 
 
-def _log(bank: dict, t: str, amount: int, note: str) -> None:
+def _log(bank: dict, t: str, amount: int, note: str, meta: Optional[dict] = None) -> None:
     bank.setdefault("history", [])
-    bank["history"].append({
+    tx = {
         "ts": datetime.utcnow().isoformat(timespec="seconds") + "Z",
         "type": t,
         "amount": int(amount),
         "note": str(note),
-    })
+    }
+    if meta:
+        tx["meta"] = dict(meta)
+
+    # keep the hash chain, round index and aggregates current when they were
+    # current before this append
+    meta = bank.get("meta")
+    if isinstance(meta, dict) and isinstance(meta.get("archived"), int):
+        pos = meta["archived"] + len(bank["history"])
+        c = _chain.current(meta, pos)
+        if c is not None:
+            _chain.seal(c, tx)
+    bank["history"].append(tx)
+
+    r = meta.get("round") if isinstance(meta, dict) else None
+    if isinstance(r, dict) and isinstance(meta.get("archived"), int):
+        pos = meta["archived"] + len(bank["history"]) - 1
+        if r.get("upto") == pos and isinstance(r.get("awarded"), dict):
+            _round_absorb(r, pos, tx)
+        a = meta.get("aggregates")
+        if _agg_valid(a, pos) and a["upto"] == pos:
+            _agg_absorb(a, tx)
 
 
 def spend(bank: dict, cost: int, note: str = "spend") -> bool:
     """
     Spend decreases user balance and increases network fund.
     """
+    if isinstance(bank, _sqlite.SqliteBank):
+        with _shard_sqlite_lock(bank.db_path):
+            _mark_contribution(bank.db_path)
+            return _sqlite.spend(bank, cost, note)
+
     bank = _normalize(bank)
     cost = int(cost)
     if cost <= 0:
@@ -181,6 +1075,10 @@ def earn(bank: dict, amount: int, note: str = "earn") -> None:
     """
     Earn increases user balance.
     """
+    if isinstance(bank, _sqlite.SqliteBank):
+        _sqlite.earn(bank, amount, note)
+        return
+
     bank = _normalize(bank)
     amount = int(amount)
     if amount <= 0:
@@ -190,29 +1088,515 @@ def earn(bank: dict, amount: int, note: str = "earn") -> None:
     _log(bank, "earn", amount, note)
 
 
+def fund(bank: dict, amount: int, note: str = "fund") -> None:
+    """
+    Fund increases the network fund only (e.g. the network cut of a deposit).
+    """
+    if isinstance(bank, _sqlite.SqliteBank):
+        with _shard_sqlite_lock(bank.db_path):
+            _mark_contribution(bank.db_path)
+            _sqlite.fund(bank, amount, note)
+        return
+
+    bank = _normalize(bank)
+    amount = int(amount)
+    if amount <= 0:
+        return
+
+    bank["sld_network_fund"] += amount
+    _log(bank, "fund", amount, note)
+
+
+def record(bank: dict, t: str, note: str, amount: int = 0, meta: Optional[dict] = None) -> None:
+    """
+    Log a history entry that moves no money (phrases, admin markers).
+    Types that do (earn/spend/fund) must go through their own functions.
+    """
+    if t in REPLAY_EFFECTS:
+        raise ValueError(f"use {t}() for {t!r} entries")
+    if isinstance(bank, _sqlite.SqliteBank):
+        _sqlite.record(bank, t, note, amount, meta)
+        return
+
+    bank = _normalize(bank)
+    _log(bank, t, amount, note, meta)
+
+
 def award_once_per_round(bank: dict, note: str, amount: int) -> bool:
     """
     Award once since the last 'spend' tx.
     If an earn tx with same note already exists after the last spend, do nothing.
     """
+    if isinstance(bank, _sqlite.SqliteBank):
+        return _sqlite.award_once_per_round(bank, note, amount)
+
     bank = _normalize(bank)
 
-    for tx in reversed(bank.get("history", [])):
-        if tx.get("type") == "spend":
-            break
-        if tx.get("type") == "earn" and tx.get("note") == note:
-            return False
+    if str(note) in _round_index(bank)["awarded"]:
+        return False
 
     earn(bank, amount, note)
     return True
 
 
 def recent_txs(bank: dict, keep: int = 12) -> list:
+    if isinstance(bank, _sqlite.SqliteBank):
+        return _sqlite.recent_txs(bank, keep)
+
     bank = _normalize(bank)
     keep = max(0, int(keep))
     return bank.get("history", [])[-keep:]
 
 
+def iter_history(bank: dict, path: str):
+    """
+    Lazily yield the full history, oldest first: archived segments of `path`
+    followed by the bank's hot entries.
+    """
+    if isinstance(bank, _sqlite.SqliteBank):
+        return _sqlite.iter_history(bank)
+    bank = _normalize(bank)
+    return _archive.iter_all(path, bank["history"])
+
+
+def verify_history(bank: dict, path: str, full: bool = False, workers: Optional[int] = None) -> Optional[dict]:
+    """
+    Check the history's hash chain (see sld_chain). By default only entries
+    since the newest verified checkpoint are re-hashed; full=True audits
+    everything, archive segments in parallel. None for SQLite banks.
+    """
+    if isinstance(bank, _sqlite.SqliteBank):
+        return None
+    bank = _normalize(bank)
+    meta = bank["meta"]
+    if full:
+        return _chain.audit(meta, bank["history"], meta["archived"], path, workers)
+    return _chain.verify(meta, bank["history"], meta["archived"], path)
+
+
+# ----------------------------
+# History queries
+# ----------------------------
+#
+# History is appended in time order, so "ts" is non-decreasing along it and
+# both the hot list and the archive index (first_ts/last_ts per segment) can
+# be binary-searched. Positions/cursors are absolute: archived entries come
+# first, then the hot list (position = meta.archived + hot index).
+
+def _ts_str(ts) -> Optional[str]:
+    # Datetimes become the stored "YYYY-MM-DDTHH:MM:SSZ" form (naive = UTC).
+    # Entries are stamped to the second, so a fractional bound rounds up:
+    # ts >= 12:00:00.5 and ts < 12:00:00.5 both mean "from 12:00:01".
+    if ts is None or isinstance(ts, str):
+        return ts
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    if ts.microsecond:
+        ts = ts.replace(microsecond=0) + timedelta(seconds=1)
+    return ts.strftime("%Y-%m-%dT%H:%M:%S") + "Z"
+
+
+def _hot_ts(hist):
+    if isinstance(hist, TxLog):
+        return hist.ts_at
+    return lambda i: str(hist[i].get("ts", ""))
+
+
+def history_len(bank: dict) -> int:
+    """Total entries including archived ones."""
+    bank = _normalize(bank)
+    return bank["meta"]["archived"] + len(bank["history"])
+
+
+def txs_between(bank: dict, path: str, start=None, end=None):
+    """
+    Lazily yield entries with start <= ts < end (ISO strings or datetimes;
+    None = open), oldest first. Archive segments outside the range are
+    skipped by their index and the hot list is bisected, so only matching
+    entries are decoded.
+    """
+    if isinstance(bank, _sqlite.SqliteBank):
+        return _sqlite.txs_between(bank, _ts_str(start), _ts_str(end))
+    bank = _normalize(bank)
+    return _txs_between(bank, path, _ts_str(start), _ts_str(end))
+
+
+def _txs_between(bank: dict, path: str, start: Optional[str], end: Optional[str]):
+    if bank["meta"]["archived"]:
+        for seg in _archive.read_index(path):
+            first, last = seg.get("first_ts"), seg.get("last_ts")
+            if start is not None and last is not None and last < start:
+                continue
+            if end is not None and first is not None and first >= end:
+                break
+            for tx in _archive.iter_segment(path, seg):
+                ts = str(tx.get("ts", ""))
+                if (start is None or ts >= start) and (end is None or ts < end):
+                    yield tx
+
+    hist = bank["history"]
+    key = _hot_ts(hist)
+    n = len(hist)
+    lo = 0 if start is None else bisect.bisect_left(range(n), start, key=key)
+    hi = n if end is None else bisect.bisect_left(range(n), end, lo=lo, key=key)
+    for i in range(lo, hi):
+        yield hist[i]
+
+
+def _txs_at(bank: dict, path: str, a: int, b: int) -> list:
+    """Entries at absolute positions [a, b)."""
+    base = bank["meta"]["archived"]
+    out = []
+    if a < base:
+        for seg in _archive.read_index(path):
+            s0, cnt = int(seg.get("start", 0)), int(seg.get("count", 0))
+            if s0 + cnt <= a:
+                continue
+            if s0 >= min(b, base):
+                break
+            lo, hi = max(0, a - s0), min(cnt, b - s0)
+            out.extend(itertools.islice(_archive.iter_segment(path, seg), lo, hi))
+    hist = bank["history"]
+    out.extend(hist[max(0, a - base): max(0, b - base)])
+    return out
+
+
+def txs_page(bank: dict, path: str, cursor: Optional[int] = None, limit: int = 50,
+             newest_first: bool = False) -> tuple:
+    """
+    One page of history: returns (txs, next_cursor); next_cursor is None on
+    the last page. Oldest-first pages start at `cursor` (default 0);
+    newest-first pages end just before `cursor` (default: the newest entry).
+    Only the page itself is read (one archive segment at most per page boundary).
+    """
+    if isinstance(bank, _sqlite.SqliteBank):
+        return _sqlite.txs_page(bank, cursor, limit, newest_first)
+    bank = _normalize(bank)
+    limit = max(1, int(limit))
+    total = bank["meta"]["archived"] + len(bank["history"])
+
+    if newest_first:
+        b = total if cursor is None else max(0, min(int(cursor), total))
+        a = max(0, b - limit)
+        page = _txs_at(bank, path, a, b)
+        page.reverse()
+        return page, (a if a > 0 else None)
+
+    a = 0 if cursor is None else max(0, min(int(cursor), total))
+    b = min(total, a + limit)
+    return _txs_at(bank, path, a, b), (b if b < total else None)
+
+
+# ----------------------------
+# Tail reads (SLD_BANK_TAIL=1)
+# ----------------------------
+#
+# save_bank mirrors new history entries into an mmap-friendly tail file
+# (see sld_tail), so the ticker and Recent Activity can read the last few
+# entries without parsing the bank. Without the tail, or if it is missing or
+# mid-rebuild, the same functions fall back to the bank.
+
+TAIL_MODE = os.getenv("SLD_BANK_TAIL", "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def _sync_tail(bank: dict, path: str, rebuild: bool = False) -> None:
+    """Called under the bank lock, before the version bump. rebuild: history was replaced."""
+    on_disk = _peek_json_bank(path)
+    persisted = 0 if rebuild else on_disk["meta"]["archived"] + len(on_disk["history"])
+    try:
+        _tail.sync(path, bank["history"], bank["meta"]["archived"], persisted, MAX_HISTORY,
+                   older=lambda kind: _archive.iter_newest(path, (kind,)))
+    except Exception:
+        pass  # derived data: the next save repairs it
+
+
+def tail_txs(path: str, keep: int = 12, types=None) -> list:
+    """Last `keep` entries of the bank at `path` (only `types` if given), oldest first."""
+    keep = max(0, int(keep))
+    if TAIL_MODE and not _sqlite_path(path):
+        got = _tail.read_last(path, keep, types)
+        if got is not None:
+            return got
+
+    b = load_bank(path)
+    if isinstance(b, _sqlite.SqliteBank):
+        # the loaded window only holds the newest rows: ask the table instead
+        return _sqlite.recent_txs(b, keep, types)
+    if types is None:
+        page, _ = txs_page(b, path, None, keep, newest_first=True) if keep else ([], None)
+        page.reverse()
+        return page
+    types = set(types)
+    out = []
+    for tx in reversed(b.get("history", [])):
+        if len(out) >= keep:
+            break
+        if isinstance(tx, dict) and tx.get("type") in types:
+            out.append(tx)
+    need = keep - len(out)
+    if need > 0 and b["meta"].get("archived"):
+        # newest segments first, stopping once enough matches are found
+        out.extend(itertools.islice(_archive.iter_newest(path, types), need))
+    out.reverse()
+    return out
+
+
+def tail_phrases(path: str, keep: int = 12) -> list:
+    """Last `keep` phrase entries, oldest first."""
+    return tail_txs(path, keep, types=("phrase",))
+
+
+# ----------------------------
+# Per-user shards (SLD_BANK_SHARDED=1)
+# ----------------------------
+#
+# Each account gets its own bank file next to the shared one, keyed by
+# user_profile ids:
+#
+#   careon_bank_v2.users/<user_id>.json   balance, history, and in
+#                                         sld_network_fund that user's
+#                                         lifetime contribution
+#   careon_bank_v2.fund.pending/<user_id> marker: contribution changed
+#   careon_bank_v2.fund.json              {"total", "contrib": {user_id: n}}
+#   careon_bank_v2.shared.json            the shared bank as of the switch
+#
+# Sessions of different users lock and write different files, and only the
+# shard holds its contribution, so a shard save is atomic on its own. A save
+# that moves the contribution (spend/fund; earns do not) first drops a marker
+# under the shard lock. network_fund() folds marked shards into the fund
+# record under the fund lock, reading each one under its shard lock before
+# removing its marker, so a change is either folded or still marked.
+# Many saves share one fund write, and readers that find no markers take no
+# lock at all. The fund record is derived data, written without backups: if it
+# is missing or damaged it is rebuilt from the shards (also on demand with
+# rebuild_network_fund).
+#
+# Shards start empty (anyone can type a new username, so a starting grant
+# could be farmed). Switching sharding on records the shared bank's fund and
+# balance once in the .shared.json store (backed up like a bank). The fund
+# stays part of the total; an admin hands the balance to one account with
+# claim_shared_balance. The claim is recorded before the credit and the
+# credit is looked up in the shard's history, so retrying a claim
+# interrupted by a crash never pays twice.
+
+SHARDED = os.getenv("SLD_BANK_SHARDED", "").strip().lower() in ("1", "true", "yes", "on")
+_SHARD_DIR_SUFFIX = ".users"
+_SHARED_NOTE = "opening balance (shared bank)"
+
+
+def user_bank_path(path: str, user_id: str) -> str:
+    """Shard path for `user_id` under the shared bank `path`."""
+    root, ext = os.path.splitext(path)
+    return os.path.join(root + _SHARD_DIR_SUFFIX, _profile._sanitize_user_id(user_id) + (ext or ".json"))
+
+
+def fund_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".fund.json"
+
+
+def _pending_dir(path: str) -> str:
+    return os.path.splitext(path)[0] + ".fund.pending"
+
+
+def _shared_state_path(path: str) -> str:
+    return os.path.splitext(path)[0] + ".shared.json"
+
+
+def _shard_of(path: str) -> Optional[tuple]:
+    """(shared bank root without extension, user_id) if `path` is a shard, else None."""
+    folder = os.path.dirname(path)
+    if not folder.endswith(_SHARD_DIR_SUFFIX):
+        return None
+    return folder[: -len(_SHARD_DIR_SUFFIX)], os.path.splitext(os.path.basename(path))[0]
+
+
+def _mark_contribution(path: str) -> None:
+    """Called under the shard lock before a write that moves its contribution."""
+    shard = _shard_of(path)
+    if shard is None:
+        return
+    root, uid = shard
+    folder = root + ".fund.pending"
+    os.makedirs(folder, exist_ok=True)
+    with open(os.path.join(folder, uid), "ab"):
+        pass
+    _persist.sync_dir(folder)
+
+
+@contextmanager
+def _shard_sqlite_lock(db: str):
+    """SQLite shards: marker and commit under the shard lock, as for JSON saves."""
+    if _shard_of(db) is None:
+        yield
+        return
+    with _lock.file_lock(db):
+        yield
+
+
+def _shard_contribution(path: str) -> int:
+    db = _sqlite_path(path)
+    if db:
+        return _sqlite.fund_total(db)
+    return int(_peek_json_bank(path)["sld_network_fund"])
+
+
+def _take_contribution(path: str, uid: str) -> int:
+    """Read one shard's contribution and clear its marker, under the shard lock."""
+    shard = user_bank_path(path, uid)
+    with _lock.file_lock(_sqlite_path(shard) or shard):
+        n = _shard_contribution(shard)
+        try:
+            os.remove(os.path.join(_pending_dir(path), uid))
+        except FileNotFoundError:
+            pass
+    return n
+
+
+def _read_fund(fpath: str) -> Optional[dict]:
+    """The fund record, or None if it is missing or unreadable (rebuild it)."""
+    rec = _read_json(fpath)
+    if not isinstance(rec, dict) or not isinstance(rec.get("contrib"), dict):
+        return None
+    contrib = {}
+    for uid, n in rec["contrib"].items():
+        try:
+            contrib[str(uid)] = int(n)
+        except Exception:
+            return None
+    contrib.pop("*shared", None)  # records written before .shared.json existed
+    try:
+        shared = int(rec.get("shared", 0))
+    except Exception:
+        return None
+    return {"total": shared + sum(contrib.values()), "shared": shared, "contrib": contrib}
+
+
+def _write_fund(fpath: str, rec: dict) -> None:
+    rec["total"] = rec["shared"] + sum(rec["contrib"].values())
+    _persist.replace_bytes(fpath, _persist.dumps(rec))
+
+
+def _pending(path: str) -> list:
+    try:
+        return os.listdir(_pending_dir(path))
+    except FileNotFoundError:
+        return []
+
+
+def _fold_fund(path: str) -> dict:
+    """Fund record for the shared bank `path` with every marked shard folded in."""
+    fpath = fund_path(path)
+    rec = _read_fund(fpath)
+    if rec is not None and not _pending(path):
+        return rec
+    with _lock.file_lock(fpath):
+        rec = _read_fund(fpath)
+        if rec is None:
+            return _rebuild_fund(path)
+        uids = _pending(path)
+        for uid in uids:
+            rec["contrib"][uid] = _take_contribution(path, uid)
+        if uids:
+            _write_fund(fpath, rec)
+        return rec
+
+
+def _rebuild_fund(path: str) -> dict:
+    """Under the fund lock: re-read every shard."""
+    folder = os.path.splitext(path)[0] + _SHARD_DIR_SUFFIX
+    ext = os.path.splitext(path)[1] or ".json"
+    try:
+        names = os.listdir(folder)
+    except FileNotFoundError:
+        names = []
+    uids = {os.path.splitext(n)[0] for n in names if n.endswith((ext,) + _SQLITE_SUFFIXES)}
+    uids.update(_pending(path))
+    rec = {"shared": int(_migrate_shared(path)["fund"]), "contrib": {}}
+    for uid in sorted(uids):
+        rec["contrib"][uid] = _take_contribution(path, uid)
+    _write_fund(fund_path(path), rec)
+    return rec
+
+
+def network_fund(path: str) -> int:
+    """Shared network fund for the bank at `path` (sum of shard contributions when sharded)."""
+    if SHARDED:
+        return int(_fold_fund(path)["total"])
+    return int(load_bank(path).get("sld_network_fund", 0))
+
+
+def rebuild_network_fund(path: str) -> dict:
+    """Re-read every shard under `path` (repair after manual edits)."""
+    with _lock.file_lock(fund_path(path)):
+        return _rebuild_fund(path)
+
+
+def _migrate_shared(path: str) -> dict:
+    """The shared bank as of the switch to shards (recorded on the first call)."""
+    spath = _shared_state_path(path)
+    state = _persist.read_verified(spath)[0]
+    if isinstance(state, dict):
+        return state
+    with _lock.file_lock(spath):
+        state = _persist.read_verified(spath)[0]
+        if isinstance(state, dict):
+            return state
+        legacy = (_read_json(fund_path(path)) or {}).get("meta") or {}
+        if isinstance(legacy.get("shared"), dict):
+            state = legacy["shared"]  # migrated by an earlier version
+        else:
+            shared = load_bank(path)
+            state = {
+                "fund": int(shared.get("sld_network_fund", 0)),
+                "balance": int(shared.get("balance", 0)),
+                "claimed_by": None,
+                "migrated_utc": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            }
+        _persist.atomic_save_json(state, spath)
+        return state
+
+
+def shared_bank_state(path: str) -> dict:
+    """{"fund", "balance", "claimed_by", "migrated_utc"} of the shared bank at the switch."""
+    return dict(_migrate_shared(path))
+
+
+def claim_shared_balance(path: str, user_id: str) -> int:
+    """
+    Admin action: credit the shared bank's balance (as of the migration) to
+    `user_id`'s shard, once for the whole bank. Returns the amount credited
+    now: 0 if another account has claimed it or this one already got it.
+    """
+    uid = _profile._sanitize_user_id(user_id)
+    spath = _shared_state_path(path)
+    state = _migrate_shared(path)
+    if state.get("claimed_by") not in (None, uid):
+        return 0
+    with _lock.file_lock(spath):
+        state = _migrate_shared(path)
+        if state.get("claimed_by") not in (None, uid):
+            return 0
+        if state.get("claimed_by") is None:
+            state["claimed_by"] = uid
+            state["claimed_utc"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+            # twice, so .bak records the claim too: recovering from a damaged
+            # file must not make the balance claimable again
+            _persist.atomic_save_json(state, spath)
+            _persist.atomic_save_json(state, spath)
+    amount = max(0, int(state.get("balance", 0)))
+
+    shard = user_bank_path(path, uid)
+    with transaction(shard) as b:
+        for tx in iter_history(b, shard):
+            if tx.get("note") == _SHARED_NOTE:
+                return 0
+        if amount:
+            earn(b, amount, _SHARED_NOTE)
+        else:
+            record(b, "admin", _SHARED_NOTE)  # marks the claim as done
+    return amount
+
+
 # ----------------------------
 # Optional: export/import helpers
 # (for persistence across Streamlit restarts)
@@ -221,15 +1605,18 @@ def recent_txs(bank: dict, keep: int = 12) -> list:
 def export_bank_json(bank: dict) -> str:
     """Return JSON string suitable for download/backup."""
     bank = _normalize(bank)
-    return json.dumps(bank, indent=2, ensure_ascii=False)
+    return _serial.dumps_str(_persist.unstamped(bank), pretty=True, default=_json_default)
 
 
 def import_bank_json(json_text: str) -> dict:
-    """Parse JSON text, normalize, return bank dict (does not save)."""
+    """
+    Parse JSON text, normalize, return bank dict (does not save). To restore
+    it over an existing bank: save_bank(b, path, overwrite=True).
+    """
     try:
         data = json.loads(json_text)
         if isinstance(data, dict):
-            return _normalize(data)
+            return _normalize(_untrusted(data))
     except Exception:
         pass
     return _default_bank()
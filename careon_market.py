@@ -1,9 +1,10 @@
 import streamlit as st
 
-def render_market(bank_module, bank_path):
+def render_market(bank_module, bank_path, redeem=None):
     """
     Premium Careon marketplace with glassmorphic design.
     Shows balance, packages, and deposit codes in an elegant layout.
+    `redeem(code) -> (ok, message, amount)` handles the deposit code box.
     """
     
     if not st.session_state.get("show_market", False):
@@ -228,7 +229,15 @@ def render_market(bank_module, bank_path):
         redeem_btn = st.button("Redeem", key="market_redeem_btn", use_container_width=True)
     
     if redeem_btn and code_input:
-        st.info(f"Redeem functionality: {code_input}")
+        if redeem is None:
+            st.info(f"Redeem functionality: {code_input}")
+        else:
+            ok, msg, amt = redeem(code_input)
+            if ok:
+                st.success(f"{msg} +{amt} Ȼ deposited (95/5 split).")
+                st.rerun()
+            else:
+                st.error(msg)
     
     # Footer info
     st.markdown(
@@ -0,0 +1,288 @@
+import calendar
+import time
+from array import array
+from typing import Iterable, Iterator, List, Optional
+
+
+# ----------------------------
+# Compact bank history
+# ----------------------------
+#
+# TxLog stores bank history as parallel arrays instead of a list of dicts:
+#   ts      epoch seconds (int64)
+#   type    interned type code (uint16) -> self._types
+#   amount  int64
+#   note    note-table code (uint32)   -> self._notes
+#   h       chain hash (16 raw bytes, all zero if absent; see sld_chain)
+# Anything that does not fit that shape (phrase "meta", non-canonical
+# timestamps, non-int amounts, ...) is kept verbatim in a per-index `extra`
+# dict, so dict -> TxLog -> dict is lossless.
+#
+# Indexing returns plain dicts (fresh copies), so fmt_tx / recent_txs and the
+# ticker code keep working. Edits to a returned dict are not written back.
+
+_TS_FMT = "%Y-%m-%dT%H:%M:%SZ"
+_NO_NOTE = 0xFFFFFFFF
+_CORE = ("ts", "type", "amount", "note")
+_I64_MIN, _I64_MAX = -(2 ** 63), 2 ** 63 - 1
+_HASH_LEN = 16
+_NO_HASH = bytes(_HASH_LEN)
+
+
+def _hash_bytes(h) -> Optional[bytes]:
+    """Raw bytes of a lowercase hex chain hash, None if `h` is not one (kept verbatim)."""
+    if not isinstance(h, str) or len(h) != 2 * _HASH_LEN:
+        return None
+    try:
+        raw = bytes.fromhex(h)
+    except ValueError:
+        return None
+    return raw if raw.hex() == h and raw != _NO_HASH else None
+
+
+def _parse_ts(ts) -> Optional[int]:
+    """Epoch seconds for canonical 'YYYY-MM-DDTHH:MM:SSZ' strings, else None."""
+    if not isinstance(ts, str) or len(ts) != 20:
+        return None
+    try:
+        epoch = calendar.timegm(time.strptime(ts, _TS_FMT))
+    except Exception:
+        return None
+    # only accept strings that format back identically (lossless)
+    return epoch if time.strftime(_TS_FMT, time.gmtime(epoch)) == ts else None
+
+
+class TxLog:
+    """List-like, array-backed bank history."""
+
+    __slots__ = ("_ts", "_type", "_amount", "_note", "_hash", "_types", "_type_ix", "_notes", "_note_ix", "_extra")
+
+    def __init__(self, txs: Iterable[dict] = ()):
+        self._ts = array("q")
+        self._type = array("H")
+        self._amount = array("q")
+        self._note = array("I")
+        self._hash = bytearray()
+        self._types: List[str] = []
+        self._type_ix = {}
+        self._notes: List[str] = []
+        self._note_ix = {}
+        self._extra = {}  # index -> dict of fields stored verbatim
+        self.extend(txs)
+
+    # ---- construction / conversion ----
+
+    @classmethod
+    def from_list(cls, txs: Iterable[dict]) -> "TxLog":
+        return cls(txs)
+
+    def to_list(self) -> list:
+        return [self._decode(i) for i in range(len(self._ts))]
+
+    def copy(self) -> "TxLog":
+        out = TxLog()
+        out._ts = array("q", self._ts)
+        out._type = array("H", self._type)
+        out._amount = array("q", self._amount)
+        out._note = array("I", self._note)
+        out._hash = bytearray(self._hash)
+        out._types = list(self._types)
+        out._type_ix = dict(self._type_ix)
+        out._notes = list(self._notes)
+        out._note_ix = dict(self._note_ix)
+        out._extra = {i: dict(e) for i, e in self._extra.items()}
+        return out
+
+    # ---- encoding ----
+
+    def _intern_type(self, t: str) -> int:
+        code = self._type_ix.get(t)
+        if code is None:
+            code = len(self._types)
+            if code >= 0xFFFF:
+                raise OverflowError("too many distinct tx types")
+            self._types.append(t)
+            self._type_ix[t] = code
+        return code
+
+    def _intern_note(self, note: str) -> int:
+        code = self._note_ix.get(note)
+        if code is None:
+            code = len(self._notes)
+            self._notes.append(note)
+            self._note_ix[note] = code
+        return code
+
+    def append(self, tx: dict) -> None:
+        if not (isinstance(tx, dict) and "type" in tx and "amount" in tx and "ts" in tx):
+            raise ValueError("not a bank transaction")
+
+        extra = {}
+        for k, v in tx.items():
+            if k not in _CORE:
+                extra[k] = v
+
+        epoch = _parse_ts(tx["ts"])
+        if epoch is None:
+            epoch = 0
+            extra["ts"] = tx["ts"]
+
+        t = tx["type"]
+        if isinstance(t, str):
+            type_code = self._intern_type(t)
+        else:
+            type_code = self._intern_type("")
+            extra["type"] = t
+
+        amount = tx["amount"]
+        if not (type(amount) is int and _I64_MIN <= amount <= _I64_MAX):
+            extra["amount"] = amount
+            amount = 0
+
+        if "note" not in tx:
+            note_code = _NO_NOTE
+        elif isinstance(tx["note"], str):
+            note_code = self._intern_note(tx["note"])
+        else:
+            note_code = _NO_NOTE
+            extra["note"] = tx["note"]
+
+        h = extra.pop("h", None)
+        raw = _hash_bytes(h)
+        if raw is None:
+            raw = _NO_HASH
+            if h is not None:
+                extra["h"] = h
+
+        i = len(self._ts)
+        self._hash += raw
+        self._ts.append(epoch)
+        self._type.append(type_code)
+        self._amount.append(amount)
+        self._note.append(note_code)
+        if extra:
+            self._extra[i] = extra
+
+    def extend(self, txs: Iterable[dict]) -> None:
+        for tx in txs:
+            self.append(tx)
+
+    # ---- decoding ----
+
+    def _decode(self, i: int) -> dict:
+        d = {
+            "ts": time.strftime(_TS_FMT, time.gmtime(self._ts[i])),
+            "type": self._types[self._type[i]],
+            "amount": self._amount[i],
+        }
+        note_code = self._note[i]
+        if note_code != _NO_NOTE:
+            d["note"] = self._notes[note_code]
+        raw = self._hash[i * _HASH_LEN:(i + 1) * _HASH_LEN]
+        if raw != _NO_HASH:
+            d["h"] = raw.hex()
+        extra = self._extra.get(i)
+        if extra:
+            d.update(extra)
+        return d
+
+    def ts_at(self, i: int):
+        """Timestamp of entry i without building a dict."""
+        extra = self._extra.get(i)
+        if extra and "ts" in extra:
+            return extra["ts"]
+        return time.strftime(_TS_FMT, time.gmtime(self._ts[i]))
+
+    def set_hash(self, i: int, h: str) -> None:
+        """Store the chain hash of entry i (see sld_chain)."""
+        raw = _hash_bytes(h)
+        if raw is None:
+            self._extra.setdefault(i, {})["h"] = h
+            return
+        self._hash[i * _HASH_LEN:(i + 1) * _HASH_LEN] = raw
+        extra = self._extra.get(i)
+        if extra:
+            extra.pop("h", None)
+
+    def type_at(self, i: int) -> str:
+        """Type of entry i without building a dict."""
+        extra = self._extra.get(i)
+        if extra and "type" in extra:
+            return extra["type"]
+        return self._types[self._type[i]]
+
+    # ---- sequence protocol ----
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def __bool__(self) -> bool:
+        return len(self._ts) > 0
+
+    def __getitem__(self, key):
+        n = len(self._ts)
+        if isinstance(key, slice):
+            return [self._decode(i) for i in range(*key.indices(n))]
+        i = key + n if key < 0 else key
+        if not 0 <= i < n:
+            raise IndexError("TxLog index out of range")
+        return self._decode(i)
+
+    def __iter__(self) -> Iterator[dict]:
+        for i in range(len(self._ts)):
+            yield self._decode(i)
+
+    def __reversed__(self) -> Iterator[dict]:
+        for i in range(len(self._ts) - 1, -1, -1):
+            yield self._decode(i)
+
+    def __delitem__(self, key) -> None:
+        n = len(self._ts)
+        if isinstance(key, slice):
+            start, stop, step = key.indices(n)
+            if step == 1 and start == 0:
+                self._drop_head(max(0, stop))
+                return
+            dropped = range(start, stop, step)  # O(1) membership, built once
+            keep = [i for i in range(n) if i not in dropped]
+        else:
+            i = key + n if key < 0 else key
+            if not 0 <= i < n:
+                raise IndexError("TxLog index out of range")
+            keep = [j for j in range(n) if j != i]
+        rebuilt = TxLog(self._decode(j) for j in keep)
+        for slot in TxLog.__slots__:
+            setattr(self, slot, getattr(rebuilt, slot))
+
+    def _drop_head(self, k: int) -> None:
+        """Remove the oldest k entries (the MAX_HISTORY / archive path)."""
+        if k <= 0:
+            return
+        del self._ts[:k]
+        del self._type[:k]
+        del self._amount[:k]
+        del self._note[:k]
+        del self._hash[:k * _HASH_LEN]
+        if self._extra:
+            self._extra = {i - k: e for i, e in self._extra.items() if i >= k}
+
+    def clear(self) -> None:
+        self._drop_head(len(self._ts))
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, TxLog):
+            other = other.to_list()
+        if isinstance(other, list):
+            return self.to_list() == other
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"TxLog({len(self)} txs, {len(self._types)} types, {len(self._notes)} notes)"
+
+    # ---- sizing ----
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by the columns and string tables."""
+        cols = sum(a.itemsize * len(a) for a in (self._ts, self._type, self._amount, self._note)) + len(self._hash)
+        strings = sum(len(s) + 49 for s in self._types) + sum(len(s) + 49 for s in self._notes)
+        return cols + strings
@@ -1,15 +1,31 @@
+import csv
 import json
 import os
 import secrets
 import string
+import threading
+from contextlib import contextmanager
 from datetime import datetime
 from typing import Optional, Dict, Any
 
+import codes_ledger_sqlite as _sqlite
+import sld_archive as _archive
+import sld_bloom as _bloom
+import sld_chain as _chain
+import sld_lock as _lock
+import sld_persist as _persist
+import sld_serial as _serial
+from sld_lock import StaleWriteError
+
 
 # ----------------------------
 # Defaults + normalization
 # ----------------------------
 
+# Hot history cap. On save, whole blocks of the oldest events beyond this are
+# moved to gzip archive segments (see sld_archive) instead of being dropped.
+MAX_HISTORY = 5000
+
 def _default_ledger() -> dict:
     return {
         "codes": {},  # code -> {value:int, created_utc:str, created_by:str, redeemed_utc:str|None, redeemed_by:str|None, note:str}
@@ -21,7 +37,19 @@ def _default_ledger() -> dict:
     }
 
 
-def _normalize(ledger: dict) -> dict:
+# Validation is split so lookups stay O(1):
+#   _shape      top-level structure + meta counters, O(1); every operation
+#   _entry      one code entry, checked (and repaired in place) when it is
+#               looked up; already-clean entries cost a few type checks
+#   _normalize  _shape + every code entry + history; only where the whole
+#               ledger is touched anyway (untrusted load, save, import/export)
+# Entries written by mint_code/mint_codes are clean by construction, and a
+# checksum-verified load was normalized when it was saved.
+
+_CODE_STR_FIELDS = ("created_utc", "created_by", "note")
+
+
+def _shape(ledger: dict) -> dict:
     if not isinstance(ledger, dict):
         ledger = {}
 
@@ -36,78 +64,216 @@ def _normalize(ledger: dict) -> dict:
     if not isinstance(ledger["meta"], dict):
         ledger["meta"] = {}
 
-    ledger["meta"].setdefault("schema", 1)
-    ledger["meta"].setdefault("last_saved_utc", None)
-
-    # Normalize codes entries
-    cleaned_codes = {}
-    for code, info in ledger["codes"].items():
-        if not isinstance(code, str) or not code.strip():
-            continue
-        if not isinstance(info, dict):
-            continue
+    meta = ledger["meta"]
+    meta.setdefault("schema", 1)
+    meta.setdefault("last_saved_utc", None)
 
-        value = info.get("value", 0)
+    for k in ("archived", "version"):
         try:
-            value = int(value)
+            meta[k] = max(0, int(meta.get(k, 0)))
         except Exception:
-            value = 0
+            meta[k] = 0
 
-        cleaned_codes[code.strip()] = {
-            "value": value,
-            "created_utc": str(info.get("created_utc") or ""),
-            "created_by": str(info.get("created_by") or ""),
-            "redeemed_utc": info.get("redeemed_utc", None),
-            "redeemed_by": info.get("redeemed_by", None),
-            "note": str(info.get("note") or ""),
-        }
+    return ledger
 
-    ledger["codes"] = cleaned_codes
 
-    # Clean history
-    cleaned_hist = []
-    for evt in ledger["history"]:
-        if isinstance(evt, dict) and "ts" in evt and "type" in evt:
-            cleaned_hist.append(evt)
-    ledger["history"] = cleaned_hist
+def _clean_info(info) -> Optional[dict]:
+    """`info` if it is already a clean code entry, a cleaned copy, or None if unusable."""
+    if not isinstance(info, dict):
+        return None
+    if (
+        len(info) == 6
+        and type(info.get("value")) is int
+        and all(type(info.get(k)) is str for k in _CODE_STR_FIELDS)
+        and "redeemed_utc" in info
+        and "redeemed_by" in info
+    ):
+        return info
+
+    value = info.get("value", 0)
+    try:
+        value = int(value)
+    except Exception:
+        value = 0
+
+    return {
+        "value": value,
+        "created_utc": str(info.get("created_utc") or ""),
+        "created_by": str(info.get("created_by") or ""),
+        "redeemed_utc": info.get("redeemed_utc", None),
+        "redeemed_by": info.get("redeemed_by", None),
+        "note": str(info.get("note") or ""),
+    }
+
+
+def _entry(ledger: dict, code_key: str) -> Optional[dict]:
+    """The validated entry for `code_key` (repaired in place on first access), or None."""
+    codes = ledger["codes"]
+    info = codes.get(code_key)
+    if info is None:
+        return None
+    clean = _clean_info(info)
+    if clean is None:
+        del codes[code_key]
+    elif clean is not info:
+        codes[code_key] = clean
+    return clean
+
+
+def _valid_event(evt) -> bool:
+    return isinstance(evt, dict) and "ts" in evt and "type" in evt
 
-    # cap history to prevent bloat
-    MAX_HISTORY = 5000
-    if len(ledger["history"]) > MAX_HISTORY:
-        ledger["history"] = ledger["history"][-MAX_HISTORY:]
+
+def _normalize(ledger: dict) -> dict:
+    ledger = _shape(ledger)
+
+    # Normalize codes entries; the dict is only rebuilt if a key needs fixing
+    codes = ledger["codes"]
+    rebuild = False
+    for code, info in codes.items():
+        clean = _clean_info(info)
+        if clean is None or not isinstance(code, str) or code != code.strip() or not code:
+            rebuild = True
+            break
+        if clean is not info:
+            codes[code] = clean  # same key: safe while iterating
+    if rebuild:
+        cleaned_codes = {}
+        for code, info in codes.items():
+            if not isinstance(code, str) or not code.strip():
+                continue
+            clean = _clean_info(info)
+            if clean is not None:
+                cleaned_codes[code.strip()] = clean
+        ledger["codes"] = cleaned_codes
+
+    # Clean history
+    hist = ledger["history"]
+    if not all(_valid_event(evt) for evt in hist):
+        ledger["history"] = [evt for evt in hist if _valid_event(evt)]
 
     return ledger
 
 
 # ----------------------------
-# Atomic file ops
+# Atomic file ops (see sld_persist)
 # ----------------------------
 
 def _read_json(path: str) -> Optional[dict]:
+    return _persist.read_json(path)
+
+
+def _atomic_save_json(data: dict, path: str) -> None:
+    _persist.atomic_save_json(data, path)
+
+
+# path -> (file signature, meta.version): the version of the ledger on disk as
+# last loaded or written by this process. The signature is (mtime_ns, size,
+# inode) of the ledger and its .bak, so save_ledger's version check is a
+# stat() unless another process has written since. Saves also leave the pair
+# in <ledger>.ver, so a fresh process (e.g. the redeem Bloom pre-check) can
+# learn the version without parsing the ledger. Any other write changes the
+# signature and the hint is ignored.
+_VERSION_LOCK = threading.Lock()
+_VERSIONS: Dict[str, tuple] = {}
+
+
+def _file_sig(path: str) -> Optional[tuple]:
     try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
+        st = os.stat(path)
+    except OSError:
         return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
 
 
-def _atomic_save_json(data: dict, path: str) -> None:
-    folder = os.path.dirname(path) or "."
-    os.makedirs(folder, exist_ok=True)
+def _ledger_sig(path: str) -> tuple:
+    return (_file_sig(path), _file_sig(path + ".bak"))
+
 
-    tmp = path + ".tmp"
-    bak = path + ".bak"
+def _remember_version(path: str, sig: tuple, version: int) -> None:
+    with _VERSION_LOCK:
+        _VERSIONS[path] = (sig, version)
+
+
+def _version_path(path: str) -> str:
+    return path + ".ver"
+
+
+def _write_version_hint(path: str, sig: tuple, version: int) -> None:
+    """Call under the ledger lock, after the save. Derived: no fsync, errors ignored."""
+    try:
+        _persist.replace_bytes(_version_path(path), _serial.dumps({"sig": sig, "version": version}), "none")
+    except Exception:
+        pass
 
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
 
-    if os.path.exists(path):
+def _version_hint(path: str, sig: tuple) -> Optional[int]:
+    try:
+        with open(_version_path(path), "rb") as f:
+            hint = _serial.loads(f.read())
+        if hint["sig"] == _serial.loads(_serial.dumps(sig)):  # tuples come back as lists
+            return max(0, int(hint["version"]))
+    except Exception:
+        pass
+    return None
+
+
+def _disk_version(path: str) -> int:
+    """meta.version of the ledger generation a load would pick right now."""
+    sig = _ledger_sig(path)
+    with _VERSION_LOCK:
+        hit = _VERSIONS.get(path)
+    if hit is not None and hit[0] == sig:
+        return hit[1]
+    version = _version_hint(path, sig)
+    if version is not None:
+        _remember_version(path, sig, version)
+        return version
+    data, _, _ = _persist.read_generation(path, schema=1)
+    version = 0
+    if isinstance(data, dict) and isinstance(data.get("meta"), dict):
         try:
-            os.replace(path, bak)
+            version = max(0, int(data["meta"].get("version", 0)))
         except Exception:
-            pass
+            version = 0
+    _remember_version(path, sig, version)
+    return version
 
-    os.replace(tmp, path)
+
+# ----------------------------
+# Backend selection
+# ----------------------------
+
+# "json" (default) or "sqlite". With sqlite, a .json ledger path maps to a
+# sibling .db file, seeded from the JSON ledger on first use. Paths ending in
+# .db/.sqlite/.sqlite3 always use SQLite (see codes_ledger_sqlite).
+#
+# Seeding happens in _sqlite_path, which every entry point goes through
+# (load, save, redeem_at, update_ledger/add_code), so whichever of them
+# touches the database first fills it from the JSON ledger. It keys off the
+# ledger row, not the file: _connect creates the file on any first access.
+BACKEND = os.getenv("SLD_LEDGER_BACKEND", "json").strip().lower()
+_SQLITE_SUFFIXES = (".db", ".sqlite", ".sqlite3")
+_SEEDED: set = set()
+
+
+def _sqlite_path(path: str) -> Optional[str]:
+    if path.lower().endswith(_SQLITE_SUFFIXES):
+        return path
+    if BACKEND != "sqlite":
+        return None
+    db = os.path.splitext(path)[0] + ".db"
+    if db not in _SEEDED:
+        _sqlite.ensure_seeded(db, lambda: _sqlite_seed(path))
+        _SEEDED.add(db)
+    return db
+
+
+def _sqlite_seed(path: str) -> dict:
+    seed = _load_json_ledger(path)
+    # archived segments first, then the hot events, streamed into the database
+    seed["history"] = iter_events(seed, path)
+    return seed
 
 
 # ----------------------------
@@ -115,30 +281,115 @@ def _atomic_save_json(data: dict, path: str) -> None:
 # ----------------------------
 
 def load_ledger(path: str) -> dict:
-    if os.path.exists(path):
-        data = _read_json(path)
-        if isinstance(data, dict):
-            return _normalize(data)
+    db = _sqlite_path(path)
+    if db:
+        return _sqlite.load_ledger(db)
+    return _load_json_ledger(path)
+
+
+def _load_json_ledger(path: str) -> dict:
+    # newest intact generation; a checksum-verified file was normalized when saved
+    sig = _ledger_sig(path)
+    data, trusted, gen = _persist.read_generation(path, schema=1)
+    if not isinstance(data, dict):
+        ledger = _normalize(_default_ledger())
+        _chain.state(ledger["meta"], 0)
+        _remember_version(path, sig, 0)
+        return ledger
+    ledger = data if trusted else _normalize(data)
+    _remember_version(path, sig, ledger["meta"]["version"])
+
+    # a crash between archiving and rewriting the hot file leaves the block in both
+    meta = ledger["meta"]
+    meta["archived"] = _archive.reconcile(ledger["history"], meta["archived"], path)
+    _chain.state(meta, meta["archived"] + len(ledger["history"]))
+    meta.pop("fingerprint", None)
+    if gen == path:  # a recovery from .bak is written back by the next save
+        meta["fingerprint"] = _fingerprint(ledger)
+    return ledger
 
-    bak = path + ".bak"
-    if os.path.exists(bak):
-        data = _read_json(bak)
-        if isinstance(data, dict):
-            return _normalize(data)
 
-    return _default_ledger()
+def _fingerprint(ledger: dict) -> str:
+    """Dirty-check digest: every mint/redeem adds a history event and may add a code."""
+    hist = ledger["history"]
+    return _persist.fingerprint(
+        ledger["meta"]["archived"] + len(hist), len(ledger["codes"]), hist[-1] if hist else None
+    )
 
 
-def save_ledger(ledger: dict, path: str) -> None:
+def save_ledger(ledger: dict, path: str, overwrite: bool = False) -> None:
+    """
+    Save under the ledger file lock. Raises StaleWriteError if the file on disk
+    has a newer meta.version than the one this ledger was loaded at;
+    overwrite=True (restoring an import or backup) replaces it instead.
+    """
+    db = _sqlite_path(path)
+    if db:
+        if isinstance(ledger, _sqlite.SqliteLedger) and ledger.db_path == db:
+            _sqlite.save_ledger(ledger, db)
+        else:
+            _sqlite.replace_ledger(_normalize(ledger), db)
+        return
+
     ledger = _normalize(ledger)
-    ledger["meta"]["last_saved_utc"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
-    _atomic_save_json(ledger, path)
+    meta = ledger["meta"]
+    _chain.catch_up(meta, ledger["history"], meta["archived"])  # events appended by hand
+    fp = _fingerprint(ledger)
+    if not overwrite and _persist.unchanged(meta, fp):
+        return  # nothing changed since load/last save
+
+    with _lock.file_lock(path):
+        disk_version = _disk_version(path)
+        if overwrite:
+            # continue from the generation on disk; archived events stay archived
+            meta["version"] = disk_version
+            meta["archived"] = _archive.reconcile(ledger["history"], meta["archived"], path)
+            fp = _fingerprint(ledger)
+        elif disk_version != meta["version"]:
+            raise StaleWriteError(
+                f"ledger at {path} is at version {disk_version}, this copy was loaded at {meta['version']}"
+            )
+
+        moved = _archive.archive_overflow(ledger["history"], path, MAX_HISTORY, amount_key="value")
+        meta["archived"] += moved
+        meta["version"] += 1
+        meta["last_saved_utc"] = datetime.utcnow().isoformat(timespec="seconds") + "Z"
+        meta["fingerprint"] = fp
+        try:
+            # before the ledger: the filter may run ahead, never behind
+            _bloom.sync(path, ledger["codes"], disk_version, meta["version"])
+            _atomic_save_json(ledger, path)
+        except Exception:
+            meta.pop("fingerprint", None)
+            raise
+        sig = _ledger_sig(path)
+        _remember_version(path, sig, meta["version"])
+        _write_version_hint(path, sig, meta["version"])
+
+
+def update_ledger(path: str, fn, retries: int = 5):
+    """
+    Optimistic read-modify-write: load, fn(ledger), save; on StaleWriteError
+    reload and re-apply fn. Returns fn's result. The last attempt runs under
+    the ledger lock, so it cannot lose the race again.
+    """
+    for _ in range(max(0, int(retries) - 1)):
+        ledger = load_ledger(path)
+        result = fn(ledger)
+        try:
+            save_ledger(ledger, path)
+            return result
+        except StaleWriteError:
+            pass
+    with _lock.file_lock(path):
+        ledger = load_ledger(path)
+        result = fn(ledger)
+        save_ledger(ledger, path)
+        return result
 
 
 def ensure_ledger_exists(path: str) -> dict:
-    l = load_ledger(path)
-    save_ledger(l, path)
-    return l
+    return update_ledger(path, lambda l: l)
 
 
 # ----------------------------
@@ -151,11 +402,38 @@ def _now_utc() -> str:
 
 def _log(ledger: dict, t: str, payload: dict) -> None:
     ledger.setdefault("history", [])
-    ledger["history"].append({
+    event = {
         "ts": _now_utc(),
         "type": t,
         **payload,
-    })
+    }
+    # extend the hash chain when it covers everything so far (see sld_chain)
+    meta = ledger.get("meta")
+    if isinstance(meta, dict) and isinstance(meta.get("archived"), int):
+        c = _chain.current(meta, meta["archived"] + len(ledger["history"]))
+        if c is not None:
+            _chain.seal(c, event)
+    ledger["history"].append(event)
+
+
+_ALPHABET = string.ascii_uppercase + string.digits
+# random bytes map onto the alphabet with b % 36; bytes >= 252 are rejected so
+# every character stays equally likely
+_LIMIT = 256 - 256 % len(_ALPHABET)
+_TABLE = bytes(ord(_ALPHABET[b % len(_ALPHABET)]) for b in range(256))
+_REJECT = bytes(range(_LIMIT, 256))
+
+
+def _random_chunks(count: int, length: int) -> list:
+    """`count` random strings of `length` alphabet characters, from bulk secrets.token_bytes."""
+    need = count * length
+    out = b""
+    while len(out) < need:
+        missing = need - len(out)
+        # ~1.6% of bytes get rejected: over-draw a little so one round usually suffices
+        out += secrets.token_bytes(missing + missing // 32 + 16).translate(_TABLE, _REJECT)
+    s = out[:need].decode("ascii")
+    return [s[i:i + length] for i in range(0, need, length)]
 
 
 def generate_code(prefix: str = "SLD", length: int = 8) -> str:
@@ -163,8 +441,7 @@ def generate_code(prefix: str = "SLD", length: int = 8) -> str:
     Generates codes like: SLD-AB12CD34
     Uses a cryptographically strong generator (secrets).
     """
-    alphabet = string.ascii_uppercase + string.digits
-    chunk = "".join(secrets.choice(alphabet) for _ in range(length))
+    chunk = _random_chunks(1, length)[0]
     prefix = (prefix or "SLD").upper().strip()
     return f"{prefix}-{chunk}"
 
@@ -177,11 +454,13 @@ def mint_code(ledger: dict, value: int, created_by: str = "admin", note: str = "
     """
     Create a new redeemable code worth `value` tokens.
     """
-    ledger = _normalize(ledger)
     value = int(value)
-
     if value <= 0:
         raise ValueError("value must be positive")
+    if isinstance(ledger, _sqlite.SqliteLedger):
+        return _sqlite.mint_code(ledger, lambda: generate_code(prefix=prefix), value, created_by, note)
+
+    ledger = _shape(ledger)
 
     # Ensure uniqueness
     code = generate_code(prefix=prefix)
@@ -200,9 +479,112 @@ def mint_code(ledger: dict, value: int, created_by: str = "admin", note: str = "
     return code
 
 
+# Codes per generation round in mint_codes (also the CSV write granularity).
+MINT_CHUNK = 10_000
+
+
+def mint_codes(
+    ledger: dict,
+    count: int,
+    value: int,
+    created_by: str = "admin",
+    note: str = "",
+    prefix: str = "SLD",
+    path: Optional[str] = None,
+    csv_path: Optional[str] = None,
+) -> list:
+    """
+    Create `count` codes worth `value` tokens each and return them.
+
+    One pass for the whole batch: entropy is drawn in bulk, uniqueness is
+    checked against a set and a single "mint_batch" event is logged. With
+    `path` the ledger is saved once (StaleWriteError as in save_ledger).
+    With `csv_path` the codes are streamed to a CSV (code,value,created_utc)
+    that is moved into place only once the batch is minted and saved.
+    """
+    count = int(count)
+    value = int(value)
+
+    if value <= 0:
+        raise ValueError("value must be positive")
+    if count <= 0:
+        return []
+
+    prefix = (prefix or "SLD").upper().strip()
+    with _csv_stream(csv_path) as writer:
+        if isinstance(ledger, _sqlite.SqliteLedger):
+            minted = _sqlite.mint_codes(ledger, count, value, created_by, note, prefix, _random_chunks, writer)
+        else:
+            minted = _mint_json(_shape(ledger), count, value, created_by, note, prefix, writer)
+        if path:
+            save_ledger(ledger, path)
+    return minted
+
+
+@contextmanager
+def _csv_stream(csv_path: Optional[str]):
+    """csv.writer on a temporary file, moved to `csv_path` only if the block succeeds (None: no CSV)."""
+    if not csv_path:
+        yield None
+        return
+    tmp = f"{csv_path}.tmp.{os.getpid()}"
+    os.makedirs(os.path.dirname(os.path.abspath(csv_path)), mode=0o700, exist_ok=True)
+    try:
+        with open(tmp, "w", newline="", encoding="utf-8") as out:
+            writer = csv.writer(out)
+            writer.writerow(["code", "value", "created_utc"])
+            yield writer
+        os.replace(tmp, csv_path)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+
+def _mint_json(ledger: dict, count: int, value: int, created_by: str, note: str, prefix: str, writer) -> list:
+    codes = ledger["codes"]
+    created = _now_utc()
+    minted = []
+    while len(minted) < count:
+        fresh = []
+        for chunk in _random_chunks(min(MINT_CHUNK, count - len(minted)), 8):
+            code = f"{prefix}-{chunk}"
+            if code in codes:
+                continue  # collision: the next round draws a replacement
+            fresh.append(code)
+            codes[code] = {
+                "value": value,
+                "created_utc": created,
+                "created_by": str(created_by),
+                "redeemed_utc": None,
+                "redeemed_by": None,
+                "note": str(note),
+            }
+        if writer is not None:
+            writer.writerows((code, value, created) for code in fresh)
+        minted.extend(fresh)
+
+    _log(ledger, "mint_batch", {
+        "count": count,
+        "value": value,
+        "created_by": created_by,
+        "note": note,
+        "prefix": prefix,
+        "first": minted[0],
+        "last": minted[-1],
+    })
+    return minted
+
+
+def add_code(path: str, value: int, created_by: str = "admin", note: str = "", prefix: Optional[str] = None) -> str:
+    """Mint one code in the ledger at `path` and save it; the prefix defaults to DEP-<value>."""
+    prefix = prefix or f"DEP-{int(value)}"
+    return update_ledger(path, lambda ledger: mint_code(ledger, value, created_by, note, prefix))
+
+
 def is_redeemed(ledger: dict, code: str) -> bool:
-    ledger = _normalize(ledger)
-    info = ledger["codes"].get((code or "").strip().upper())
+    if isinstance(ledger, _sqlite.SqliteLedger):
+        return _sqlite.is_redeemed(ledger, (code or "").strip().upper())
+    info = _entry(_shape(ledger), (code or "").strip().upper())
     if not info:
         return False
     return bool(info.get("redeemed_utc"))
@@ -214,13 +596,15 @@ def redeem_code(ledger: dict, code: str, redeemed_by: str = "user") -> int:
     Returns value to award.
     Raises ValueError if invalid or already redeemed.
     """
-    ledger = _normalize(ledger)
     code_key = (code or "").strip().upper()
-
     if not code_key:
         raise ValueError("empty code")
+    if isinstance(ledger, _sqlite.SqliteLedger):
+        return _sqlite.redeem(ledger.db_path, code_key, redeemed_by, ledger)
 
-    info = ledger["codes"].get(code_key)
+    ledger = _shape(ledger)
+
+    info = _entry(ledger, code_key)
     if not info:
         raise ValueError("invalid code")
 
@@ -235,10 +619,65 @@ def redeem_code(ledger: dict, code: str, redeemed_by: str = "user") -> int:
     return value
 
 
+def redeem_at(path: str, code: str, redeemed_by: str = "user") -> tuple:
+    """
+    Redeem `code` in the ledger at `path` and save it.
+    Returns (ok, message, value). Codes the Bloom filter has never seen are
+    rejected without loading the ledger; with SQLite this is a single
+    conditional UPDATE instead.
+    """
+    code_key = (code or "").strip().upper()
+    if not code_key:
+        return False, "Enter a code first.", 0
+    db = _sqlite_path(path)
+    if db is None and _bloom.might_contain(path, code_key, _disk_version(path)) is False:
+        return False, "Invalid code.", 0
+    try:
+        if db:
+            value = _sqlite.redeem(db, code_key, redeemed_by)
+        else:
+            value = update_ledger(path, lambda ledger: redeem_code(ledger, code_key, redeemed_by))
+    except ValueError as e:
+        msg = {"invalid code": "Invalid code.", "code already redeemed": "This code was already redeemed."}
+        return False, msg.get(str(e), str(e)), 0
+    return True, "Code redeemed.", value
+
+
+def verify_history(ledger: dict, path: str, full: bool = False, workers: Optional[int] = None) -> dict:
+    """
+    Check the event hash chain (see sld_chain): incremental by default,
+    full=True audits archived segments too (in parallel). None for SQLite
+    ledgers, which are not chained.
+    """
+    if isinstance(ledger, _sqlite.SqliteLedger):
+        return None
+    ledger = _shape(ledger)
+    meta = ledger["meta"]
+    if full:
+        return _chain.audit(meta, ledger["history"], meta["archived"], path, workers)
+    return _chain.verify(meta, ledger["history"], meta["archived"], path)
+
+
 def recent_events(ledger: dict, keep: int = 12) -> list:
-    ledger = _normalize(ledger)
+    if isinstance(ledger, _sqlite.SqliteLedger):
+        return _sqlite.recent_events(ledger, keep)
     keep = max(0, int(keep))
-    return ledger.get("history", [])[-keep:]
+    out = []
+    for evt in reversed(_shape(ledger)["history"]):
+        if len(out) >= keep:
+            break
+        if _valid_event(evt):
+            out.append(evt)
+    out.reverse()
+    return out
+
+
+def iter_events(ledger: dict, path: str):
+    """Lazily yield every event, oldest first: archive segments, then hot history."""
+    if isinstance(ledger, _sqlite.SqliteLedger):
+        return _sqlite.iter_events(ledger)
+    ledger = _shape(ledger)
+    return _archive.iter_all(path, [evt for evt in ledger["history"] if _valid_event(evt)])
 
 
 # ----------------------------
@@ -265,15 +704,18 @@ def compute_network_cut(tokens_purchased: int) -> int:
 # ----------------------------
 
 def export_ledger_json(ledger: dict) -> str:
+    if isinstance(ledger, _sqlite.SqliteLedger):
+        ledger = _sqlite.export_ledger(ledger)
     ledger = _normalize(ledger)
-    return json.dumps(ledger, indent=2, ensure_ascii=False)
+    return _serial.dumps_str(_persist.unstamped(ledger), pretty=True)
 
 
 def import_ledger_json(json_text: str) -> dict:
+    """Parse and normalize (does not save); restore with save_ledger(l, path, overwrite=True)."""
     try:
         data = json.loads(json_text)
         if isinstance(data, dict):
-            return _normalize(data)
+            return _normalize(_persist.unstamped(data))
     except Exception:
         pass
     return _default_ledger()
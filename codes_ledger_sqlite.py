@@ -0,0 +1,402 @@
+import json
+import os
+import sqlite3
+import threading
+from collections.abc import Mapping
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Optional
+
+import sld_persist as _persist
+
+
+# ----------------------------
+# SQLite storage backend for codes_ledger
+# ----------------------------
+#
+# codes_ledger dispatches here when the ledger path ends in .db/.sqlite (or
+# SLD_LEDGER_BACKEND=sqlite). Ledgers are returned as `SqliteLedger`, a dict
+# subclass bound to its database, so the public API keeps its signatures:
+#   codes      a read-only view over the `codes` table (primary key lookups,
+#              nothing is loaded up front)
+#   history    the last HISTORY_WINDOW events; events appended to it by hand
+#              are flushed by save_ledger
+# mint/redeem commit straight to the database. A redeem is one
+#   UPDATE codes ... WHERE code = ? AND redeemed_utc IS NULL
+# so of two concurrent redeems of a code exactly one changes a row, in any
+# number of processes, and it costs one index lookup instead of a ledger
+# rewrite. Events are not hash-chained here (as with SQLite banks).
+
+HISTORY_WINDOW = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS codes (
+    code TEXT PRIMARY KEY,
+    value INTEGER NOT NULL,
+    created_utc TEXT NOT NULL DEFAULT '',
+    created_by TEXT NOT NULL DEFAULT '',
+    redeemed_utc TEXT,
+    redeemed_by TEXT,
+    note TEXT NOT NULL DEFAULT ''
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts TEXT NOT NULL,
+    type TEXT NOT NULL,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS ledger (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    last_saved_utc TEXT
+);
+"""
+
+_CODE_COLS = ("value", "created_utc", "created_by", "redeemed_utc", "redeemed_by", "note")
+
+# Rows per executemany in mint_codes (also the CSV write granularity).
+MINT_CHUNK = 10_000
+
+
+def _now_utc() -> str:
+    return datetime.utcnow().isoformat(timespec="seconds") + "Z"
+
+
+# ----------------------------
+# Connections
+# ----------------------------
+
+_local = threading.local()
+
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """One autocommit connection per (thread, db); transactions are explicit."""
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        folder = os.path.dirname(db_path) or "."
+        os.makedirs(folder, exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(_SCHEMA)
+        conns[db_path] = conn
+    return conn
+
+
+@contextmanager
+def _write_tx(db_path: str):
+    """BEGIN IMMEDIATE ... COMMIT, rolled back on any exception (joins an open transaction)."""
+    conn = _connect(db_path)
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+# ----------------------------
+# Rows <-> dicts
+# ----------------------------
+
+def _row_info(row: tuple) -> dict:
+    return dict(zip(_CODE_COLS, row))
+
+
+def _event_row(evt: dict) -> tuple:
+    extra = {k: v for k, v in evt.items() if k not in ("ts", "type")}
+    return (
+        str(evt.get("ts") or _now_utc()),
+        str(evt.get("type") or ""),
+        json.dumps(extra, ensure_ascii=False) if extra else None,
+    )
+
+
+def _row_event(row: tuple) -> dict:
+    ts, t, extra = row
+    evt = {"ts": ts, "type": t}
+    if extra:
+        try:
+            evt.update(json.loads(extra))
+        except Exception:
+            pass
+    return evt
+
+
+def _insert_events(conn: sqlite3.Connection, events) -> None:
+    """Insert `events` (any iterable, consumed lazily) in order."""
+    conn.executemany("INSERT INTO events(ts, type, extra) VALUES (?, ?, ?)", (_event_row(e) for e in events))
+
+
+def _insert_codes(conn: sqlite3.Connection, codes: dict) -> None:
+    conn.executemany(
+        "INSERT OR REPLACE INTO codes(code, value, created_utc, created_by, redeemed_utc, redeemed_by, note) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(code, *(info.get(c) for c in _CODE_COLS)) for code, info in codes.items()],
+    )
+
+
+class CodesView(Mapping):
+    """Read-only mapping code -> info dict backed by the `codes` table."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+
+    def __getitem__(self, code: str) -> dict:
+        row = _connect(self.db_path).execute(
+            "SELECT value, created_utc, created_by, redeemed_utc, redeemed_by, note FROM codes WHERE code = ?",
+            (code,),
+        ).fetchone()
+        if row is None:
+            raise KeyError(code)
+        return _row_info(row)
+
+    def __contains__(self, code) -> bool:
+        return _connect(self.db_path).execute("SELECT 1 FROM codes WHERE code = ?", (code,)).fetchone() is not None
+
+    def __len__(self) -> int:
+        return _connect(self.db_path).execute("SELECT COUNT(*) FROM codes").fetchone()[0]
+
+    def __iter__(self):
+        conn = _connect(self.db_path)
+        last = ""
+        while True:
+            rows = conn.execute("SELECT code FROM codes WHERE code > ? ORDER BY code LIMIT 1000", (last,)).fetchall()
+            if not rows:
+                return
+            for (code,) in rows:
+                yield code
+            last = rows[-1][0]
+
+
+class SqliteLedger(dict):
+    """Codes ledger dict bound to the SQLite file it was loaded from."""
+
+    def __init__(self, db_path: str, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.db_path = db_path
+
+
+def _mark(ledger: SqliteLedger, conn: sqlite3.Connection) -> None:
+    saved = conn.execute("SELECT last_saved_utc FROM ledger WHERE id = 1").fetchone()
+    meta = ledger.setdefault("meta", {})
+    meta["last_saved_utc"] = saved[0] if saved else None
+    meta["sqlite"] = {"mark": len(ledger.get("history", []))}
+
+
+def _flush_pending(ledger: SqliteLedger, conn: sqlite3.Connection) -> None:
+    """Insert events appended to ledger["history"] by hand since the last mark."""
+    hist = ledger.get("history") or []
+    mark = int(((ledger.get("meta") or {}).get("sqlite") or {}).get("mark", len(hist)))
+    _insert_events(conn, [e for e in hist[mark:] if isinstance(e, dict) and "ts" in e and "type" in e])
+
+
+def _append(ledger: SqliteLedger, conn: sqlite3.Connection, evt: dict) -> None:
+    _insert_events(conn, [evt])
+    ledger.setdefault("history", []).append(evt)
+
+
+def _event(t: str, payload: dict) -> dict:
+    return {"ts": _now_utc(), "type": t, **payload}
+
+
+# ----------------------------
+# Public API (mirrors codes_ledger)
+# ----------------------------
+
+def ensure_seeded(db_path: str, seed: Optional[Callable[[], Optional[dict]]] = None) -> None:
+    """
+    Create the ledger row if the database has none yet, filled from seed():
+    a normalized JSON ledger whose "history" may be any iterable (codes_ledger
+    passes the archive-aware one). seed is only called for a database that
+    has never been initialized, whoever opened it first.
+    """
+    conn = _connect(db_path)
+    if conn.execute("SELECT 1 FROM ledger WHERE id = 1").fetchone() is not None:
+        return
+    with _write_tx(db_path) as c:
+        if c.execute("SELECT 1 FROM ledger WHERE id = 1").fetchone() is not None:
+            return  # another connection seeded it first
+        data = (seed() if seed else None) or {}
+        c.execute("INSERT INTO ledger(id, last_saved_utc) VALUES (1, NULL)")
+        _insert_codes(c, data.get("codes") or {})
+        _insert_events(c, (e for e in data.get("history", []) if isinstance(e, dict)))
+
+
+def load_ledger(db_path: str) -> SqliteLedger:
+    """Bind to the database and mirror the last HISTORY_WINDOW events."""
+    ensure_seeded(db_path)
+    conn = _connect(db_path)
+    rows = conn.execute("SELECT ts, type, extra FROM events ORDER BY id DESC LIMIT ?", (HISTORY_WINDOW,)).fetchall()
+    ledger = SqliteLedger(db_path, {
+        "codes": CodesView(db_path),
+        "history": [_row_event(r) for r in reversed(rows)],
+        "meta": {"schema": 1, "last_saved_utc": None, "backend": "sqlite"},
+    })
+    _mark(ledger, conn)
+    return ledger
+
+
+def save_ledger(ledger: SqliteLedger, db_path: Optional[str] = None) -> None:
+    db_path = db_path or ledger.db_path
+    hist = ledger.get("history") or []
+    if db_path == ledger.db_path and len(hist) == ((ledger.get("meta") or {}).get("sqlite") or {}).get("mark"):
+        _persist.skip_write()  # mint/redeem already committed; nothing to flush
+        return
+    with _write_tx(db_path) as conn:
+        _flush_pending(ledger, conn)
+        conn.execute("UPDATE ledger SET last_saved_utc = ? WHERE id = 1", (_now_utc(),))
+        _mark(ledger, conn)
+
+
+def replace_ledger(ledger: dict, db_path: str) -> SqliteLedger:
+    """Overwrite the database with a plain (e.g. imported) ledger dict."""
+    _connect(db_path)
+    with _write_tx(db_path) as conn:
+        conn.execute("DELETE FROM codes")
+        conn.execute("DELETE FROM events")
+        conn.execute("INSERT OR REPLACE INTO ledger(id, last_saved_utc) VALUES (1, ?)", (_now_utc(),))
+        _insert_codes(conn, ledger.get("codes") or {})
+        _insert_events(conn, [e for e in ledger.get("history", []) if isinstance(e, dict)])
+    return load_ledger(db_path)
+
+
+def mint_code(ledger: SqliteLedger, code_gen: Callable[[], str], value: int, created_by: str, note: str) -> str:
+    """Insert one code from `code_gen()` (redrawn on a primary-key collision) plus its mint event."""
+    with _write_tx(ledger.db_path) as conn:
+        _flush_pending(ledger, conn)
+        created = _now_utc()
+        while True:
+            code = code_gen()
+            try:
+                conn.execute(
+                    "INSERT INTO codes(code, value, created_utc, created_by, note) VALUES (?, ?, ?, ?, ?)",
+                    (code, value, created, str(created_by), str(note)),
+                )
+                break
+            except sqlite3.IntegrityError:
+                continue
+        _append(ledger, conn, _event("mint", {"code": code, "value": value, "created_by": created_by, "note": note}))
+        _mark(ledger, conn)
+    return code
+
+
+def mint_codes(ledger: SqliteLedger, count: int, value: int, created_by: str, note: str, prefix: str,
+               draw: Callable[[int, int], list], writer=None) -> list:
+    """
+    Bulk insert `count` codes "<prefix>-<draw chunk>" in one transaction, plus
+    one "mint_batch" event. Rows go to `writer` (a csv.writer) chunk by chunk.
+    """
+    minted = []
+    created = _now_utc()
+    with _write_tx(ledger.db_path) as conn:
+        _flush_pending(ledger, conn)
+        while len(minted) < count:
+            fresh = list(dict.fromkeys(f"{prefix}-{c}" for c in draw(min(MINT_CHUNK, count - len(minted)), 8)))
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO codes(code, value, created_utc, created_by, note) VALUES (?, ?, ?, ?, ?)",
+                [(code, value, created, str(created_by), str(note)) for code in fresh],
+            )
+            if conn.total_changes - before != len(fresh):
+                # some drawn codes already existed: keep only the rows this chunk inserted
+                placeholders = ",".join("?" * len(fresh))
+                ours = {
+                    code for (code,) in conn.execute(
+                        f"SELECT code FROM codes WHERE code IN ({placeholders}) AND created_utc = ? AND created_by = ?",
+                        (*fresh, created, str(created_by)),
+                    )
+                }
+                earlier = set(minted)
+                fresh = [code for code in fresh if code in ours and code not in earlier]
+            if writer is not None:
+                writer.writerows((code, value, created) for code in fresh)
+            minted.extend(fresh)
+        _append(ledger, conn, _event("mint_batch", {
+            "count": count,
+            "value": value,
+            "created_by": created_by,
+            "note": note,
+            "prefix": prefix,
+            "first": minted[0],
+            "last": minted[-1],
+        }))
+        _mark(ledger, conn)
+    return minted
+
+
+def is_redeemed(ledger: SqliteLedger, code_key: str) -> bool:
+    row = _connect(ledger.db_path).execute("SELECT redeemed_utc FROM codes WHERE code = ?", (code_key,)).fetchone()
+    return bool(row and row[0])
+
+
+def redeem(db_path: str, code_key: str, redeemed_by: str, ledger: Optional[SqliteLedger] = None) -> int:
+    """
+    Atomically mark `code_key` redeemed and log the event; returns its value.
+    Raises ValueError("invalid code") / ValueError("code already redeemed").
+    """
+    with _write_tx(db_path) as conn:
+        if ledger is not None:
+            _flush_pending(ledger, conn)
+        cur = conn.execute(
+            "UPDATE codes SET redeemed_utc = ?, redeemed_by = ? WHERE code = ? AND redeemed_utc IS NULL",
+            (_now_utc(), str(redeemed_by), code_key),
+        )
+        row = conn.execute("SELECT value FROM codes WHERE code = ?", (code_key,)).fetchone()
+        if cur.rowcount != 1:
+            raise ValueError("invalid code" if row is None else "code already redeemed")
+        value = int(row[0])
+        evt = _event("redeem", {"code": code_key, "value": value, "redeemed_by": redeemed_by})
+        if ledger is not None:
+            _append(ledger, conn, evt)
+            _mark(ledger, conn)
+        else:
+            _insert_events(conn, [evt])
+    return value
+
+
+def recent_events(ledger: SqliteLedger, keep: int = 12) -> list:
+    keep = max(0, int(keep))
+    if keep == 0:
+        return []
+    rows = _connect(ledger.db_path).execute(
+        "SELECT ts, type, extra FROM events ORDER BY id DESC LIMIT ?", (keep,)
+    ).fetchall()
+    return [_row_event(r) for r in reversed(rows)]
+
+
+def iter_events(ledger: SqliteLedger, batch: int = 1000):
+    """Lazily yield every event, oldest first, `batch` rows per query."""
+    conn = _connect(ledger.db_path)
+    last = 0
+    while True:
+        rows = conn.execute(
+            "SELECT id, ts, type, extra FROM events WHERE id > ? ORDER BY id LIMIT ?", (last, batch)
+        ).fetchall()
+        if not rows:
+            return
+        for row in rows:
+            yield _row_event(row[1:])
+        last = rows[-1][0]
+
+
+def export_ledger(ledger: SqliteLedger) -> dict:
+    """The whole ledger as a plain JSON-ledger dict."""
+    conn = _connect(ledger.db_path)
+    codes = {
+        row[0]: _row_info(row[1:])
+        for row in conn.execute(
+            "SELECT code, value, created_utc, created_by, redeemed_utc, redeemed_by, note FROM codes"
+        )
+    }
+    return {
+        "codes": codes,
+        "history": list(iter_events(ledger)),
+        "meta": {"schema": 1, "last_saved_utc": ledger.get("meta", {}).get("last_saved_utc")},
+    }
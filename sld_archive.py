@@ -0,0 +1,214 @@
+import gzip
+import json
+import logging
+import os
+import re
+from typing import Iterable, Iterator, List, Optional
+
+import sld_persist as _persist
+import sld_serial as _serial
+
+log = logging.getLogger(__name__)
+
+
+# ----------------------------
+# Rolling history archive
+# ----------------------------
+#
+# Shared by careon_bank_v2 and codes_ledger. When a store's hot history grows
+# past its threshold, the oldest block is moved into an immutable gzip JSONL
+# segment next to the store file:
+#
+#   <path>.archive/seg-000001.jsonl.gz
+#   <path>.archive/index.json   [{file, start, count, first_ts, last_ts, counts, sums}, ...]
+#
+# Segments are written before the index, and the index before the caller
+# rewrites its hot file; `reconcile` drops any head entries that a crash left
+# in both places. Both follow sld_persist.DURABILITY, so they are on disk
+# before the hot file stops holding their entries. A segment file is never
+# replaced: numbers continue past any file already in the folder (e.g. one a
+# crash left unindexed), and an unreadable index stops archiving instead of
+# starting a new one over the old segments.
+
+ARCHIVE_BLOCK = 1000  # entries per segment
+
+
+def archive_dir(path: str) -> str:
+    return path + ".archive"
+
+
+def _index_path(path: str) -> str:
+    return os.path.join(archive_dir(path), "index.json")
+
+
+def _load_index(path: str) -> List[dict]:
+    """The index; [] if there is none yet, ValueError/OSError if it is unreadable."""
+    try:
+        with open(_index_path(path), "rb") as f:
+            idx = _serial.loads(f.read())
+    except FileNotFoundError:
+        return []
+    if not isinstance(idx, list):
+        raise ValueError(f"archive index of {path} is not a list")
+    return [seg for seg in idx if isinstance(seg, dict)]
+
+
+def read_index(path: str) -> List[dict]:
+    try:
+        return _load_index(path)
+    except Exception:
+        return []
+
+
+def archived_count(path: str) -> int:
+    return sum(int(seg.get("count", 0)) for seg in read_index(path))
+
+
+def _write_index(path: str, index: List[dict]) -> None:
+    _persist.replace_bytes(_index_path(path), _serial.dumps(index))
+
+
+_SEG_NAME = re.compile(r"seg-(\d+)\.jsonl\.gz")
+
+
+def _next_number(folder: str, index: List[dict]) -> int:
+    """One past the highest segment number in the index or on disk."""
+    n = len(index)
+    for name in os.listdir(folder):
+        m = _SEG_NAME.fullmatch(name)
+        if m:
+            n = max(n, int(m.group(1)))
+    return n + 1
+
+
+def _summarize(entries: list, amount_key: str) -> dict:
+    counts, sums = {}, {}
+    for e in entries:
+        t = str(e.get("type", ""))
+        counts[t] = counts.get(t, 0) + 1
+        try:
+            sums[t] = sums.get(t, 0) + int(e.get(amount_key, 0) or 0)
+        except Exception:
+            pass
+    return {
+        "first_ts": entries[0].get("ts") if entries else None,
+        "last_ts": entries[-1].get("ts") if entries else None,
+        "counts": counts,
+        "sums": sums,
+    }
+
+
+def write_segment(path: str, entries: list, amount_key: str = "amount") -> dict:
+    """Append one immutable segment holding `entries` (oldest first) and index it."""
+    folder = archive_dir(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+        _persist.sync_dir(os.path.dirname(folder) or ".")
+    index = _load_index(path)
+
+    name = f"seg-{_next_number(folder, index):06d}.jsonl.gz"
+    # "xb": fail rather than replace a segment that is already there
+    with open(os.path.join(folder, name), "xb") as raw:
+        with gzip.GzipFile(fileobj=raw, mode="wb") as f:
+            for e in entries:
+                f.write(_serial.dumps(e))
+                f.write(b"\n")
+        if _persist.DURABILITY != "none":
+            raw.flush()
+            os.fsync(raw.fileno())
+
+    start = sum(int(seg.get("count", 0)) for seg in index)
+    seg = {"file": name, "start": start, "count": len(entries), **_summarize(entries, amount_key)}
+    index.append(seg)
+    _write_index(path, index)
+    return seg
+
+
+def archive_overflow(history, path: str, threshold: int, amount_key: str = "amount",
+                     block: Optional[int] = None) -> int:
+    """
+    Move whole blocks of the oldest entries out of `history` (list or TxLog,
+    edited in place) until it is at most `threshold` long.
+    Returns how many entries were archived.
+    """
+    block = block or ARCHIVE_BLOCK
+    if not threshold or len(history) <= threshold:
+        return 0
+    try:
+        _load_index(path)
+    except Exception as e:
+        # keep the entries hot: a fresh index would hide the existing segments
+        log.warning("archive index of %s is unreadable, not archiving: %s", path, e)
+        return 0
+    moved = 0
+    while len(history) > threshold:
+        take = min(block, len(history))
+        write_segment(path, history[:take], amount_key)
+        del history[:take]
+        moved += take
+    return moved
+
+
+def reconcile(history, archived: int, path: str) -> int:
+    """
+    Hot file says `archived` entries live in segments; if the index holds more
+    (crash between index write and hot save), drop the duplicated head.
+    Returns the archived count to record in meta.
+    """
+    total = archived_count(path)
+    extra = total - int(archived or 0)
+    if extra > 0:
+        del history[:min(extra, len(history))]
+    return max(total, int(archived or 0))
+
+
+def iter_segment(path: str, seg: dict) -> Iterator[dict]:
+    seg_path = os.path.join(archive_dir(path), str(seg.get("file", "")))
+    try:
+        with gzip.open(seg_path, "rt", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+    except FileNotFoundError:
+        return
+
+
+def read_segment(path: str, seg: dict) -> list:
+    """All entries of one segment, decoded in a single parse (for bulk scans)."""
+    seg_path = os.path.join(archive_dir(path), str(seg.get("file", "")))
+    try:
+        with gzip.open(seg_path, "rb") as f:
+            raw = f.read()
+    except FileNotFoundError:
+        return []
+    lines = [line for line in raw.split(b"\n") if line.strip()]
+    return _serial.loads(b"[" + b",".join(lines) + b"]")
+
+
+def iter_archived(path: str) -> Iterator[dict]:
+    """Lazily yield archived entries, oldest first, one segment at a time."""
+    for seg in read_index(path):
+        yield from iter_segment(path, seg)
+
+
+def iter_newest(path: str, types=None) -> Iterator[dict]:
+    """
+    Archived entries newest first (only `types` if given). Segments whose index
+    counts show none of `types` are skipped unread, so a caller that stops
+    after a few matches only decodes the segments that hold them.
+    """
+    types = None if types is None else set(types)
+    for seg in reversed(read_index(path)):
+        counts = seg.get("counts")
+        if types is not None and isinstance(counts, dict) and not any(counts.get(t) for t in types):
+            continue
+        for e in reversed(read_segment(path, seg)):
+            if types is None or e.get("type") in types:
+                yield e
+
+
+def iter_all(path: str, hot: Iterable[dict]) -> Iterator[dict]:
+    """Full history: archived segments, then the hot entries."""
+    yield from iter_archived(path)
+    yield from hot
@@ -0,0 +1,247 @@
+import hashlib
+import math
+import os
+import secrets
+import struct
+import threading
+from itertools import islice
+from typing import Dict, Optional
+
+try:
+    import numpy as np
+except ImportError:  # optional fast path for bulk adds
+    np = None
+
+import sld_persist as _persist
+
+
+# ----------------------------
+# Bloom filter of issued codes
+# ----------------------------
+#
+# A derived file next to the codes ledger (`<ledger>.bloom`) that answers
+# "was this code ever issued?" without loading the ledger:
+#
+#   header  magic, k, m (bits), capacity, count, salt, ledger version, last
+#   bits    m bits, little-endian within each byte
+#
+# `count` is how many codes of the ledger (in ledger order, codes are only
+# ever appended) are in the filter and `last` the keyed digest of the last of
+# them, so a save only hashes the codes minted since the last one. sync() runs
+# under the ledger lock and writes the filter before the ledger itself, so
+# the filter can only ever be ahead of the ledger (a harmless false positive).
+# A missing/damaged filter, one stamped for another ledger version than the
+# save builds on, one whose `last` is no longer at position count-1 (codes
+# dropped or replaced, e.g. a .bak restore), or one that outgrew its capacity
+# is rebuilt from the ledger codes.
+#
+# `version` is the ledger meta.version the filter was synced for. A negative
+# answer is only final while the ledger on disk is at that version; otherwise
+# (the ledger was restored or written without the filter, or the save that
+# synced it failed) might_contain() answers None and the caller reads the ledger.
+#
+# Positions use keyed blake2b (per-filter random salt) with double hashing,
+# so nobody can craft codes that collide with issued ones offline:
+#   p_i = ((h1 + i * h2) mod 2**64) mod m
+# (the 64-bit wrap lets the optional NumPy bulk path compute the same bits).
+
+FP_RATE = 0.001
+MIN_CAPACITY = 1024
+
+_MAGIC = b"SLDBLOM2"
+_HEADER = struct.Struct("<8sIQQQ16sQ16s")  # magic, k, m, capacity, count, salt, version, last
+_HASHES = struct.Struct("<QQ")
+_MASK = (1 << 64) - 1
+_NUMPY_BATCH = 100_000
+
+_CACHE_LOCK = threading.Lock()
+_CACHE: Dict[str, tuple] = {}  # bloom path -> (stat signature, BloomFilter)
+_STATS = {"checks": 0, "rejected": 0, "stale": 0, "rebuilds": 0}
+
+
+class BloomFilter:
+    __slots__ = ("k", "m", "capacity", "count", "salt", "bits", "version", "last")
+
+    def __init__(self, k: int, m: int, capacity: int, count: int, salt: bytes, bits: bytearray,
+                 version: int = 0, last: bytes = bytes(16)):
+        self.k = k
+        self.m = m
+        self.capacity = capacity
+        self.count = count
+        self.salt = salt
+        self.bits = bits
+        self.version = version
+        self.last = last
+
+    @classmethod
+    def sized(cls, capacity: int, fp_rate: float = FP_RATE) -> "BloomFilter":
+        capacity = max(MIN_CAPACITY, int(capacity))
+        m = int(math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2)))
+        k = max(1, int(round(m / capacity * math.log(2))))
+        return cls(k, m, capacity, 0, secrets.token_bytes(16), bytearray((m + 7) // 8))
+
+    def _digest(self, code: str) -> bytes:
+        return hashlib.blake2b(code.encode("utf-8"), digest_size=16, key=self.salt).digest()
+
+    def _positions(self, code: str):
+        h1, h2 = _HASHES.unpack(self._digest(code))
+        h2 |= 1
+        m = self.m
+        for i in range(self.k):
+            yield ((h1 + i * h2) & _MASK) % m
+
+    def add(self, code: str) -> None:
+        bits = self.bits
+        for p in self._positions(code):
+            bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def update(self, codes) -> None:
+        """add() for many codes (the bulk path used by sync)."""
+        if np is not None:
+            return self._update_numpy(codes)
+        for code in codes:
+            self.add(code)
+
+    def _update_numpy(self, codes) -> None:
+        flags = np.unpackbits(np.frombuffer(self.bits, dtype=np.uint8), bitorder="little")
+        steps = np.arange(self.k, dtype=np.uint64)
+        it = iter(codes)
+        while True:
+            batch = [self._digest(code) for code in islice(it, _NUMPY_BATCH)]
+            if not batch:
+                break
+            h = np.frombuffer(b"".join(batch), dtype="<u8").reshape(-1, 2)
+            h1, h2 = h[:, :1], h[:, 1:] | np.uint64(1)
+            flags[(h1 + steps * h2) % np.uint64(self.m)] = 1  # uint64 arithmetic wraps like _MASK
+            self.count += len(batch)
+        self.bits = bytearray(np.packbits(flags[:self.m], bitorder="little").tobytes())
+
+    def __contains__(self, code: str) -> bool:
+        bits = self.bits
+        for p in self._positions(code):
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+        return True
+
+    def covers(self, codes: dict) -> bool:
+        """True if the codes in the filter are still the first `count` codes of `codes`."""
+        if self.count == 0:
+            return True
+        if self.count > len(codes):
+            return False
+        return self._digest(next(islice(codes, self.count - 1, None))) == self.last
+
+    def header(self) -> bytes:
+        return _HEADER.pack(_MAGIC, self.k, self.m, self.capacity, self.count, self.salt, self.version, self.last)
+
+    def to_bytes(self) -> bytes:
+        return self.header() + bytes(self.bits)
+
+    @classmethod
+    def from_bytes(cls, blob: bytes) -> Optional["BloomFilter"]:
+        if len(blob) < _HEADER.size:
+            return None
+        magic, k, m, capacity, count, salt, version, last = _HEADER.unpack_from(blob, 0)
+        bits = bytearray(blob[_HEADER.size:])
+        if magic != _MAGIC or not k or not m or len(bits) != (m + 7) // 8:
+            return None
+        return cls(k, m, capacity, count, salt, bits, version, last)
+
+
+def bloom_path(path: str) -> str:
+    return path + ".bloom"
+
+
+def _signature(bpath: str) -> Optional[tuple]:
+    try:
+        st = os.stat(bpath)
+    except OSError:
+        return None
+    return st.st_ino, st.st_size, st.st_mtime_ns
+
+
+def load(path: str) -> Optional[BloomFilter]:
+    """The filter for the ledger at `path` (cached until the file changes), or None."""
+    bpath = bloom_path(path)
+    sig = _signature(bpath)
+    if sig is None:
+        return None
+    with _CACHE_LOCK:
+        hit = _CACHE.get(bpath)
+        if hit is not None and hit[0] == sig:
+            return hit[1]
+    try:
+        with open(bpath, "rb") as f:
+            bf = BloomFilter.from_bytes(f.read())
+    except OSError:
+        return None
+    if bf is not None:
+        with _CACHE_LOCK:
+            _CACHE[bpath] = (sig, bf)
+    return bf
+
+
+def might_contain(path: str, code: str, version: int) -> Optional[bool]:
+    """
+    False if `code` was certainly never issued by the ledger at `path`, which
+    is at meta.version `version` on disk; True if it may have been; None if
+    there is no filter synced for that version.
+    """
+    bf = load(path)
+    if bf is None or bf.version != version:
+        if bf is not None:
+            with _CACHE_LOCK:
+                _STATS["stale"] += 1
+        return None
+    hit = code in bf
+    with _CACHE_LOCK:
+        _STATS["checks"] += 1
+        if not hit:
+            _STATS["rejected"] += 1
+    return hit
+
+
+def sync(path: str, codes: dict, base: int, version: int) -> None:
+    """
+    Bring the filter up to the ledger `codes` (insertion ordered) that is being
+    saved as meta.version `version` over `base`. Call under the ledger lock.
+    """
+    bf = load(path)
+    n = len(codes)
+    if bf is None or bf.version != base or n > bf.capacity or not bf.covers(codes):
+        # missing, damaged, synced for another ledger generation, codes
+        # dropped/replaced (restore, repair, import) or full: rebuild
+        bf = BloomFilter.sized(2 * n)
+        new = iter(codes)
+        with _CACHE_LOCK:
+            _STATS["rebuilds"] += 1
+    else:
+        # copy: the cached filter must keep matching the file if the write fails
+        bf = BloomFilter(bf.k, bf.m, bf.capacity, bf.count, bf.salt, bytearray(bf.bits), bf.version, bf.last)
+        new = islice(codes, bf.count, None)
+    added = bf.count
+    bf.update(new)
+    added = bf.count - added
+    if bf.count:
+        bf.last = bf._digest(next(reversed(codes)))
+    bf.version = version
+
+    bpath = bloom_path(path)
+    if added or bf.count == 0:
+        _persist.replace_bytes(bpath, bf.to_bytes())
+    else:
+        # same bits, new stamp: rewrite the header in place. A torn or lost
+        # header only makes the filter look stale, which is always safe.
+        with open(bpath, "r+b") as f:
+            f.write(bf.header())
+    sig = _signature(bpath)
+    with _CACHE_LOCK:
+        if sig is not None:
+            _CACHE[bpath] = (sig, bf)
+
+
+def bloom_stats() -> dict:
+    """Filter checks, codes rejected by the filter alone, checks skipped as stale, rebuilds (this process)."""
+    with _CACHE_LOCK:
+        return dict(_STATS)
@@ -0,0 +1,279 @@
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional
+
+import sld_archive as _archive
+
+
+# ----------------------------
+# Hash-chained history
+# ----------------------------
+#
+# Shared by careon_bank_v2 and codes_ledger. Every history entry appended
+# through the stores' _log carries
+#
+#   h = blake2b-128(prev h + "\n" + canonical entry without "h")
+#
+# so editing, dropping or reordering any entry breaks every hash after it.
+# meta["chain"] keeps the state:
+#   start        absolute position of the first chained entry (older entries
+#                predate the chain and are not covered)
+#   upto, head   entries [start, upto) are chained; head is the newest hash
+#   checkpoints  {"<pos>": hash of entry pos-1} every CHAIN_EVERY entries
+#   verified     position up to which verify() has checked the chain
+#   broken       first position whose stored hash did not match (if any)
+#
+# verify() is incremental: it restarts from the newest checkpoint at or
+# before `verified`, so it costs the entries since then. audit() checks
+# everything; archive segments are verified in parallel worker processes
+# (each needs only its own entries, segment boundaries are linked after).
+# Hashes use a stdlib JSON encoding with sorted keys, so they do not depend
+# on the installed fast encoder or on key order.
+
+CHAIN_EVERY = _archive.ARCHIVE_BLOCK  # checkpoints land on segment boundaries
+
+
+_ENCODER = json.JSONEncoder(sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+_esc = json.encoder.encode_basestring  # what _ENCODER does for str (no ASCII escaping)
+
+
+def _canonical(rec: dict) -> bytes:
+    # byte-identical to _ENCODER.encode(rec without "h"); flat str/int fields
+    # (nearly all of them) skip the general encoder
+    parts = []
+    for k in sorted(rec):
+        if k == "h":
+            continue
+        v = rec[k]
+        t = type(v)
+        if t is str:
+            v = _esc(v)
+        elif t is int:
+            v = int.__repr__(v)
+        else:
+            v = _ENCODER.encode(v)
+        parts.append(_esc(k) + ":" + v)
+    return ("{" + ",".join(parts) + "}").encode("utf-8")
+
+
+def link(prev: str, rec: dict) -> str:
+    """Chain hash of `rec` following the entry hashed `prev` ("" at the start)."""
+    return hashlib.blake2b(prev.encode("ascii") + b"\n" + _canonical(rec), digest_size=16).hexdigest()
+
+
+def _valid(c) -> bool:
+    if not isinstance(c, dict):
+        return False
+    if not all(isinstance(c.get(k), int) and c[k] >= 0 for k in ("start", "upto", "verified")):
+        return False
+    return isinstance(c.get("head"), str) and isinstance(c.get("checkpoints"), dict)
+
+
+def state(meta: dict, n_abs: int) -> dict:
+    """meta["chain"], started at `n_abs` (the current history end) if missing/unreadable."""
+    c = meta.get("chain")
+    if not _valid(c):
+        c = {"start": n_abs, "upto": n_abs, "head": "", "verified": n_abs, "checkpoints": {}}
+        meta["chain"] = c
+    return c
+
+
+def current(meta: dict, pos: int) -> Optional[dict]:
+    """The chain if it covers everything before absolute `pos`, else None."""
+    c = meta.get("chain") if isinstance(meta, dict) else None
+    return c if _valid(c) and c["upto"] == pos else None
+
+
+def _advance(c: dict, h: str) -> None:
+    c["upto"] += 1
+    c["head"] = h
+    if c["upto"] % CHAIN_EVERY == 0:
+        c["checkpoints"][str(c["upto"])] = h
+
+
+def seal(c: dict, tx: dict) -> None:
+    """Hash `tx` (about to be appended at c["upto"]) into the chain."""
+    tx["h"] = link(c["head"], tx)
+    _advance(c, tx["h"])
+
+
+def catch_up(meta: dict, hist, base: int, sealed: bool = False) -> dict:
+    """
+    Chain entries appended without _log (hand edits, imports). An entry that
+    already carries a different hash is kept as is and recorded as broken.
+    With sealed=True the entries must already carry their hashes (e.g.
+    replayed from a journal): a missing one is recorded as broken too.
+    """
+    n_abs = base + len(hist)
+    c = state(meta, n_abs)
+    if c["upto"] < base:
+        # unchained entries were archived: the chain can only restart here
+        c.update(start=base, upto=base, head="", verified=base)
+    for pos in range(c["upto"], n_abs):
+        i = pos - base
+        tx = hist[i]
+        h = link(c["head"], tx)
+        stored = tx.get("h")
+        if stored is None and not sealed:
+            if hasattr(hist, "set_hash"):
+                hist.set_hash(i, h)
+            else:
+                tx["h"] = h
+        elif stored != h:
+            c.setdefault("broken", pos)
+            h = str(stored) if stored is not None else h
+        _advance(c, h)
+    return c
+
+
+# ----------------------------
+# Verification
+# ----------------------------
+
+def _check_run(entries, pos: int, prev: Optional[str], checkpoints: Dict[str, str]) -> tuple:
+    """
+    Check consecutive entries starting at absolute `pos`. With prev=None the
+    first entry's link is left to the caller. Returns (last hash, first bad
+    position or None, first entry, entries checked).
+    """
+    first = None
+    n = 0
+    for tx in entries:
+        h = tx.get("h") if isinstance(tx, dict) else None
+        if first is None:
+            first = tx
+        if not isinstance(h, str) or (prev is not None and h != link(prev, tx)):
+            return prev, pos, first, n
+        if (pos + 1) % CHAIN_EVERY == 0 and checkpoints.get(str(pos + 1), h) != h:
+            return prev, pos, first, n
+        prev = h
+        pos += 1
+        n += 1
+    return prev, None, first, n
+
+
+def _audit_segment(path: str, seg: dict, start: int, checkpoints: Dict[str, str]) -> tuple:
+    """Worker: verify one archive segment (from `start` on) without knowing its predecessor."""
+    seg_start = int(seg.get("start", 0))
+    entries = _archive.read_segment(path, seg)[max(0, start - seg_start):]
+    first_pos = max(start, seg_start)
+    last, bad, first, n = _check_run(entries, first_pos, None, checkpoints)
+    return first_pos, first, last, bad, n
+
+
+def _report(c: dict, mode: str, checked: int, bad: Optional[int], t0: float) -> dict:
+    return {
+        "ok": bad is None and "broken" not in c,
+        "mode": mode,
+        "start": c["start"],
+        "upto": c["upto"],
+        "checked": checked,
+        "bad_at": bad,
+        "broken": c.get("broken"),
+        "head": c["head"],
+        "checkpoints": len(c["checkpoints"]),
+        "elapsed_ms": (time.perf_counter() - t0) * 1000,
+    }
+
+
+def _entries_from(path: Optional[str], hist, base: int, pos: int):
+    """Entries from absolute `pos` on: archived ones first (if any), then hot."""
+    if pos < base and path:
+        for seg in _archive.read_index(path):
+            s, n = int(seg.get("start", 0)), int(seg.get("count", 0))
+            if s + n <= pos or s >= base:
+                continue
+            yield from _archive.read_segment(path, seg)[max(0, pos - s):]
+    for i in range(max(0, pos - base), len(hist)):
+        yield hist[i]
+
+
+def _bounded(it, n: int):
+    for i, x in enumerate(it):
+        if i >= n:
+            return
+        yield x
+
+
+def verify(meta: dict, hist, base: int, path: Optional[str] = None) -> dict:
+    """Incremental check: entries since the newest checkpoint at or before meta.chain.verified."""
+    t0 = time.perf_counter()
+    c = state(meta, base + len(hist))
+    cps = c["checkpoints"]
+    pos, prev = c["start"], ""
+    for k, h in cps.items():
+        p = int(k)
+        if pos < p <= c["verified"]:
+            pos, prev = p, h
+    end = min(c["upto"], base + len(hist))
+    last, bad, _, n = _check_run(_bounded(_entries_from(path, hist, base, pos), end - pos), pos, prev, cps)
+    if bad is None and end != c["upto"]:
+        bad = end  # chained entries are missing
+    if bad is None and last != c["head"]:
+        bad = end - 1
+    if bad is None:
+        c["verified"] = c["upto"]
+    return _report(c, "incremental", n, bad, t0)
+
+
+def audit(meta: dict, hist, base: int, path: Optional[str] = None, workers: Optional[int] = None) -> dict:
+    """Full check of the chain; archive segments are verified in parallel."""
+    t0 = time.perf_counter()
+    c = state(meta, base + len(hist))
+    cps = c["checkpoints"]
+    segs = []
+    if path and base > c["start"]:
+        segs = [
+            seg for seg in _archive.read_index(path)
+            if int(seg.get("start", 0)) + int(seg.get("count", 0)) > c["start"] and int(seg.get("start", 0)) < base
+        ]
+
+    # each worker only gets the checkpoints inside its segment
+    seg_cps = []
+    for seg in segs:
+        lo = int(seg.get("start", 0))
+        hi = lo + int(seg.get("count", 0))
+        seg_cps.append({str(p): cps[str(p)] for p in range(lo - lo % CHAIN_EVERY + CHAIN_EVERY, hi + 1, CHAIN_EVERY)
+                        if str(p) in cps})
+
+    workers = workers or min(len(segs), os.cpu_count() or 1)
+    runs = None
+    if workers > 1 and len(segs) > 1:
+        try:
+            with ProcessPoolExecutor(max_workers=workers) as pool:
+                runs = list(pool.map(_audit_segment, [path] * len(segs), segs, [c["start"]] * len(segs), seg_cps,
+                                     chunksize=max(1, len(segs) // (4 * workers))))
+        except Exception:
+            runs = None  # e.g. no process support here: fall back to one process
+    if runs is None:
+        runs = [_audit_segment(path, seg, c["start"], sc) for seg, sc in zip(segs, seg_cps)]
+
+    hot_pos = max(base, c["start"])
+    hot = (hist[i] for i in range(hot_pos - base, min(len(hist), c["upto"] - base)))
+    first_pos = hot_pos
+    last, bad, first, n = _check_run(hot, hot_pos, None, cps)
+    runs.append((first_pos, first, last, bad, n))
+
+    # link the runs: each run's first entry must follow the previous run's last hash
+    prev, expect, checked, bad = "", c["start"], 0, None
+    for first_pos, first, last, run_bad, n in runs:
+        checked += n
+        if first is None:
+            continue
+        if first_pos != expect or first.get("h") != link(prev, first):
+            bad = first_pos
+            break
+        if run_bad is not None:
+            bad = run_bad
+            break
+        prev, expect = last, first_pos + n
+    if bad is None and (expect != c["upto"] or prev != c["head"]):
+        bad = expect
+    if bad is None:
+        c["verified"] = c["upto"]
+    return _report(c, "full", checked, bad, t0)
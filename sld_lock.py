@@ -0,0 +1,153 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict
+
+try:
+    import fcntl
+except ImportError:  # non-POSIX: cross-process locking degrades to in-process only
+    fcntl = None
+
+
+# ----------------------------
+# Cross-process file locks
+# ----------------------------
+#
+# file_lock(path) takes an exclusive flock on `path + ".lock"`. It is
+# re-entrant per thread, so save_bank can run inside bank.transaction()
+# (which already holds the lock). Threads of one process queue on an
+# in-process lock; the flock itself stays held while any of them, or any
+# retained in-flight write, still needs it. Every acquisition records how long it
+# waited; lock_stats() exposes that so contention shows up as sessions scale.
+
+
+class StaleWriteError(RuntimeError):
+    """Raised when a save would overwrite a newer meta.version on disk."""
+
+
+_local = threading.local()
+_STATS_LOCK = threading.Lock()
+_STATS: Dict[str, dict] = {}
+_PATHS: Dict[str, "_PathLock"] = {}
+
+
+class _PathLock:
+    """
+    Per-store lock state for this process:
+      thread  serializes threads of this process
+      refs    holders of the cross-process flock; the flock is released only
+              when the last ref goes (a thread inside file_lock, or a write
+              that was retained past the end of file_lock).
+    """
+
+    __slots__ = ("thread", "mutex", "refs", "fd")
+
+    def __init__(self):
+        self.thread = threading.Lock()
+        self.mutex = threading.Lock()
+        self.refs = 0
+        self.fd = None
+
+    def acquire_ref(self, lock_path: str) -> None:
+        with self.mutex:
+            if self.refs == 0 and fcntl is not None:
+                folder = os.path.dirname(lock_path) or "."
+                os.makedirs(folder, exist_ok=True)
+                fd = os.open(lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+                fcntl.flock(fd, fcntl.LOCK_EX)
+                self.fd = fd
+            self.refs += 1
+
+    def release_ref(self) -> None:
+        with self.mutex:
+            self.refs -= 1
+            if self.refs == 0 and self.fd is not None:
+                try:
+                    fcntl.flock(self.fd, fcntl.LOCK_UN)
+                finally:
+                    os.close(self.fd)
+                    self.fd = None
+
+
+def _path_lock(lock_path: str) -> _PathLock:
+    with _STATS_LOCK:
+        pl = _PATHS.get(lock_path)
+        if pl is None:
+            pl = _PATHS[lock_path] = _PathLock()
+        return pl
+
+
+def _held() -> dict:
+    held = getattr(_local, "held", None)
+    if held is None:
+        held = _local.held = {}
+    return held
+
+
+def _record(path: str, waited: float) -> None:
+    with _STATS_LOCK:
+        s = _STATS.setdefault(path, {"acquired": 0, "contended": 0, "wait_total_ms": 0.0, "wait_max_ms": 0.0})
+        ms = waited * 1000
+        s["acquired"] += 1
+        s["wait_total_ms"] += ms
+        s["wait_max_ms"] = max(s["wait_max_ms"], ms)
+        if ms >= 1.0:
+            s["contended"] += 1
+
+
+@contextmanager
+def file_lock(path: str):
+    """Exclusive lock for the store at `path` (re-entrant within a thread)."""
+    lock_path = path + ".lock"
+    held = _held()
+    if held.get(lock_path):
+        held[lock_path] += 1
+        try:
+            yield
+        finally:
+            held[lock_path] -= 1
+        return
+
+    pl = _path_lock(lock_path)
+    t0 = time.perf_counter()
+    pl.thread.acquire()
+    try:
+        pl.acquire_ref(lock_path)
+        _record(path, time.perf_counter() - t0)
+        held[lock_path] = 1
+        try:
+            yield
+        finally:
+            held.pop(lock_path, None)
+            pl.release_ref()
+    finally:
+        pl.thread.release()
+
+
+def held(path: str) -> bool:
+    """True if the calling thread is inside file_lock(path)."""
+    return bool(_held().get(path + ".lock"))
+
+
+def retain(path: str) -> None:
+    """
+    Keep the cross-process lock past the end of the current file_lock block
+    (used while a group-committed write is still in flight). Pair with release().
+    """
+    _path_lock(path + ".lock").acquire_ref(path + ".lock")
+
+
+def release(path: str) -> None:
+    _path_lock(path + ".lock").release_ref()
+
+
+def lock_stats() -> Dict[str, dict]:
+    """Per-store lock counters: acquisitions, contended acquisitions, wait ms."""
+    with _STATS_LOCK:
+        return {p: dict(s) for p, s in _STATS.items()}
+
+
+def reset_lock_stats() -> None:
+    with _STATS_LOCK:
+        _STATS.clear()
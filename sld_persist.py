@@ -0,0 +1,491 @@
+import hashlib
+import logging
+import os
+import threading
+import time
+import zlib
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+import sld_serial as _serial
+
+log = logging.getLogger(__name__)
+
+# ----------------------------
+# Shared persistence layer
+# ----------------------------
+#
+# One implementation of "write a JSON store safely" for careon_bank_v2,
+# codes_ledger and user_profile.
+#
+# Durability modes (SLD_DURABILITY, or per call):
+#   none        write tmp + rename; the OS decides when bytes hit disk
+#   fsync-file  fsync the tmp file before the rename (contents survive a crash)
+#   fsync-dir   also fsync the directory after the rename (the rename survives too)
+#
+# Group commit: writes go through a per-file slot. The first writer becomes the
+# leader, optionally waits GROUP_COMMIT_MS for company, then performs one write
+# that covers everything submitted so far:
+#   replace  whole-file snapshots -> only the newest payload is written
+#   append   journal lines        -> all pending lines in one write + one fsync
+# Callers that arrive while a write is in flight simply wait for the next one,
+# so concurrent sessions share fsyncs instead of queueing behind each other.
+
+DURABILITY_MODES = ("none", "fsync-file", "fsync-dir")
+DURABILITY = os.getenv("SLD_DURABILITY", "fsync-file").strip().lower()
+if DURABILITY not in DURABILITY_MODES:
+    DURABILITY = "fsync-file"
+
+# Rotated backups kept per store: .bak (newest), .bak.2, ... .bak.N
+try:
+    BACKUPS = max(1, int(os.getenv("SLD_BACKUPS", "3")))
+except ValueError:
+    BACKUPS = 3
+
+try:
+    GROUP_COMMIT_MS = max(0.0, float(os.getenv("SLD_GROUP_COMMIT_MS", "0")))
+except ValueError:
+    GROUP_COMMIT_MS = 0.0
+
+
+# ----------------------------
+# Reading
+# ----------------------------
+
+def read_json(path: str) -> Optional[dict]:
+    """Return parsed JSON if read succeeds, else None."""
+    try:
+        with open(path, "rb") as f:
+            return _serial.loads(f.read())
+    except Exception:
+        return None
+
+
+# ----------------------------
+# Checksums + generations
+# ----------------------------
+#
+# Every store write also writes `<file>.sum`: {"crc", "size", "schema"} of
+# the bytes it describes (CRC-32: it only has to catch damage, and it is several
+# times cheaper than a cryptographic hash on the cold-load path; sidecars from
+# older saves carry a blake2b "sha" and are still honoured). Backups rotate
+# together with their sidecars, and the sidecar of a new generation is
+# written just before the file itself, so a sidecar only disagrees with its
+# file after real damage or after the file was replaced behind our back.
+#
+# read_verified() walks file, .bak, .bak.2, ... and returns the first
+# generation whose checksum matches, having parsed only that one. A matching
+# checksum + schema means the content is exactly what a save produced, so
+# callers can skip deep normalization. Files without a sidecar (older saves)
+# are parsed and returned as untrusted.
+#
+# A primary that fails its sidecar but was modified after the sidecar was
+# written (hand edit, git pull of a tracked store) is newer than anything the
+# backups hold: if it parses it is kept, untrusted, with a warning, instead of
+# silently rolling back to .bak.
+
+def _digest(payload: bytes) -> str:
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def sum_path(path: str) -> str:
+    return path + ".sum"
+
+
+def generations(path: str) -> List[str]:
+    """The store file followed by its backups, newest first."""
+    return [path, path + ".bak"] + [f"{path}.bak.{k}" for k in range(2, BACKUPS + 1)]
+
+
+def _rotate(path: str) -> None:
+    gens = generations(path)
+    for k in range(len(gens) - 1, 0, -1):
+        src, dst = gens[k - 1], gens[k]
+        if not os.path.exists(src):
+            continue
+        if os.path.exists(sum_path(src)):
+            os.replace(sum_path(src), sum_path(dst))
+        elif os.path.exists(sum_path(dst)):
+            os.remove(sum_path(dst))  # never pair a file with an older sidecar
+        os.replace(src, dst)
+
+
+def read_verified(path: str, schema=None) -> tuple:
+    """
+    (data, trusted) from the newest intact generation of `path`, or
+    (None, False). trusted is True when the sidecar hash (and `schema`, if
+    given) matched.
+    """
+    return read_generation(path, schema)[:2]
+
+
+def _matches(side: dict, raw: bytes) -> bool:
+    if side.get("size") != len(raw):
+        return False
+    if "crc" in side:
+        return side["crc"] == zlib.crc32(raw)
+    return side.get("sha") == _digest(raw)
+
+
+def _edited(gen: str, st: os.stat_result) -> bool:
+    """True if `gen` was modified after its sidecar was written."""
+    try:
+        return st.st_mtime_ns > os.stat(sum_path(gen)).st_mtime_ns
+    except OSError:
+        return False
+
+
+def read_generation(path: str, schema=None) -> tuple:
+    """Like read_verified, plus the generation file it came from (None if nothing parsed)."""
+    damaged = []
+    for gen in generations(path):
+        try:
+            with open(gen, "rb") as f:
+                st = os.fstat(f.fileno())
+                raw = f.read()
+        except OSError:
+            continue
+        side = read_json(sum_path(gen))
+        if isinstance(side, dict):
+            if not _matches(side, raw):
+                if gen == path and _edited(gen, st):
+                    try:
+                        data = _serial.loads(raw)
+                    except Exception:
+                        data = None
+                    if data is not None:
+                        log.warning("%s was changed outside the app (checksum mismatch); "
+                                    "loading it unverified instead of a backup", gen)
+                        with _SLOTS_LOCK:
+                            _STATS["edited"] += 1
+                        return data, False, gen
+                damaged.append((gen, raw))  # caught without parsing
+                with _SLOTS_LOCK:
+                    _STATS["damaged"] += 1
+                continue
+            try:
+                data = _serial.loads(raw)
+            except Exception:
+                continue
+            return data, schema is None or side.get("schema") == schema, gen
+        try:
+            return _serial.loads(raw), False, gen
+        except Exception:
+            continue
+
+    # no intact generation: last resort, anything that still parses
+    for gen, raw in damaged:
+        try:
+            return _serial.loads(raw), False, gen
+        except Exception:
+            pass
+    return None, False, None
+
+
+# ----------------------------
+# Dirty checks
+# ----------------------------
+#
+# Loaders stamp meta["fingerprint"] with a digest of the state they read;
+# save_* compares it with the state being saved and does no I/O (no rewrite,
+# no backup rotation, no last_saved_utc bump) when they match. Each store
+# picks cheap parts that change with every real mutation.
+#
+# The stamp describes one in-memory copy and what is on disk right now, so it
+# never leaves memory: writes and exports go through unstamped(), and imports
+# drop it too, or restoring an export would look "unchanged" and be skipped.
+
+def fingerprint(*parts) -> str:
+    """Short digest of JSON-encodable `parts`."""
+    return _digest(_serial.dumps(parts, default=str))
+
+
+def skip_write() -> None:
+    """Count a save that had nothing to write (see persist_stats)."""
+    with _SLOTS_LOCK:
+        _STATS["skipped"] += 1
+
+
+def unchanged(meta: dict, fp: str) -> bool:
+    """True, counted as a skipped write, if `fp` matches the stamp in `meta`."""
+    if not isinstance(meta, dict) or meta.get("fingerprint") != fp:
+        return False
+    skip_write()
+    return True
+
+
+def unstamped(data):
+    """`data` without meta["fingerprint"] (a shallow copy if it had one)."""
+    meta = data.get("meta") if isinstance(data, dict) else None
+    if isinstance(meta, dict) and "fingerprint" in meta:
+        data = dict(data)
+        data["meta"] = {k: v for k, v in meta.items() if k != "fingerprint"}
+    return data
+
+
+def dumps(data, default: Optional[Callable] = None) -> bytes:
+    """Store encoding: compact JSON (see sld_serial)."""
+    return _serial.dumps(data, default=default)
+
+
+# ----------------------------
+# Low-level writes
+# ----------------------------
+
+def _fsync_dir(folder: str) -> None:
+    try:
+        fd = os.open(folder, os.O_RDONLY)
+    except OSError:
+        return  # e.g. Windows: directories cannot be opened
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def sync_dir(folder: str, durability: Optional[str] = None) -> None:
+    """fsync `folder` if the durability mode asks for it (new or renamed entries survive a crash)."""
+    if (durability or DURABILITY) == "fsync-dir":
+        _fsync_dir(folder)
+
+
+def _write_replace(path: str, payload: bytes, durability: str, backup: bool = True, schema=None) -> None:
+    """
+    Atomic write with backups and checksum sidecar:
+    - writes to .tmp (fsynced unless durability == "none")
+    - rotates file -> .bak -> .bak.2 ... (unless backup=False: plain replace)
+    - writes the new .sum, then replaces final path atomically
+    """
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+
+    tmp = path + ".tmp"
+
+    with open(tmp, "wb") as f:
+        f.write(payload)
+        if durability != "none":
+            f.flush()
+            os.fsync(f.fileno())
+
+    if backup:
+        # rotate generations (best effort)
+        try:
+            _rotate(path)
+        except Exception:
+            pass
+        side = _serial.dumps({"crc": zlib.crc32(payload), "size": len(payload), "schema": schema})
+        with open(tmp + ".sum", "wb") as f:
+            f.write(side)
+        os.replace(tmp + ".sum", sum_path(path))
+
+    # promote tmp -> final
+    os.replace(tmp, path)
+    if durability == "fsync-dir":
+        _fsync_dir(folder)
+
+
+def _complete_len(f, end: int) -> int:
+    """Length of `f` up to and including its last newline."""
+    pos = end
+    while pos > 0:
+        step = min(pos, 65536)
+        f.seek(pos - step)
+        k = f.read(step).rfind(b"\n")
+        if k >= 0:
+            return pos - step + k + 1
+        pos -= step
+    return 0
+
+
+def _write_append(path: str, lines: List[bytes], durability: str) -> None:
+    folder = os.path.dirname(path) or "."
+    os.makedirs(folder, exist_ok=True)
+    created = not os.path.exists(path)
+    with open(path, "a+b") as f:
+        end = f.seek(0, os.SEEK_END)
+        f.seek(max(0, end - 1))
+        if end and f.read(1) != b"\n":
+            # a write cut short by a crash leaves a torn last line; readers stop
+            # there, so appending after it would hide every later line too
+            f.truncate(_complete_len(f, end))
+        f.write(b"".join(lines))
+        if durability != "none":
+            f.flush()
+            os.fsync(f.fileno())
+    if created and durability == "fsync-dir":
+        _fsync_dir(folder)
+
+
+# ----------------------------
+# Group commit
+# ----------------------------
+
+class _Slot:
+    __slots__ = ("cond", "submitted", "written", "busy", "payload", "lines", "callbacks", "failed")
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.submitted = 0
+        self.written = 0
+        self.busy = False
+        self.payload = None   # newest replace payload
+        self.lines = []       # pending append lines
+        self.callbacks = []   # run after the write that covers them
+        self.failed = None    # (upto_gen, exception) of the last failed write
+
+
+_SLOTS_LOCK = threading.Lock()
+_SLOTS: Dict[tuple, _Slot] = {}
+_FILES: Dict[str, threading.Lock] = {}
+_STATS = {"submitted": 0, "writes": 0, "bytes": 0, "damaged": 0, "edited": 0, "skipped": 0}
+
+
+def _slot(path: str, kind: str) -> _Slot:
+    key = (path, kind)
+    with _SLOTS_LOCK:
+        s = _SLOTS.get(key)
+        if s is None:
+            s = _SLOTS[key] = _Slot()
+        return s
+
+
+def _file_mutex(path: str) -> threading.Lock:
+    with _SLOTS_LOCK:
+        m = _FILES.get(path)
+        if m is None:
+            m = _FILES[path] = threading.Lock()
+        return m
+
+
+@contextmanager
+def hold(path: str):
+    """Keep this process's queued writes to `path` out while the caller edits it."""
+    with _file_mutex(path):
+        yield
+
+
+class Ticket:
+    """Handle for a submitted write; pass it to `complete()`."""
+
+    __slots__ = ("path", "kind", "gen", "leader", "durability", "schema")
+
+    def __init__(self, path: str, kind: str, gen: int, leader: bool, durability: str, schema=None):
+        self.path = path
+        self.kind = kind
+        self.gen = gen
+        self.leader = leader
+        self.durability = durability
+        self.schema = schema
+
+
+def submit(path: str, payload: bytes, kind: str = "replace", durability: Optional[str] = None,
+           on_durable: Optional[Callable[[], None]] = None, schema=None) -> Ticket:
+    """
+    Queue a write without blocking. `kind` is "replace" (newest payload wins)
+    or "append" (payload is added to the file). `on_durable` runs once a write
+    covering this payload has completed. `schema` is recorded in the sidecar.
+    """
+    durability = durability or DURABILITY
+    s = _slot(path, kind)
+    with s.cond:
+        s.submitted += 1
+        gen = s.submitted
+        if kind == "append":
+            s.lines.append(payload)
+        else:
+            s.payload = payload
+        if on_durable is not None:
+            s.callbacks.append(on_durable)
+        leader = not s.busy
+        if leader:
+            s.busy = True
+    with _SLOTS_LOCK:
+        _STATS["submitted"] += 1
+    return Ticket(path, kind, gen, leader, durability, schema)
+
+
+def complete(ticket: Ticket) -> None:
+    """Block until the ticket's payload is written (leaders do the writing)."""
+    s = _slot(ticket.path, ticket.kind)
+    if not ticket.leader:
+        with s.cond:
+            while s.written < ticket.gen:
+                if s.failed and s.failed[0] >= ticket.gen:
+                    raise s.failed[1]
+                if not s.busy:
+                    # previous leader failed before reaching us: take over
+                    s.busy = True
+                    ticket.leader = True
+                    break
+                s.cond.wait()
+        if not ticket.leader:
+            return
+
+    if GROUP_COMMIT_MS:
+        time.sleep(GROUP_COMMIT_MS / 1000.0)
+
+    while True:
+        with s.cond:
+            upto = s.submitted
+            payload, s.payload = s.payload, None
+            lines, s.lines = s.lines, []
+            callbacks, s.callbacks = s.callbacks, []
+        try:
+            with _file_mutex(ticket.path):
+                if ticket.kind == "append":
+                    if lines:
+                        _write_append(ticket.path, lines, ticket.durability)
+                    size = sum(len(x) for x in lines)
+                else:
+                    if payload is not None:
+                        _write_replace(ticket.path, payload, ticket.durability, schema=ticket.schema)
+                    size = len(payload or b"")
+        except Exception as e:
+            with s.cond:
+                s.failed = (upto, e)
+                s.busy = False
+                s.cond.notify_all()
+            raise
+
+        for cb in callbacks:
+            try:
+                cb()
+            except Exception:
+                pass
+
+        with _SLOTS_LOCK:
+            _STATS["writes"] += 1
+            _STATS["bytes"] += size
+        with s.cond:
+            s.written = upto
+            s.cond.notify_all()
+            if s.submitted == upto:
+                s.busy = False
+                return
+
+
+def atomic_save_json(data, path: str, durability: Optional[str] = None,
+                     default: Optional[Callable] = None) -> None:
+    """Serialize and write `data` to `path` (tmp + backup rotation + sidecar + rename)."""
+    schema = (data.get("meta") or {}).get("schema") if isinstance(data, dict) else None
+    complete(submit(path, dumps(unstamped(data), default=default), "replace", durability, schema=schema))
+
+
+def replace_bytes(path: str, payload: bytes, durability: Optional[str] = None) -> None:
+    """Atomic rewrite without .bak rotation (for derived files such as journals)."""
+    _write_replace(path, payload, durability or DURABILITY, backup=False)
+
+
+def append_line(path: str, line: bytes, durability: Optional[str] = None) -> None:
+    complete(submit(path, line, "append", durability))
+
+
+def persist_stats() -> dict:
+    """
+    submitted saves vs physical writes (the difference was coalesced), plus
+    saves skipped by the dirty check and damaged generations seen on read.
+    """
+    with _SLOTS_LOCK:
+        out = dict(_STATS)
+    out["coalesced"] = out["submitted"] - out["writes"]
+    return out
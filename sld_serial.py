@@ -0,0 +1,75 @@
+import json
+import os
+from typing import Callable, Optional
+
+try:
+    import orjson
+except ImportError:  # optional fast path
+    orjson = None
+
+try:
+    import ujson
+except ImportError:  # optional fast path
+    ujson = None
+
+
+# ----------------------------
+# JSON serializer layer
+# ----------------------------
+#
+# Stores are written compactly (no indentation, "," / ":" separators);
+# pretty=True is meant for human-facing exports only. The encoder is
+# picked once at import:
+#   orjson  if installed (fastest, returns bytes)
+#   ujson   if installed
+#   stdlib  otherwise
+# SLD_JSON_ENCODER=stdlib|ujson|orjson forces a choice (when available).
+# Anything a fast encoder rejects (huge ints, non-str keys, ...) falls back
+# to stdlib, so output never depends on which encoder is installed.
+
+def _pick_encoder() -> str:
+    want = os.getenv("SLD_JSON_ENCODER", "").strip().lower()
+    available = [name for name, mod in (("orjson", orjson), ("ujson", ujson)) if mod is not None]
+    available.append("stdlib")
+    if want in available:
+        return want
+    return available[0]
+
+
+ENCODER = _pick_encoder()
+
+
+def _stdlib_dumps(obj, pretty: bool, default: Optional[Callable]) -> bytes:
+    if pretty:
+        text = json.dumps(obj, indent=2, ensure_ascii=False, default=default)
+    else:
+        text = json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=default)
+    return text.encode("utf-8")
+
+
+def dumps(obj, pretty: bool = False, default: Optional[Callable] = None) -> bytes:
+    """Encode `obj` as UTF-8 JSON bytes (compact unless pretty=True)."""
+    try:
+        if ENCODER == "orjson":
+            return orjson.dumps(obj, default=default, option=orjson.OPT_INDENT_2 if pretty else 0)
+        if ENCODER == "ujson" and default is None:
+            return ujson.dumps(
+                obj, ensure_ascii=False, escape_forward_slashes=False, indent=2 if pretty else 0
+            ).encode("utf-8")
+    except (TypeError, OverflowError, ValueError):
+        pass
+    return _stdlib_dumps(obj, pretty, default)
+
+
+def dumps_str(obj, pretty: bool = False, default: Optional[Callable] = None) -> str:
+    return dumps(obj, pretty=pretty, default=default).decode("utf-8")
+
+
+def loads(data):
+    """Decode JSON from str or bytes."""
+    if ENCODER == "orjson":
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass  # let stdlib decide (e.g. NaN/Infinity literals)
+    return json.loads(data)
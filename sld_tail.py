@@ -0,0 +1,304 @@
+import itertools
+import mmap
+import os
+import struct
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+import sld_serial as _serial
+
+
+# ----------------------------
+# Tail-readable history mirror
+# ----------------------------
+#
+# A derived, append-only copy of the newest bank history, laid out so the
+# last N entries can be read without parsing the bank:
+#
+#   <path>.tail       header + compact JSON records, back to back
+#   <path>.tail.idx   header + one fixed-size record per entry:
+#                     (absolute position, data offset, length, type code)
+#
+#   <path>.tail.typed compact JSON: for rare types (phrases), the newest
+#                     entries that are older than the first entry in .tail
+#
+# Readers mmap both files, walk the index backwards and decode only the
+# records they return. Both headers carry a generation number; a rebuild
+# bumps it, so a reader that catches the files mid-rebuild sees a mismatch
+# and falls back to the bank. Nothing here is fsynced: the bank stays the
+# source of truth and the tail is repaired from it on the next save.
+#
+# .tail only reaches back 1-2x `keep` entries, which may hold no phrase at
+# all. The typed file keeps the last TYPED_KEEP entries of each TYPED kind
+# from before that window ("upto" = first position .tail covers). It is
+# rewritten only when .tail rolls over, with the new generation, so readers
+# check it like the two headers.
+
+_MAGIC = b"SLDTAIL1"
+_HEADER = struct.Struct("<8sQ")       # magic, generation
+_REC = struct.Struct("<qQIB3x")       # pos, offset, length, type code
+
+TYPE_CODES = {"earn": 1, "spend": 2, "fund": 3, "phrase": 4, "admin": 5}
+_CODE_AT = struct.calcsize("<qQI")    # offset of the type code in a record
+
+TYPED = ("phrase",)
+TYPED_KEEP = 64
+
+
+def _paths(path: str) -> tuple:
+    return path + ".tail", path + ".tail.idx"
+
+
+def _typed_path(path: str) -> str:
+    return path + ".tail.typed"
+
+
+def _type_code(tx: dict) -> int:
+    return TYPE_CODES.get(str(tx.get("type", "")), 0)
+
+
+def _state(path: str) -> Optional[tuple]:
+    """(generation, first pos, entry count, data end) or None if unusable."""
+    dpath, ipath = _paths(path)
+    try:
+        with open(dpath, "rb") as d, open(ipath, "rb") as i:
+            dh, ih = d.read(_HEADER.size), i.read(_HEADER.size)
+            if len(dh) < _HEADER.size or len(ih) < _HEADER.size:
+                return None
+            dmagic, dgen = _HEADER.unpack(dh)
+            imagic, igen = _HEADER.unpack(ih)
+            if dmagic != _MAGIC or imagic != _MAGIC or dgen != igen:
+                return None
+            n = (os.fstat(i.fileno()).st_size - _HEADER.size) // _REC.size
+            if n == 0:
+                return dgen, None, 0, _HEADER.size
+            first = _REC.unpack(i.read(_REC.size))[0]
+            i.seek(_HEADER.size + (n - 1) * _REC.size)
+            _, off, ln, _ = _REC.unpack(i.read(_REC.size))
+            return dgen, first, n, off + ln
+    except (OSError, struct.error):
+        return None
+
+
+def _encode(txs: Iterable[dict], pos: int, offset: int) -> tuple:
+    data, idx = [], []
+    for tx in txs:
+        blob = _serial.dumps(tx)
+        data.append(blob)
+        idx.append(_REC.pack(pos, offset, len(blob), _type_code(tx)))
+        pos += 1
+        offset += len(blob)
+    return b"".join(data), b"".join(idx)
+
+
+def _load_typed(path: str, gen: int, first: Optional[int], end: Optional[int]) -> Optional[dict]:
+    """The typed tail if it belongs to generation `gen` and first <= upto <= end."""
+    try:
+        with open(_typed_path(path), "rb") as f:
+            t = _serial.loads(f.read())
+    except (OSError, ValueError):
+        return None
+    if not isinstance(t, dict) or t.get("gen") != gen or not isinstance(t.get("kinds"), dict):
+        return None
+    if any(not isinstance(t["kinds"].get(kind), dict) for kind in TYPED):
+        return None
+    upto = t.get("upto")
+    if first is not None and not (isinstance(upto, int) and first <= upto <= end):
+        return None
+    return t
+
+
+def _write_typed(path: str, typed: dict) -> None:
+    target = _typed_path(path)
+    tmp = target + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(_serial.dumps(typed))
+    os.replace(tmp, target)
+
+
+def _add_typed(typed: dict, found: Dict[str, List[dict]]) -> None:
+    """Append `found` (oldest first) to each kind, keeping the newest TYPED_KEEP."""
+    for kind, txs in found.items():
+        slot = typed["kinds"][kind]
+        items = slot.get("items", []) + txs
+        if len(items) > TYPED_KEEP:
+            items = items[-TYPED_KEEP:]
+            slot["more"] = True
+        slot["items"] = items
+
+
+def _tail_entries(path: str, first: int, lo: int, hi: int, codes: dict) -> Dict[str, List[dict]]:
+    """Entries lo <= pos < hi of .tail whose type code is in `codes`, by kind."""
+    found = {kind: [] for kind in codes.values()}
+    if hi <= lo:
+        return found
+    dpath, ipath = _paths(path)
+    with open(dpath, "rb") as d, open(ipath, "rb") as i:
+        i.seek(_HEADER.size + (lo - first) * _REC.size)
+        for _, off, ln, code in _REC.iter_unpack(i.read((hi - lo) * _REC.size)):
+            if code in codes:
+                d.seek(off)
+                found[codes[code]].append(_serial.loads(d.read(ln)))
+    return found
+
+
+def _hot_entries(hot: Sequence[dict], base: int, lo: int, hi: int) -> Dict[str, List[dict]]:
+    found = {kind: [] for kind in TYPED}
+    # a TxLog answers types without decoding entries
+    type_at = getattr(hot, "type_at", None) or (lambda i: hot[i].get("type") if isinstance(hot[i], dict) else None)
+    for i in range(max(lo, base) - base, max(hi, base) - base):
+        kind = type_at(i)
+        if kind in found:
+            found[kind].append(hot[i])
+    return found
+
+
+def _fresh_typed(hot: Sequence[dict], base: int, upto: int, gen: int, older: Optional[Callable]) -> dict:
+    """Typed tail built from hot[:upto - base], topped up from `older` (archived, newest first)."""
+    typed = {"gen": gen, "upto": upto, "kinds": {kind: {"items": [], "more": False} for kind in TYPED}}
+    _add_typed(typed, _hot_entries(hot, base, base, upto))
+    for kind in TYPED:
+        slot = typed["kinds"][kind]
+        need = TYPED_KEEP - len(slot["items"])
+        if need > 0 and base > 0:
+            if older is None:
+                slot["more"] = True
+                continue
+            got = list(itertools.islice(older(kind), need + 1))
+            slot["more"] = len(got) > need
+            slot["items"] = got[:need][::-1] + slot["items"]
+    return typed
+
+
+def _rebuild(path: str, txs: Sequence[dict], first: int, gen: int) -> None:
+    dpath, ipath = _paths(path)
+    header = _HEADER.pack(_MAGIC, gen)
+    data, idx = _encode(txs, first, _HEADER.size)
+    for target, blob in ((dpath, header + data), (ipath, header + idx)):
+        tmp = target + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(blob)
+        os.replace(tmp, target)
+
+
+def sync(path: str, hot: Sequence[dict], base: int, persisted: int, keep: int,
+         older: Optional[Callable] = None) -> None:
+    """
+    Bring the tail in line with a bank whose hot history `hot` starts at
+    absolute position `base`. Entries past `persisted` that the tail holds
+    from an earlier, failed save are dropped first. `older(kind)` yields
+    archived entries of `kind`, newest first; it is only called when the
+    tail is rebuilt from scratch. Call under the bank lock.
+    """
+    total = base + len(hot)
+    st = _state(path)
+    if st is not None:
+        gen, first, n, data_end = st
+        end = (first + n) if n else None
+        if end is not None and end > persisted:
+            # drop entries the bank never persisted
+            keep_n = max(0, persisted - first)
+            dpath, ipath = _paths(path)
+            with open(ipath, "r+b") as i:
+                if keep_n < n:
+                    i.seek(_HEADER.size + keep_n * _REC.size)
+                    cut = _REC.unpack(i.read(_REC.size))[1]
+                    i.truncate(_HEADER.size + keep_n * _REC.size)
+                    os.truncate(dpath, cut)
+                    n, data_end = keep_n, cut
+            end = first + n if n else None
+        if n == 0:
+            end = None
+        typed = _load_typed(path, gen, first, end) if end is not None else None
+        if typed is not None and base <= end <= total:
+            if (end - first) < 2 * keep:
+                if end < total:
+                    data, idx = _encode(hot[end - base:], end, data_end)
+                    dpath, ipath = _paths(path)
+                    with open(dpath, "ab") as d:
+                        d.write(data)
+                    with open(ipath, "ab") as i:
+                        i.write(idx)
+                return
+            # roll over: move the typed entries .tail is about to drop
+            start = max(0, len(hot) - keep)
+            upto = base + start
+            codes = {TYPE_CODES[kind]: kind for kind in TYPED}
+            _add_typed(typed, _tail_entries(path, first, typed["upto"], min(base, upto), codes))
+            _add_typed(typed, _hot_entries(hot, base, typed["upto"], upto))
+            typed.update(gen=gen + 1, upto=upto)
+            _write_typed(path, typed)
+            _rebuild(path, hot[start:], upto, gen + 1)
+            return
+        next_gen = gen + 1
+    else:
+        next_gen = 1
+
+    start = max(0, len(hot) - keep)
+    _write_typed(path, _fresh_typed(hot, base, base + start, next_gen, older))
+    _rebuild(path, hot[start:], base + start, next_gen)
+
+
+def read_last(path: str, n: int, types: Optional[Iterable[str]] = None) -> Optional[List[dict]]:
+    """
+    Last `n` entries (only those of `types` if given), oldest first, or None
+    when the tail is missing/inconsistent and the caller should use the bank.
+    """
+    want = None
+    if types is not None:
+        want = set()
+        for t in types:
+            if t not in TYPE_CODES:
+                return None  # not indexed: let the caller scan the bank
+            want.add(TYPE_CODES[t])
+    kind = next((k for k in TYPED if want == {TYPE_CODES[k]}), None)
+    n = max(0, int(n))
+
+    dpath, ipath = _paths(path)
+    try:
+        with open(dpath, "rb") as d, open(ipath, "rb") as i:
+            dsize, isize = os.fstat(d.fileno()).st_size, os.fstat(i.fileno()).st_size
+            if dsize < _HEADER.size or isize < _HEADER.size:
+                return None
+            with mmap.mmap(d.fileno(), 0, access=mmap.ACCESS_READ) as dm, \
+                    mmap.mmap(i.fileno(), 0, access=mmap.ACCESS_READ) as im:
+                dmagic, dgen = _HEADER.unpack_from(dm, 0)
+                imagic, igen = _HEADER.unpack_from(im, 0)
+                if dmagic != _MAGIC or imagic != _MAGIC or dgen != igen:
+                    return None
+                k = (isize - _HEADER.size) // _REC.size
+                first = _REC.unpack_from(im, _HEADER.size)[0] if k else None
+                typed = None
+                if kind is not None:
+                    typed = _load_typed(path, dgen, first, None if first is None else first + k)
+                    if typed is None:
+                        return None
+                # type codes of all records, one byte each: cheap to skip over
+                codes = im[_HEADER.size + _CODE_AT:_HEADER.size + k * _REC.size:_REC.size] if want else None
+                one = bytes(want) if want and len(want) == 1 else None
+                out = []
+                while k > 0 and len(out) < n:
+                    if one is not None:
+                        k = max(0, codes.rfind(one, 0, k))
+                        if codes[k] != one[0]:
+                            break
+                    else:
+                        k -= 1
+                        if codes is not None and codes[k] not in want:
+                            continue
+                    _, off, ln, _ = _REC.unpack_from(im, _HEADER.size + k * _REC.size)
+                    if off + ln > dsize:
+                        return None
+                    out.append(_serial.loads(dm[off:off + ln]))
+                if typed is not None:
+                    slot = typed["kinds"][kind]
+                    need = n - len(out)
+                    if need > 0:
+                        out.extend(reversed(slot["items"][-need:]))
+                        if len(out) < n and slot.get("more"):
+                            return None  # older entries exist only in the bank
+                elif len(out) < n and k == 0 and first:
+                    return None  # older entries exist only in the bank
+    except (OSError, ValueError, struct.error):
+        return None
+    out.reverse()
+    return out
@@ -0,0 +1,113 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict
+
+
+# ----------------------------
+# Token-bucket throttling
+# ----------------------------
+#
+# In-memory rate limits for this process (Streamlit sessions share it, the
+# app script itself is re-run per interaction, so limiters live here and are
+# fetched by name with limiter()). Each key (a session id, a username, ...)
+# gets a bucket holding up to `burst` tokens that refills at `rate` tokens
+# per second; an attempt takes one token from every key it names, or from
+# none of them when any bucket is empty.
+#
+# Buckets are kept in least-recently-used order. One untouched for `ttl`
+# seconds has refilled completely, so dropping it changes nothing; that
+# sweep runs on every call from the cold end and costs O(evicted). max_keys
+# bounds memory when someone rotates keys to dodge the limit.
+
+class Throttle:
+    def __init__(self, rate: float, burst: float, ttl: float = 600.0, max_keys: int = 100_000,
+                 clock: Callable[[], float] = time.monotonic):
+        if rate <= 0 or burst < 1:
+            raise ValueError("rate must be positive and burst at least 1")
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self.ttl = max(float(ttl), self.burst / self.rate)  # never evict a bucket that is still refilling
+        self.max_keys = max(1, int(max_keys))
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._buckets: "OrderedDict[str, list]" = OrderedDict()  # key -> [tokens, last update]
+        self._stats = {"allowed": 0, "rejected": 0, "evicted": 0}
+        self._rejected_by: Dict[str, int] = {}
+
+    def _evict(self, now: float) -> None:
+        buckets = self._buckets
+        while buckets:
+            key, (_, last) = next(iter(buckets.items()))
+            if now - last < self.ttl and len(buckets) < self.max_keys:
+                break
+            del buckets[key]
+            self._stats["evicted"] += 1
+
+    def _bucket(self, key: str, now: float) -> list:
+        b = self._buckets.get(key)
+        if b is None:
+            b = self._buckets[key] = [self.burst, now]
+        else:
+            b[0] = min(self.burst, b[0] + (now - b[1]) * self.rate)
+            b[1] = now
+            self._buckets.move_to_end(key)
+        return b
+
+    def allow(self, *keys: str, cost: float = 1.0) -> bool:
+        """Take `cost` tokens from every key's bucket; False (nothing taken) if any is short."""
+        keys = [k for k in keys if k]
+        with self._lock:
+            now = self._clock()
+            self._evict(now)
+            buckets = [(k, self._bucket(k, now)) for k in keys]
+            short = [k for k, b in buckets if b[0] < cost]
+            if short:
+                self._stats["rejected"] += 1
+                for k in short:
+                    kind = k.split(":", 1)[0]
+                    self._rejected_by[kind] = self._rejected_by.get(kind, 0) + 1
+                return False
+            for _, b in buckets:
+                b[0] -= cost
+            self._stats["allowed"] += 1
+            return True
+
+    def retry_after(self, *keys: str, cost: float = 1.0) -> float:
+        """Seconds until allow(*keys) could succeed (0 if it could now)."""
+        with self._lock:
+            now = self._clock()
+            wait = 0.0
+            for k in keys:
+                b = self._buckets.get(k) if k else None
+                if b is not None:
+                    tokens = min(self.burst, b[0] + (now - b[1]) * self.rate)
+                    wait = max(wait, (cost - tokens) / self.rate)
+            return max(0.0, wait)
+
+    def stats(self) -> dict:
+        """allowed / rejected / evicted counts, live buckets, rejections per key kind ("session", "user", ...)."""
+        with self._lock:
+            out = dict(self._stats)
+            out["keys"] = len(self._buckets)
+            out["rejected_by"] = dict(self._rejected_by)
+            return out
+
+
+_REGISTRY_LOCK = threading.Lock()
+_REGISTRY: Dict[str, Throttle] = {}
+
+
+def limiter(name: str, rate: float, burst: float, ttl: float = 600.0, max_keys: int = 100_000) -> Throttle:
+    """The process-wide Throttle called `name`, created with these settings on first use."""
+    with _REGISTRY_LOCK:
+        t = _REGISTRY.get(name)
+        if t is None:
+            t = _REGISTRY[name] = Throttle(rate, burst, ttl=ttl, max_keys=max_keys)
+        return t
+
+
+def throttle_stats() -> Dict[str, dict]:
+    with _REGISTRY_LOCK:
+        items = list(_REGISTRY.items())
+    return {name: t.stats() for name, t in items}
@@ -1,10 +1,16 @@
 import os
 import random
+import uuid
 from datetime import datetime
 
 import streamlit as st
 
 import careon_bank_v2 as bank
+import careon_bank_replay as bank_replay
+import sld_bloom as bloom
+import sld_lock as locks
+import sld_persist as persist
+import sld_throttle as throttle
 import user_profile as profile
 
 import ui_header
@@ -39,8 +45,19 @@ st.set_page_config(page_title="Starlight Deck", layout="centered")
 # PATHS
 # -------------------------
 HERE = os.path.dirname(os.path.abspath(__file__))
-BANK_PATH = os.path.join(HERE, "careon_bank_v2.json")
+SHARED_BANK_PATH = os.path.join(HERE, "careon_bank_v2.json")
+BANK_PATH = SHARED_BANK_PATH
+if bank.SHARDED:
+    # one bank file per account; the network fund stays shared. Shards start
+    # empty, so neither a new name nor a new session is worth anything by itself
+    _uid = st.session_state.get("username_input") or st.session_state.get("username")
+    if not _uid:
+        # anonymous visitors get a bank per browser session, not one shared "guest" bank
+        _uid = st.session_state.setdefault("guest_id", "guest-" + uuid.uuid4().hex[:12])
+    BANK_PATH = bank.user_bank_path(SHARED_BANK_PATH, _uid)
 PROFILE_PATH = os.path.join(HERE, "user_profile.json")
+# minted code batches are live credit: keep them out of the repo checkout
+MINT_DIR = os.path.expanduser(os.getenv("SLD_MINT_DIR", "~/.starlightdeck/minted"))
 LEDGER_PATH = os.path.join(HERE, "codes_ledger.json")
 
 pid = st.session_state.get("sfx_play_id")
@@ -58,8 +75,7 @@ MODEL_NAME = "gemini-2.0-flash"
 # -------------------------
 # ENSURE BANK FILE EXISTS
 # -------------------------
-b_init = bank.load_bank(BANK_PATH)
-bank.save_bank(b_init, BANK_PATH)
+b_init = bank.ensure_bank_exists(BANK_PATH)
 
 import base64
 import os
@@ -176,11 +192,8 @@ def get_admin_secret() -> str | None:
 
 
 def recent_txs(b: dict, keep: int = 12) -> list:
-    """Bank history is a list; return last `keep` entries safely."""
-    hist = b.get("history", []) or []
-    if not isinstance(hist, list):
-        return []
-    return hist[-keep:]
+    """Return last `keep` history entries (works for list or TxLog history)."""
+    return bank.recent_txs(b, keep)
 
 
 def fmt_tx(tx) -> str:
@@ -210,15 +223,33 @@ def deposit_into_bank(amount: int, note: str) -> None:
     network_cut = amount // 20  # 5%
     user_amount = amount - network_cut
 
-    b = bank.load_bank(BANK_PATH)
-    b["balance"] = int(b.get("balance", 0)) + user_amount
-    b["sld_network_fund"] = int(b.get("sld_network_fund", 0)) + network_cut
+    with bank.transaction(BANK_PATH) as b:
+        bank.fund(b, network_cut, f"{note} (network)")
+        bank.earn(b, user_amount, f"{note} (user)")
 
-    b.setdefault("history", [])
-    b["history"].append({"ts": now_z(), "type": "fund", "amount": network_cut, "note": f"{note} (network)"})
-    b["history"].append({"ts": now_z(), "type": "earn", "amount": user_amount, "note": f"{note} (user)"})
 
-    bank.save_bank(b, BANK_PATH)
+# Redeem attempts per browser session: a burst of 5, then one every 10 s
+# (shared by the Deposit Codes box and the market). The key is an id kept in
+# server-side session state. Usernames are typed in, not authenticated, so
+# keying on them would let anyone drain another player's bucket.
+REDEEM_THROTTLE = throttle.limiter("redeem", rate=0.1, burst=5)
+
+
+def _redeem_keys() -> tuple:
+    sid = st.session_state.setdefault("throttle_sid", uuid.uuid4().hex)
+    return (f"session:{sid}",)
+
+
+def redeem_deposit_code(code: str) -> tuple:
+    """Redeem a deposit code and deposit its value (95/5). Returns (ok, message, amount)."""
+    keys = _redeem_keys()
+    if not REDEEM_THROTTLE.allow(*keys):
+        wait = REDEEM_THROTTLE.retry_after(*keys)
+        return False, f"Too many redeem attempts. Try again in {int(wait) + 1} s.", 0
+    ok, msg, amt = codes_ledger.redeem_at(LEDGER_PATH, code, redeemed_by="web")
+    if ok:
+        deposit_into_bank(amt, f"redeemed {(code or '').strip().upper()}")
+    return ok, msg, amt
 
 
 def rapid_zenith_roll(trials: int = 20, chance: float = 0.05) -> bool:
@@ -228,10 +259,9 @@ def rapid_zenith_roll(trials: int = 20, chance: float = 0.05) -> bool:
 # -------------------------
 # BUILD TICKER PHRASES (from bank history)
 # -------------------------
-b_for_ticker = bank.load_bank(BANK_PATH)
 phrases = []
 
-for tx in reversed(b_for_ticker.get("history", []) or []):
+for tx in reversed(bank.tail_phrases(BANK_PATH, keep=12)):
     if isinstance(tx, dict) and tx.get("type") == "phrase":
         meta = tx.get("meta") or {}
         msg = (meta.get("msg") or "").strip()
@@ -239,8 +269,6 @@ for tx in reversed(b_for_ticker.get("history", []) or []):
         if msg:
             label = f"{usr.upper()}: {msg}" if usr else msg
             phrases.append(label)
-    if len(phrases) >= 12:
-        break
 
 
 # -------------------------
@@ -251,7 +279,7 @@ import vip_status
 
 ui_header.render_header(ticker_items=phrases)
 careon_bubble.render_bubble()
-careon_market.render_market(bank, BANK_PATH)
+careon_market.render_market(bank, BANK_PATH, redeem=redeem_deposit_code)
 
 # Audio controls (floating bottom-right)
 audio_ambience.render_audio_controls()
@@ -285,7 +313,7 @@ else:
 # COMMUNITY GOAL + BALANCE (clean, single instance)
 # -------------------------
 b_goal = bank.load_bank(BANK_PATH)
-current_fund = int(b_goal.get("sld_network_fund", 0) or 0)
+current_fund = bank.network_fund(SHARED_BANK_PATH)
 balance_now = int(b_goal.get("balance", 0) or 0)
 
 progress_pct = 0
@@ -411,17 +439,60 @@ with st.sidebar:
         st.session_state["admin_ok"] = False
 
     if st.session_state.get("admin_ok"):
+        st.markdown("---")
+        st.markdown("### Totals")
+        agg = bank.aggregates(bank.load_bank(BANK_PATH), BANK_PATH)
+        st.caption(
+            f"Earned: {agg['sums'].get('earn', 0)} Ȼ • Spent: {agg['sums'].get('spend', 0)} Ȼ • "
+            f"Funded: {agg['sums'].get('fund', 0)} Ȼ • Phrases: {agg['counts'].get('phrase', 0)} • "
+            f"Rounds: {agg['rounds']}"
+        )
+        ps = persist.persist_stats()
+        st.caption(
+            f"Store writes: {ps['writes']} • skipped (unchanged): {ps['skipped']} • "
+            f"coalesced: {ps['coalesced']} • damaged files seen: {ps['damaged']} • "
+            f"edited outside the app: {ps['edited']}"
+        )
+        cs = bank.cache_stats()
+        st.caption(f"Bank cache: {cs['hits']} hits • {cs['misses']} misses (disk reads) • {cs['entries']} banks cached")
+        ls = locks.lock_stats()
+        for label, store in (("Bank", BANK_PATH), ("Ledger", LEDGER_PATH)):
+            row = ls.get(store)
+            if row:
+                st.caption(
+                    f"{label} lock: {row['acquired']} acquisitions • {row['contended']} contended • "
+                    f"wait {row['wait_total_ms'] / row['acquired']:.1f} ms avg, {row['wait_max_ms']:.1f} ms max"
+                )
+        bs = bloom.bloom_stats()
+        st.caption(f"Code filter: {bs['checks']} checks • {bs['rejected']} rejected without a ledger read")
+        rt = REDEEM_THROTTLE.stats()
+        st.caption(
+            f"Redeem throttle: {rt['allowed']} allowed • {rt['rejected']} rejected "
+            f"(session {rt['rejected_by'].get('session', 0)}, user {rt['rejected_by'].get('user', 0)}) • "
+            f"{rt['keys']} active buckets"
+        )
+        if bank.WRITE_BEHIND:
+            wb = bank.write_behind_stats()
+            st.caption(
+                f"Write-behind: {wb['saves']} saves → {wb['writes']} writes • "
+                f"lag {wb['lag_ms']:.0f} ms (max {wb['max_lag_ms']:.0f} ms) • queued {wb['queued']}"
+            )
+
+        if st.button("Verify bank (replay history)", key="admin_replay"):
+            with st.spinner("Replaying history..."):
+                report = bank_replay.replay(BANK_PATH)
+            (st.success if report["ok"] else st.error)("Consistent" if report["ok"] else "Drift detected")
+            st.code(bank_replay.format_report(report))
+
         st.markdown("---")
         st.markdown("### Devtool")
         dev_code = st.text_input("Devtool code", placeholder="TGIF", key="admin_devtool_input")
 
         if st.button("Apply Devtool", key="admin_devtool_apply"):
             if (dev_code or "").strip().upper() == "TGIF":
-                b2 = bank.load_bank(BANK_PATH)
-                bank.award_once_per_round(b2, note="devtool-tgif", amount=5)
-                b2.setdefault("history", [])
-                b2["history"].append({"ts": now_z(), "type": "admin", "amount": 5, "note": "TGIF applied"})
-                bank.save_bank(b2, BANK_PATH)
+                with bank.transaction(BANK_PATH) as b2:
+                    bank.award_once_per_round(b2, note="devtool-tgif", amount=5)
+                    bank.record(b2, "admin", "TGIF applied", amount=5)
                 st.success("TGIF applied: +5 Ȼ")
                 st.rerun()
             else:
@@ -461,17 +532,11 @@ if st.session_state.get("show_phrase_box"):
         if not p:
             st.error("Type a short phrase first.")
         else:
-            b2 = bank.load_bank(BANK_PATH)
-            if bank.spend(b2, 100, note="phrase donation (SLDNF)"):
-                b2.setdefault("history", [])
-                b2["history"].append({
-                    "ts": now_z(),
-                    "type": "phrase",
-                    "amount": 0,
-                    "note": "user phrase",
-                    "meta": {"msg": p, "user": u}
-                })
-                bank.save_bank(b2, BANK_PATH)
+            with bank.transaction(BANK_PATH) as b2:
+                donated = bank.spend(b2, 100, note="phrase donation (SLDNF)")
+                if donated:
+                    bank.record(b2, "phrase", "user phrase", meta={"msg": p, "user": u})
+            if donated:
                 st.session_state["show_phrase_box"] = False
                 st.success("Phrase added. Thank you for donating.")
                 st.rerun()
@@ -488,9 +553,8 @@ st.markdown("### Deposit Codes")
 redeem_code = st.text_input("Redeem code", placeholder="DEP-50-XXXXXX", key="redeem_code_input")
 
 if st.button("Redeem", key="redeem_btn"):
-    ok, msg, amt = codes_ledger.redeem_code(LEDGER_PATH, redeem_code, redeemer="web")
+    ok, msg, amt = redeem_deposit_code(redeem_code)
     if ok:
-        deposit_into_bank(amt, f"redeemed {redeem_code}")
         st.success(f"{msg} +{amt} Ȼ deposited (95/5 split).")
         st.rerun()
     else:
@@ -515,9 +579,38 @@ if st.session_state.get("admin_ok"):
         st.code(new_code)
         st.info("Give this code to a user. It can be redeemed once.")
 
+    st.markdown("#### Bulk mint (promo batch)")
+    bc1, bc2 = st.columns(2)
+    bulk_n = bc1.number_input("How many", min_value=1, max_value=100_000, value=100, step=100, key="bulk_n")
+    bulk_amt = bc2.selectbox("Amount each", [25, 50, 100, 250], index=0, key="bulk_amt")
+    if st.button("Mint batch", key="bulk_mint_btn"):
+        csv_path = os.path.join(MINT_DIR, f"codes-{datetime.utcnow():%Y%m%d-%H%M%S}.csv")
+        try:
+            # saves once and only then moves the CSV into place
+            minted = codes_ledger.mint_codes(
+                codes_ledger.load_ledger(LEDGER_PATH), int(bulk_n), int(bulk_amt),
+                prefix=f"DEP-{int(bulk_amt)}", path=LEDGER_PATH, csv_path=csv_path,
+            )
+        except codes_ledger.StaleWriteError:
+            st.error("The ledger changed while minting. Nothing was saved, try again.")
+        else:
+            st.success(f"Minted {len(minted)} codes → {csv_path}")
+            with open(csv_path, "rb") as f:
+                st.download_button("Download CSV", f.read(), file_name=os.path.basename(csv_path), mime="text/csv", key="bulk_csv_dl")
+
+    if bank.SHARDED:
+        st.markdown("#### Shared bank balance")
+        shared = bank.shared_bank_state(SHARED_BANK_PATH)
+        if shared.get("claimed_by"):
+            st.caption(f"{shared['balance']} Ȼ from the shared bank went to {shared['claimed_by']}.")
+        else:
+            heir = st.text_input("Give it to username", key="shared_claim_user")
+            if st.button(f"Credit {shared['balance']} Ȼ", key="shared_claim_btn") and heir.strip():
+                paid = bank.claim_shared_balance(SHARED_BANK_PATH, heir)
+                st.success(f"Credited {paid} Ȼ to {heir.strip()}.")
+
     st.markdown("#### Community Reward")
-    b_check = bank.load_bank(BANK_PATH)
-    if int(b_check.get("sld_network_fund", 0)) >= GOAL:
+    if bank.network_fund(SHARED_BANK_PATH) >= GOAL:
         if st.button("Generate 20Ȼ Reward Code", key="gen_reward_btn"):
             reward_code = codes_ledger.add_code(LEDGER_PATH, 20)
             st.code(reward_code)
@@ -525,6 +618,17 @@ if st.session_state.get("admin_ok"):
     else:
         st.markdown(f"<div class='muted'>Unlocks at {GOAL} Ȼ network fund.</div>", unsafe_allow_html=True)
 
+    st.markdown("#### Ledger audit")
+    if st.button("Verify ledger history (full)", key="ledger_audit_btn"):
+        chain = codes_ledger.verify_history(codes_ledger.load_ledger(LEDGER_PATH), LEDGER_PATH, full=True)
+        if chain is None:
+            st.info("The SQLite ledger has no hash chain to verify.")
+        elif chain["ok"]:
+            st.success(f"Hash chain intact: {chain['checked']} events, head {chain['head'][:12]}")
+        else:
+            at = chain["bad_at"] if chain["bad_at"] is not None else chain["broken"]
+            st.error(f"Hash chain broken at event #{at}")
+
 st.divider()
 
 
@@ -536,22 +640,21 @@ st.write("Cost: **1 Ȼ** • Experience: **20 cards** • Estrella speaks at **1
 st.write("Draw cards mindfully. Reflect. Build your question.")
 
 if st.button("Start Classic Journey (-1 Ȼ)", key="classic_start_btn"):
-    b = bank.load_bank(BANK_PATH)
-    if b.get("balance", 0) < 1:
+    with bank.transaction(BANK_PATH) as b:
+        charged = b.get("balance", 0) >= 1 and bank.spend(b, 1, note="classic charge")
+    if not charged:
         st.error("Need 1 Ȼ to start Classic Mode.")
     else:
-        if bank.spend(b, 1, note="classic charge"):
-            bank.save_bank(b, BANK_PATH)
-            st.session_state["classic_active"] = True
-            st.session_state["classic_draws"] = 0
-            st.session_state["classic_vibe_counts"] = {"acuity": 0, "valor": 0, "variety": 0}
-            st.session_state["classic_level_counts"] = {1: 0, 2: 0, 3: 0}
-            st.session_state["classic_zenith_count"] = 0
-            st.session_state["classic_last_card"] = None
-            st.session_state["estrella_10_response"] = None
-            st.session_state["estrella_20_response"] = None
-            st.session_state["estrella_final_response"] = None
-            st.rerun()
+        st.session_state["classic_active"] = True
+        st.session_state["classic_draws"] = 0
+        st.session_state["classic_vibe_counts"] = {"acuity": 0, "valor": 0, "variety": 0}
+        st.session_state["classic_level_counts"] = {1: 0, 2: 0, 3: 0}
+        st.session_state["classic_zenith_count"] = 0
+        st.session_state["classic_last_card"] = None
+        st.session_state["estrella_10_response"] = None
+        st.session_state["estrella_20_response"] = None
+        st.session_state["estrella_final_response"] = None
+        st.rerun()
 
 if st.session_state.get("classic_active"):
     draws = int(st.session_state["classic_draws"])
@@ -620,15 +723,13 @@ if st.session_state.get("classic_active"):
 
     if st.session_state["classic_draws"] >= 10 and st.session_state["estrella_10_response"] is None:
         st.session_state["estrella_10_response"] = estrella_checkpoint(10)
-        b_aw = bank.load_bank(BANK_PATH)
-        bank.award_once_per_round(b_aw, note="classic-10-estrella", amount=1)
-        bank.save_bank(b_aw, BANK_PATH)
+        with bank.transaction(BANK_PATH) as b_aw:
+            bank.award_once_per_round(b_aw, note="classic-10-estrella", amount=1)
 
     if st.session_state["classic_draws"] >= 20 and st.session_state["estrella_20_response"] is None:
         st.session_state["estrella_20_response"] = estrella_checkpoint(20)
-        b_aw = bank.load_bank(BANK_PATH)
-        bank.award_once_per_round(b_aw, note="classic-20-estrella", amount=1)
-        bank.save_bank(b_aw, BANK_PATH)
+        with bank.transaction(BANK_PATH) as b_aw:
+            bank.award_once_per_round(b_aw, note="classic-20-estrella", amount=1)
 
     if st.session_state.get("estrella_10_response"):
         st.markdown("### ✨ Estrella ✨")
@@ -656,9 +757,8 @@ if st.session_state.get("classic_active"):
                 try:
                     resp = model.generate_content(prompt)
                     st.session_state["estrella_final_response"] = getattr(resp, "text", "").strip()
-                    b_aw = bank.load_bank(BANK_PATH)
-                    bank.award_once_per_round(b_aw, note="classic-final-q", amount=1)
-                    bank.save_bank(b_aw, BANK_PATH)
+                    with bank.transaction(BANK_PATH) as b_aw:
+                        bank.award_once_per_round(b_aw, note="classic-final-q", amount=1)
                     st.session_state["classic_active"] = False
                     st.success("Journey complete.")
                     st.rerun()
@@ -805,15 +905,10 @@ if mode == "rapid":
         st.rerun()
 
     if run_rapid:
-        b = bank.load_bank(BANK_PATH)
-
-        if b.get("balance", 0) < COST:
-            st.error("Not enough Careons to run Rapid Mode.")
-        else:
+        with bank.transaction(BANK_PATH) as b:
             # Charge cost (ALL spend funds the network inside your bank.spend)
-            if not bank.spend(b, COST, note="rapid charge"):
-                st.error("Not enough Careons to run Rapid Mode.")
-            else:
+            charged = b.get("balance", 0) >= COST and bank.spend(b, COST, note="rapid charge")
+            if charged:
                 # Roll Zeniths across TRIALS
                 zenith_count = sum(1 for _ in range(TRIALS) if random.random() < CHANCE)
 
@@ -827,8 +922,10 @@ if mode == "rapid":
                     bank.award_once_per_round(b, note="rapid-fail-completion", amount=1)
                     st.session_state["rapid_last_result"] = ("FAILURE", estrella_line, zenith_count)
 
-                bank.save_bank(b, BANK_PATH)
-                st.rerun()
+        if not charged:
+            st.error("Not enough Careons to run Rapid Mode.")
+        else:
+            st.rerun()
 
     # ---- Display result ----
     result = st.session_state.get("rapid_last_result")
@@ -866,13 +963,31 @@ st.markdown('<div class="footer">Community-powered • Early test build</div>',
 # -------------------------
 # RECENT ACTIVITY
 # -------------------------
-b_hist = bank.load_bank(BANK_PATH)
-txs = recent_txs(b_hist, keep=12)
+if st.session_state.get("activity_cursor") is None:
+    # first page: read from the tail without parsing the bank
+    txs = list(reversed(bank.tail_txs(BANK_PATH, keep=12)))
+    older_cursor = "first" if len(txs) == 12 else None
+else:
+    txs, older_cursor = bank.txs_page(
+        bank.load_bank(BANK_PATH), BANK_PATH, st.session_state["activity_cursor"], limit=12, newest_first=True
+    )
 
 st.markdown("<div class='cardbox'><b>Recent Activity</b></div>", unsafe_allow_html=True)
 if txs:
-    for tx in reversed(txs):
+    for tx in txs:
         st.markdown(f"<div class='cardbox'>{fmt_tx(tx)}</div>", unsafe_allow_html=True)
+
+    col_new, col_old = st.columns(2)
+    with col_new:
+        if st.session_state.get("activity_cursor") is not None and st.button("Latest", key="activity_latest"):
+            st.session_state["activity_cursor"] = None
+            st.rerun()
+    with col_old:
+        if older_cursor is not None and st.button("Older", key="activity_older"):
+            if older_cursor == "first":
+                _, older_cursor = bank.txs_page(bank.load_bank(BANK_PATH), BANK_PATH, None, limit=12, newest_first=True)
+            st.session_state["activity_cursor"] = older_cursor
+            st.rerun()
 else:
     st.caption("No activity yet. Run Rapid Mode to begin.")
 
@@ -0,0 +1,37 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import careon_bank_v2 as bank  # noqa: E402
+import sld_persist  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def _fast_disk(monkeypatch):
+    # fsyncs only slow the suite down; crash safety is not what these tests check
+    monkeypatch.setattr(sld_persist, "DURABILITY", "none")
+
+
+@pytest.fixture
+def bank_path(tmp_path):
+    path = str(tmp_path / "bank.json")
+    yield path
+    bank.flush(10)
+    bank.clear_cache()
+
+
+@pytest.fixture
+def bank_mode(monkeypatch):
+    """Switch careon_bank_v2 storage modes for one test: bank_mode(journal=True, ...)."""
+    names = {"journal": "JOURNAL_MODE", "write_behind": "WRITE_BEHIND", "tail": "TAIL_MODE",
+             "compact": "COMPACT_HISTORY", "max_history": "MAX_HISTORY", "sharded": "SHARDED"}
+
+    def set_modes(**modes):
+        for k, v in modes.items():
+            monkeypatch.setattr(bank, names[k], v)
+
+    yield set_modes
+    bank.flush(10)
@@ -0,0 +1,69 @@
+import json
+import os
+
+import careon_bank_v2 as bank
+
+
+def _journaled_bank(path, saves=5):
+    bank.ensure_bank_exists(path)
+    for i in range(saves):
+        with bank.transaction(path) as b:
+            bank.earn(b, 10, f"e{i}")
+
+
+def _rewrite_journal(path, edit):
+    jpath = path + ".journal"
+    with open(jpath, encoding="utf-8") as f:
+        recs = [json.loads(line) for line in f]
+    edit(recs)
+    with open(jpath, "w", encoding="utf-8") as f:
+        f.writelines(json.dumps(r) + "\n" for r in recs)
+    bank.clear_cache()
+
+
+def test_replayed_journal_entries_are_verified(bank_path, bank_mode):
+    bank_mode(journal=True)
+    _journaled_bank(bank_path)
+    bank.clear_cache()
+    b = bank.load_bank(bank_path)
+
+    report = bank.verify_history(b, bank_path)
+    assert report["ok"] and report["upto"] == bank.history_len(b) == 5
+    assert bank.verify_history(b, bank_path, full=True)["ok"]
+
+
+def test_tampered_journal_entry_breaks_the_chain(bank_path, bank_mode):
+    bank_mode(journal=True)
+    _journaled_bank(bank_path)
+
+    def inflate(recs):
+        recs[-2]["txs"][0]["amount"] = 1000
+        recs[-2]["balance"] += 990
+
+    _rewrite_journal(bank_path, inflate)
+    b = bank.load_bank(bank_path)
+    assert not bank.verify_history(b, bank_path)["ok"]
+    assert not bank.verify_history(b, bank_path, full=True)["ok"]
+
+
+def test_journal_entry_without_hash_is_not_trusted(bank_path, bank_mode):
+    bank_mode(journal=True)
+    _journaled_bank(bank_path)
+    _rewrite_journal(bank_path, lambda recs: recs[-1]["txs"][0].pop("h"))
+
+    b = bank.load_bank(bank_path)
+    assert not bank.verify_history(b, bank_path)["ok"]
+
+
+def test_tampered_snapshot_entry_breaks_the_chain(bank_path):
+    _journaled_bank(bank_path)
+    with open(bank_path, encoding="utf-8") as f:
+        raw = json.load(f)
+    raw["history"][1]["amount"] = 1000
+    with open(bank_path, "w", encoding="utf-8") as f:
+        json.dump(raw, f)
+    os.remove(bank_path + ".sum")  # as the README says to after a hand edit
+    bank.clear_cache()
+
+    b = bank.load_bank(bank_path)
+    assert not bank.verify_history(b, bank_path, full=True)["ok"]
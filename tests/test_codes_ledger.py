@@ -0,0 +1,126 @@
+import threading
+
+import pytest
+
+import codes_ledger
+import sld_persist
+from sld_lock import StaleWriteError
+
+
+@pytest.fixture
+def ledger_path(tmp_path):
+    return str(tmp_path / "codes_ledger.json")
+
+
+def test_concurrent_redeems_pay_each_code_once(ledger_path):
+    codes = [codes_ledger.add_code(ledger_path, 10) for _ in range(20)]
+    paid = []
+
+    def run():
+        for code in codes:
+            ok, _, value = codes_ledger.redeem_at(ledger_path, code, "player")
+            if ok:
+                paid.append(value)
+
+    ts = [threading.Thread(target=run) for _ in range(4)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+    assert len(paid) == len(codes)
+    ledger = codes_ledger.load_ledger(ledger_path)
+    assert all(codes_ledger.is_redeemed(ledger, c) for c in codes)
+    assert codes_ledger.verify_history(ledger, ledger_path, full=True)["ok"]
+
+
+def test_save_refuses_a_copy_older_than_the_file(ledger_path):
+    codes_ledger.add_code(ledger_path, 10)
+    stale = codes_ledger.load_ledger(ledger_path)
+
+    # another process writes the ledger: the version check must notice it
+    fresh = sld_persist.read_json(ledger_path)
+    fresh["meta"]["version"] += 1
+    sld_persist.atomic_save_json(fresh, ledger_path)
+
+    codes_ledger.mint_code(stale, 5)
+    with pytest.raises(StaleWriteError):
+        codes_ledger.save_ledger(stale, ledger_path)
+
+
+def test_filter_follows_a_restored_ledger(ledger_path):
+    codes_ledger.add_code(ledger_path, 10)
+    older = sld_persist.read_json(ledger_path)
+    codes_ledger.add_code(ledger_path, 10)
+
+    sld_persist.atomic_save_json(older, ledger_path)  # e.g. a backup put back by hand
+    code = codes_ledger.add_code(ledger_path, 10)  # same code count as before the restore
+
+    assert codes_ledger.redeem_at(ledger_path, code, "player")[0]
+    assert not codes_ledger.redeem_at(ledger_path, "SLD-NOPE-NOPE", "player")[0]
+
+
+def test_filter_follows_dropped_entries(ledger_path):
+    first = codes_ledger.add_code(ledger_path, 10)
+    codes_ledger.add_code(ledger_path, 10)
+    raw = sld_persist.read_json(ledger_path)
+    raw["codes"][first] = "damaged"  # dropped by the next load
+    raw["meta"]["version"] += 1
+    sld_persist.atomic_save_json(raw, ledger_path)
+
+    code = codes_ledger.add_code(ledger_path, 10)
+    assert codes_ledger.redeem_at(ledger_path, code, "player")[0]
+
+
+def test_filter_negative_is_not_final_for_another_ledger_version(ledger_path):
+    codes_ledger.add_code(ledger_path, 10)
+    raw = sld_persist.read_json(ledger_path)
+    raw["codes"]["SLD-HAND-MADE"] = dict(next(iter(raw["codes"].values())))
+    raw["meta"]["version"] += 1
+    sld_persist.atomic_save_json(raw, ledger_path)  # written without syncing the filter
+
+    assert codes_ledger.redeem_at(ledger_path, "SLD-HAND-MADE", "player")[0]
+
+
+def test_sqlite_seed_includes_archived_events(ledger_path, monkeypatch):
+    monkeypatch.setattr(codes_ledger, "MAX_HISTORY", 100)
+    for _ in range(3):
+        codes_ledger.update_ledger(ledger_path, lambda l: [codes_ledger.mint_code(l, 5) for _ in range(500)])
+    ledger = codes_ledger.load_ledger(ledger_path)
+    assert ledger["meta"]["archived"] >= 1000
+    events = list(codes_ledger.iter_events(ledger, ledger_path))
+
+    monkeypatch.setattr(codes_ledger, "BACKEND", "sqlite")
+    seeded = codes_ledger.load_ledger(ledger_path)
+    assert list(codes_ledger.iter_events(seeded, ledger_path)) == events
+    assert len(seeded["codes"]) == 1500
+
+
+def test_sqlite_redeem_first_seeds_from_json(ledger_path, monkeypatch):
+    codes = [codes_ledger.add_code(ledger_path, 10) for _ in range(3)]
+
+    monkeypatch.setattr(codes_ledger, "BACKEND", "sqlite")
+    assert codes_ledger.redeem_at(ledger_path, codes[0], "player") == (True, "Code redeemed.", 10)
+    ledger = codes_ledger.load_ledger(ledger_path)
+    assert len(ledger["codes"]) == 3
+    assert codes_ledger.is_redeemed(ledger, codes[0]) and not codes_ledger.is_redeemed(ledger, codes[1])
+
+
+def test_fresh_process_bloom_check_does_not_parse_the_ledger(ledger_path, monkeypatch):
+    code = codes_ledger.add_code(ledger_path, 10)
+    codes_ledger._VERSIONS.clear()  # as in a new process
+
+    parsed = []
+    real = sld_persist.read_generation
+    monkeypatch.setattr(sld_persist, "read_generation", lambda *a, **k: parsed.append(a[0]) or real(*a, **k))
+    assert codes_ledger.redeem_at(ledger_path, "SLD-NOPE-NOPE", "player") == (False, "Invalid code.", 0)
+    assert parsed == []
+
+    # a write that skipped save_ledger changes the signature: the hint is ignored
+    raw = real(ledger_path, schema=1)[0]
+    raw["meta"]["version"] += 1
+    sld_persist.atomic_save_json(raw, ledger_path)
+    codes_ledger._VERSIONS.clear()
+    assert codes_ledger._disk_version(ledger_path) == raw["meta"]["version"]
+    assert parsed
+    assert codes_ledger.redeem_at(ledger_path, code, "player")[0]
@@ -0,0 +1,98 @@
+import careon_bank_v2 as bank
+import sld_archive
+
+
+def _phrases_then_earns(path, phrases, earns):
+    with bank.transaction(path) as b:
+        for i in range(phrases):
+            bank.record(b, "phrase", f"p{i}")
+        for i in range(earns):
+            bank.earn(b, 1, f"e{i}")
+
+
+def test_tail_phrases_reads_only_the_segments_it_needs(bank_path, bank_mode, monkeypatch):
+    bank_mode(max_history=100)
+    _phrases_then_earns(bank_path, 3, 0)
+    for _ in range(5):
+        _phrases_then_earns(bank_path, 0, 1000)
+    _phrases_then_earns(bank_path, 2, 0)
+    assert len(sld_archive.read_index(bank_path)) >= 5
+
+    read = []
+    real = sld_archive.read_segment
+    monkeypatch.setattr(sld_archive, "read_segment", lambda p, seg: read.append(seg["file"]) or real(p, seg))
+
+    assert [tx["note"] for tx in bank.tail_phrases(bank_path, keep=4)] == ["p1", "p2", "p0", "p1"]
+    assert read == ["seg-000001.jsonl.gz"]  # the only segment holding phrases
+
+
+def test_tail_phrases_sqlite_sees_past_the_loaded_window(tmp_path):
+    path = str(tmp_path / "bank.db")
+    _phrases_then_earns(path, 3, 0)
+    _phrases_then_earns(path, 0, 700)
+
+    assert len(bank.load_bank(path)["history"]) < 703
+    assert [tx["note"] for tx in bank.tail_phrases(path, keep=12)] == ["p0", "p1", "p2"]
+
+
+def test_tail_phrases_skips_the_bank_when_phrases_are_rare(bank_path, bank_mode, monkeypatch):
+    import os
+
+    bank_mode(tail=True, max_history=50)
+    notes = []
+    for r in range(24):
+        with bank.transaction(bank_path) as b:
+            if r % 5 == 0:
+                bank.record(b, "phrase", f"p{r}")
+                notes.append(f"p{r}")
+            for i in range(30):
+                bank.earn(b, 1, f"e{r}-{i}")
+    assert bank.load_bank(bank_path)["meta"]["archived"] > 0
+
+    def no_bank(*a, **k):
+        raise AssertionError("tail_phrases fell back to the bank")
+
+    with monkeypatch.context() as m:
+        m.setattr(bank, "load_bank", no_bank)
+        assert [tx["note"] for tx in bank.tail_phrases(bank_path, keep=12)] == notes
+
+    # a tail rebuilt from scratch finds the older phrases in the archive
+    for suffix in (".tail", ".tail.idx", ".tail.typed"):
+        os.remove(bank_path + suffix)
+    with bank.transaction(bank_path) as b:
+        bank.earn(b, 1, "after")
+    monkeypatch.setattr(bank, "load_bank", no_bank)
+    assert [tx["note"] for tx in bank.tail_phrases(bank_path, keep=3)] == notes[-3:]
+
+
+def _entries(k, n):
+    return [{"ts": f"2026-01-01T00:00:{i % 60:02d}Z", "type": "earn", "amount": 1, "note": f"b{k}-{i}"}
+            for i in range(n)]
+
+
+def test_archive_never_overwrites_a_segment(bank_path, monkeypatch):
+    import os
+
+    import sld_persist
+
+    monkeypatch.setattr(sld_persist, "DURABILITY", "fsync-file")
+    synced = []
+    real_fsync = os.fsync
+    monkeypatch.setattr(os, "fsync", lambda fd: synced.append(fd) or real_fsync(fd))
+
+    first = sld_archive.write_segment(bank_path, _entries(1, 5))
+    assert len(synced) == 2  # the segment, then the index
+    folder = sld_archive.archive_dir(bank_path)
+    with open(os.path.join(folder, "seg-000002.jsonl.gz"), "wb") as f:
+        f.write(b"left by a crash before the index write")
+    second = sld_archive.write_segment(bank_path, _entries(2, 5))
+    assert (first["file"], second["file"]) == ("seg-000001.jsonl.gz", "seg-000003.jsonl.gz")
+    assert [e["note"] for e in sld_archive.read_segment(bank_path, second)][:1] == ["b2-0"]
+
+    # an unreadable index must not restart numbering over the old segments
+    with open(os.path.join(folder, "index.json"), "w") as f:
+        f.write("[{")
+    history = _entries(3, 30)
+    assert sld_archive.archive_overflow(history, bank_path, 10, block=10) == 0
+    assert len(history) == 30
+    assert [e["note"] for e in sld_archive.read_segment(bank_path, first)][:1] == ["b1-0"]
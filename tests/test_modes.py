@@ -0,0 +1,111 @@
+import itertools
+import multiprocessing
+import threading
+
+import pytest
+
+import careon_bank_v2 as bank
+import sld_persist
+
+MODES = [dict(zip(("journal", "tail", "compact", "write_behind"), combo))
+         for combo in itertools.product([False, True], repeat=4)]
+
+
+def _mode_id(modes):
+    return "-".join(k for k, on in modes.items() if on) or "plain"
+
+
+@pytest.mark.parametrize("modes", MODES, ids=[_mode_id(m) for m in MODES])
+def test_every_mode_combination_keeps_the_same_history(bank_path, bank_mode, modes):
+    bank_mode(max_history=150, **modes)
+    bank.ensure_bank_exists(bank_path)
+    for r in range(20):
+        with bank.transaction(bank_path) as b:
+            for i in range(20):
+                bank.earn(b, 2, f"e{r}-{i}")
+            assert bank.spend(b, 5, f"s{r}")
+    assert bank.flush(10)
+
+    bank.clear_cache()
+    b = bank.load_bank(bank_path)
+    assert b["balance"] == 25 + 20 * (40 - 5)
+    notes = [tx["note"] for tx in bank.iter_history(b, bank_path)]
+    assert len(notes) == len(set(notes)) == 20 * 21
+    assert notes[-2:] == ["e19-19", "s19"]
+    if not modes["journal"]:  # journal mode only archives when it snapshots
+        assert b["meta"]["archived"] > 0
+    assert bank.verify_history(b, bank_path, full=True)["ok"]
+    assert [tx["note"] for tx in bank.tail_txs(bank_path, keep=3)] == ["e19-18", "e19-19", "s19"]
+
+
+def _earn_in_process(path, journal, threads, per_thread):
+    sld_persist.DURABILITY = "none"
+    bank.JOURNAL_MODE = journal
+    bank.MAX_HISTORY = 150
+
+    def run(tid):
+        for i in range(per_thread):
+            bank.update_bank(path, lambda b: bank.earn(b, 1, f"t{tid}-{i}"), retries=50)
+
+    ts = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+
+@pytest.mark.parametrize("journal", [False, True], ids=["snapshot", "journal"])
+def test_processes_updating_one_bank_lose_nothing(bank_path, bank_mode, journal):
+    bank_mode(journal=journal, max_history=150)
+    bank.ensure_bank_exists(bank_path)
+    procs = [multiprocessing.Process(target=_earn_in_process, args=(bank_path, journal, 3, 40))
+             for _ in range(3)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+
+    bank.clear_cache()
+    b = bank.load_bank(bank_path)
+    assert b["balance"] == 25 + 3 * 3 * 40
+    assert bank.history_len(b) == 3 * 3 * 40
+    assert bank.verify_history(b, bank_path, full=True)["ok"]
+
+
+def test_journal_replays_over_the_snapshot(bank_path, bank_mode):
+    bank_mode(journal=True)
+    bank.ensure_bank_exists(bank_path)
+    for i in range(5):
+        bank.update_bank(bank_path, lambda b: bank.earn(b, 1, f"e{i}"))
+    assert len(open(bank_path + ".journal", "rb").readlines()) == 5
+
+    bank.clear_cache()
+    b = bank.load_bank(bank_path)
+    assert b["balance"] == 30
+    assert [tx["note"] for tx in b["history"]] == [f"e{i}" for i in range(5)]
+
+    bank.compact_journal(bank_path)
+    bank.clear_cache()
+    assert bank.load_bank(bank_path)["balance"] == 30
+    assert bank.verify_history(bank.load_bank(bank_path), bank_path)["ok"]
+
+
+def test_writes_after_a_torn_journal_line_survive(bank_path, bank_mode):
+    bank_mode(journal=True)
+    bank.ensure_bank_exists(bank_path)
+    for i in range(3):
+        bank.update_bank(bank_path, lambda b: bank.earn(b, 1, f"a{i}"))
+    with open(bank_path + ".journal", "ab") as f:
+        f.write(b'{"seq": 4, "txs": [{"ty')  # crash mid-append
+
+    bank.clear_cache()
+    assert bank.load_bank(bank_path)["balance"] == 28
+    for i in range(3):
+        bank.update_bank(bank_path, lambda b: bank.earn(b, 1, f"b{i}"))
+
+    bank.clear_cache()
+    b = bank.load_bank(bank_path)
+    assert b["balance"] == 31
+    assert [tx["note"] for tx in b["history"]][-3:] == ["b0", "b1", "b2"]
+    assert bank.verify_history(b, bank_path)["ok"]
@@ -0,0 +1,56 @@
+import logging
+import os
+import time
+
+import sld_persist
+
+
+def _save_twice(path):
+    sld_persist.atomic_save_json({"meta": {"schema": 1}, "n": 1}, path)
+    sld_persist.atomic_save_json({"meta": {"schema": 1}, "n": 2}, path)  # n=1 -> .bak
+
+
+def test_hand_edited_primary_wins_over_backup(tmp_path, caplog):
+    path = str(tmp_path / "store.json")
+    _save_twice(path)
+    time.sleep(0.01)
+    with open(path, "wb") as f:  # e.g. git pull of the tracked file; .sum left alone
+        f.write(b'{"meta": {"schema": 1}, "n": 3}')
+
+    with caplog.at_level(logging.WARNING, logger="sld_persist"):
+        data, trusted, gen = sld_persist.read_generation(path, schema=1)
+    assert (data["n"], trusted, gen) == (3, False, path)
+    assert "changed outside the app" in caplog.text
+
+
+def test_damage_without_an_edit_falls_back_to_backup(tmp_path):
+    path = str(tmp_path / "store.json")
+    _save_twice(path)
+    st = os.stat(path)
+    with open(path, "r+b") as f:
+        f.seek(st.st_size - 2)
+        f.write(b"9")  # still parses, but not what was saved
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    data, trusted, gen = sld_persist.read_generation(path, schema=1)
+    assert (data["n"], trusted, gen) == (1, True, path + ".bak")
+
+
+def test_edited_primary_that_does_not_parse_falls_back_to_backup(tmp_path):
+    path = str(tmp_path / "store.json")
+    _save_twice(path)
+    time.sleep(0.01)
+    with open(path, "ab") as f:
+        f.write(b"<<<<<<< HEAD")  # merge conflict markers
+
+    assert sld_persist.read_generation(path, schema=1)[0]["n"] == 1
+
+
+def test_blake2b_sidecars_from_older_saves_still_verify(tmp_path):
+    path = str(tmp_path / "store.json")
+    sld_persist.atomic_save_json({"meta": {"schema": 1}, "n": 1}, path)
+    raw = open(path, "rb").read()
+    with open(sld_persist.sum_path(path), "wb") as f:
+        f.write(sld_persist.dumps({"sha": sld_persist._digest(raw), "size": len(raw), "schema": 1}))
+
+    assert sld_persist.read_verified(path, schema=1) == ({"meta": {"schema": 1}, "n": 1}, True)
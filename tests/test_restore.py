@@ -0,0 +1,80 @@
+import json
+
+import pytest
+
+import careon_bank_v2 as bank
+import codes_ledger
+import sld_persist
+import user_profile
+from sld_lock import StaleWriteError
+
+
+def test_restoring_a_profile_export_is_written(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    store = user_profile.load_store(path)
+    user_profile.bump_stat(store, "ann", "wins", 3)
+    user_profile.save_store(store, path)
+    backup = user_profile.export_store_json(user_profile.load_store(path))
+
+    store = user_profile.load_store(path)
+    user_profile.bump_stat(store, "ann", "wins", 10)
+    user_profile.save_store(store, path)
+
+    user_profile.save_store(user_profile.import_store_json(backup), path)
+    assert user_profile.load_store(path)["profiles"]["ann"]["stats"]["wins"] == 3
+
+
+def test_fingerprint_stays_in_memory(bank_path):
+    bank.ensure_bank_exists(bank_path)
+    b = bank.load_bank(bank_path)
+    assert "fingerprint" in b["meta"]
+    assert "fingerprint" not in sld_persist.read_json(bank_path)["meta"]
+    assert "fingerprint" not in json.loads(bank.export_bank_json(b))["meta"]
+
+
+@pytest.mark.parametrize("modes", [{}, {"journal": True}, {"tail": True}, {"write_behind": True}],
+                         ids=["plain", "journal", "tail", "write_behind"])
+def test_restoring_a_bank_export(bank_path, bank_mode, modes):
+    bank_mode(**modes)
+    with bank.transaction(bank_path) as b:
+        bank.earn(b, 10, "before backup")
+    backup = bank.export_bank_json(bank.load_bank(bank_path))
+    for i in range(3):
+        with bank.transaction(bank_path) as b:
+            bank.spend(b, 10, f"after backup {i}")
+
+    restored = bank.import_bank_json(backup)
+    with pytest.raises(StaleWriteError):
+        bank.save_bank(restored, bank_path)
+    bank.save_bank(restored, bank_path, overwrite=True)
+    assert bank.flush(10)
+
+    bank.clear_cache()
+    b = bank.load_bank(bank_path)
+    assert b["balance"] == 35
+    assert [tx["note"] for tx in bank.iter_history(b, bank_path)] == ["before backup"]
+    assert [tx["note"] for tx in bank.tail_txs(bank_path, keep=5)] == ["before backup"]
+    assert bank.verify_history(b, bank_path, full=True)["ok"]
+    with bank.transaction(bank_path) as b:  # and the restored bank carries on normally
+        bank.earn(b, 1, "after restore")
+    assert bank.flush(10)
+    assert bank.write_behind_stats()["errors"] == 0, bank.write_behind_stats()["last_error"]
+    bank.clear_cache()
+    assert bank.load_bank(bank_path)["balance"] == 36
+
+
+def test_restoring_a_ledger_export(tmp_path):
+    path = str(tmp_path / "codes_ledger.json")
+    kept = codes_ledger.add_code(path, 10)
+    backup = codes_ledger.export_ledger_json(codes_ledger.load_ledger(path))
+    codes_ledger.redeem_at(path, kept, "player")
+    codes_ledger.add_code(path, 10)
+
+    restored = codes_ledger.import_ledger_json(backup)
+    with pytest.raises(StaleWriteError):
+        codes_ledger.save_ledger(restored, path)
+    codes_ledger.save_ledger(restored, path, overwrite=True)
+
+    ledger = codes_ledger.load_ledger(path)
+    assert list(ledger["codes"]) == [kept] and not codes_ledger.is_redeemed(ledger, kept)
+    assert codes_ledger.redeem_at(path, kept, "player")[0]
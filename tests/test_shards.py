@@ -0,0 +1,108 @@
+import multiprocessing
+import os
+
+import pytest
+
+import careon_bank_v2 as bank
+import sld_persist
+
+
+def _shared_bank(path, earned, spent):
+    with bank.transaction(path) as b:
+        bank.earn(b, earned, "before sharding")
+        bank.spend(b, spent, "before sharding")
+
+
+def _play(path, user, spend=0, earn=0):
+    with bank.transaction(bank.user_bank_path(path, user)) as b:
+        if earn:
+            bank.earn(b, earn, f"{user} wins")
+        if spend:
+            assert bank.spend(b, spend, f"{user} plays")
+
+
+@pytest.mark.parametrize("backend", ["json", "sqlite"])
+def test_switching_sharding_on_keeps_the_shared_fund_and_balance(bank_path, bank_mode, monkeypatch, backend):
+    monkeypatch.setattr(bank, "BACKEND", backend)
+    _shared_bank(bank_path, 100, 40)  # balance 85, fund 40
+    bank_mode(sharded=True)
+
+    assert bank.network_fund(bank_path) == 40
+    assert bank.claim_shared_balance(bank_path, "alice") == 85
+    assert bank.load_bank(bank.user_bank_path(bank_path, "alice"))["balance"] == 85
+    assert bank.claim_shared_balance(bank_path, "alice") == 0
+    assert bank.claim_shared_balance(bank_path, "bob") == 0
+
+    _play(bank_path, "bob", earn=10, spend=5)
+    _play(bank_path, "alice", spend=7)
+    assert bank.network_fund(bank_path) == 52
+
+
+def test_shards_start_empty(bank_path, bank_mode):
+    bank_mode(sharded=True)
+    guest = bank.user_bank_path(bank_path, "guest-0123456789ab")
+    assert bank.load_bank(guest)["balance"] == 0
+    with bank.transaction(guest) as b:
+        assert not bank.spend(b, 5, "free play")
+    assert bank.network_fund(bank_path) == 0
+
+
+def test_earning_leaves_the_fund_record_alone(bank_path, bank_mode):
+    bank_mode(sharded=True)
+    _play(bank_path, "dave", earn=50, spend=10)
+    assert bank.network_fund(bank_path) == 10
+    fpath = bank.fund_path(bank_path)
+    before = os.stat(fpath).st_mtime_ns
+
+    for _ in range(5):
+        _play(bank_path, "dave", earn=3)
+    assert not os.listdir(bank._pending_dir(bank_path))
+    assert bank.network_fund(bank_path) == 10
+    assert os.stat(fpath).st_mtime_ns == before
+
+
+def test_unfolded_contribution_survives_a_restart(bank_path, bank_mode):
+    bank_mode(sharded=True)
+    assert bank.network_fund(bank_path) == 0
+    _play(bank_path, "carol", earn=20, spend=10)  # marked, not folded yet
+
+    bank.clear_cache()  # a restarted process
+    assert bank.network_fund(bank_path) == 10
+    assert not os.listdir(bank._pending_dir(bank_path))
+
+
+def test_damaged_fund_record_is_rebuilt_and_the_claim_kept(bank_path, bank_mode):
+    _shared_bank(bank_path, 100, 40)
+    bank_mode(sharded=True)
+    assert bank.claim_shared_balance(bank_path, "alice") == 85
+    _play(bank_path, "alice", spend=5)
+    assert bank.network_fund(bank_path) == 45
+
+    with open(bank.fund_path(bank_path), "wb") as f:
+        f.write(b'{"total": 45, "contr')
+    with open(bank._shared_state_path(bank_path), "r+b") as f:
+        f.write(b"#")  # the claim record falls back to its backup
+    assert bank.network_fund(bank_path) == 45
+    assert bank.claim_shared_balance(bank_path, "mallory") == 0
+    assert sld_persist.read_json(bank.fund_path(bank_path))["total"] == 45
+
+
+def _play_in_process(path, user, rounds):
+    sld_persist.DURABILITY = "none"
+    bank.SHARDED = True
+    for i in range(rounds):
+        _play(path, user, earn=2, spend=1)
+        if i % 7 == 0:
+            bank.network_fund(path)  # folds race with other players' saves
+
+
+def test_processes_folding_concurrently_lose_no_contribution(bank_path, bank_mode):
+    bank_mode(sharded=True)
+    procs = [multiprocessing.Process(target=_play_in_process, args=(bank_path, f"u{k % 2}", 40))
+             for k in range(4)]
+    for p in procs:
+        p.start()
+    for p in procs:
+        p.join(60)
+        assert p.exitcode == 0
+    assert bank.network_fund(bank_path) == 4 * 40
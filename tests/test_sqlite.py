@@ -0,0 +1,104 @@
+import sqlite3
+
+import careon_bank_sqlite
+import careon_bank_v2 as bank
+
+
+def _group_by(db):
+    conn = sqlite3.connect(db)
+    try:
+        return {t: (n, s) for t, n, s in conn.execute("SELECT type, COUNT(*), SUM(amount) FROM history GROUP BY type")}
+    finally:
+        conn.close()
+
+
+def _as_pairs(agg):
+    return {t: (n, agg["sums"][t]) for t, n in agg["counts"].items()}
+
+
+def test_aggregates_follow_every_write(tmp_path):
+    db = str(tmp_path / "bank.db")
+    with bank.transaction(db) as b:
+        bank.earn(b, 50, "e")
+        bank.spend(b, 20, "s")
+        bank.record(b, "phrase", "hello")
+    b = bank.load_bank(db)
+    bank.fund(b, 7, "f")
+    b["history"].append({"ts": "2026-01-01T00:00:00Z", "type": "admin", "amount": 3, "note": "by hand"})
+    bank.save_bank(b, db)
+
+    agg = bank.aggregates(bank.load_bank(db), db)
+    assert _as_pairs(agg) == _group_by(db)
+    assert agg["rounds"] == 1 and agg["upto"] == 5
+
+    bank.save_bank(bank.import_bank_json('{"balance": 1, "history": []}'), db)  # replace_bank
+    assert bank.aggregates(bank.load_bank(db), db)["upto"] == 0
+
+
+def test_existing_database_is_backfilled_once(tmp_path):
+    db = str(tmp_path / "old.db")
+    conn = sqlite3.connect(db)
+    conn.executescript(careon_bank_sqlite._SCHEMA)
+    conn.execute("INSERT INTO bank(id, balance, fund) VALUES (1, 25, 0)")
+    conn.executemany("INSERT INTO history(ts, type, amount, note) VALUES ('t', ?, ?, '')",
+                     [("earn", 5), ("earn", 7), ("spend", 2)])
+    conn.commit()
+    conn.close()
+
+    b = bank.load_bank(db)
+    bank.earn(b, 1, "after")
+    assert _as_pairs(bank.aggregates(b, db)) == {"earn": (3, 13), "spend": (1, 2)}
+
+
+def test_seed_from_json_bank_includes_archived_history(bank_path, bank_mode, monkeypatch):
+    bank_mode(max_history=100)
+    with bank.transaction(bank_path) as b:
+        for i in range(1250):
+            bank.earn(b, 1, f"e{i}")
+    assert bank.load_bank(bank_path)["meta"]["archived"] >= 1000
+
+    monkeypatch.setattr(bank, "BACKEND", "sqlite")
+    b = bank.load_bank(bank_path)
+    assert isinstance(b, careon_bank_sqlite.SqliteBank)
+    notes = [tx["note"] for tx in bank.iter_history(b, bank_path)]
+    assert notes == [f"e{i}" for i in range(1250)]
+    assert b["balance"] == 25 + 1250
+
+
+def test_transaction_first_seeds_from_json(bank_path, monkeypatch):
+    with bank.transaction(bank_path) as b:
+        bank.earn(b, 1000, "saved up")
+
+    monkeypatch.setattr(bank, "BACKEND", "sqlite")
+    with bank.transaction(bank_path) as b:
+        assert bank.spend(b, 5, "first sqlite spend")
+    b = bank.load_bank(bank_path)
+    assert b["balance"] == 1020
+    assert [tx["note"] for tx in bank.iter_history(b, bank_path)] == ["saved up", "first sqlite spend"]
+
+
+def test_txs_between_walks_the_ts_index(tmp_path):
+    db = str(tmp_path / "range.db")
+    bank.load_bank(db)
+    conn = sqlite3.connect(db)
+    rows = [(f"2026-01-01T00:00:{s:02d}Z", "earn", 1, f"n{s}-{k}") for s in range(10) for k in range(3)]
+    conn.executemany("INSERT INTO history(ts, type, amount, note) VALUES (?, ?, ?, ?)", rows)
+    conn.commit()
+    plan = conn.execute("EXPLAIN QUERY PLAN SELECT id FROM history WHERE (ts, id) > (?, ?) AND ts < ?"
+                        " ORDER BY ts, id LIMIT 5", ("a", 0, "b")).fetchall()
+    conn.close()
+    assert "history_ts" in str(plan) and "TEMP B-TREE" not in str(plan)
+
+    b = bank.load_bank(db)
+    got = list(careon_bank_sqlite.txs_between(b, "2026-01-01T00:00:02Z", "2026-01-01T00:00:08Z", batch=4))
+    assert [t["note"] for t in got] == [n for ts, _, _, n in rows if "00:02Z" <= ts[14:] < "00:08Z"]
+
+
+def test_datetime_bounds_are_converted_to_utc():
+    from datetime import datetime, timedelta, timezone
+
+    plus2 = timezone(timedelta(hours=2))
+    assert bank._ts_str(datetime(2026, 1, 1, 14, 0, 0, tzinfo=plus2)) == "2026-01-01T12:00:00Z"
+    assert bank._ts_str(datetime(2026, 1, 1, 12, 0, 0)) == "2026-01-01T12:00:00Z"
+    # Stored stamps are whole seconds, so a fractional bound rounds up.
+    assert bank._ts_str(datetime(2026, 1, 1, 12, 0, 0, 500000, tzinfo=timezone.utc)) == "2026-01-01T12:00:01Z"
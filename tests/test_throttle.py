@@ -0,0 +1,43 @@
+import pytest
+
+from sld_throttle import Throttle
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_burst_then_refill():
+    clock = Clock()
+    t = Throttle(rate=2, burst=3, clock=clock)
+    assert [t.allow("session:a") for _ in range(4)] == [True, True, True, False]
+    assert t.retry_after("session:a") == pytest.approx(0.5)
+
+    clock.now = 0.5
+    assert t.allow("session:a")
+    assert not t.allow("session:a")
+
+
+def test_all_keys_or_nothing():
+    t = Throttle(rate=1, burst=1, clock=Clock())
+    assert t.allow("user:bob")
+    assert not t.allow("session:x", "user:bob")
+    assert t.allow("session:x")  # the rejected attempt took nothing from it
+    assert t.stats()["rejected_by"] == {"user": 1}
+
+
+def test_idle_buckets_are_evicted():
+    clock = Clock()
+    t = Throttle(rate=1, burst=2, ttl=10, max_keys=3, clock=clock)
+    for k in "abcd":
+        t.allow(k)
+    assert t.stats()["keys"] == 3  # max_keys dropped the coldest
+
+    clock.now = 11
+    t.allow("e")
+    assert t.stats()["keys"] == 1
+    assert t.stats()["evicted"] == 4
@@ -0,0 +1,16 @@
+import pytest
+
+from careon_txlog import TxLog
+
+
+def _txs(n):
+    return [{"ts": f"2026-01-01T00:00:{i:02d}Z", "type": "earn", "amount": i, "note": f"n{i}"} for i in range(n)]
+
+
+@pytest.mark.parametrize("key", [slice(0, 3), slice(2, 7), slice(1, None, 3), slice(None, None, -2), -1, 4])
+def test_delitem_matches_list(key):
+    ref = _txs(10)
+    log = TxLog.from_list(ref)
+    del ref[key]
+    del log[key]
+    assert log.to_list() == ref
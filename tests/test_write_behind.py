@@ -0,0 +1,57 @@
+import threading
+
+import pytest
+
+import careon_bank_v2 as bank
+import sld_lock
+from sld_lock import StaleWriteError
+
+
+def _earn_many(path, threads, per_thread):
+    def run(tid):
+        for i in range(per_thread):
+            bank.update_bank(path, lambda b: bank.earn(b, 1, f"t{tid}-{i}"))
+
+    ts = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+
+@pytest.mark.parametrize("journal", [False, True], ids=["snapshot", "journal"])
+def test_concurrent_writers_lose_nothing(bank_path, bank_mode, journal):
+    bank_mode(write_behind=True, journal=journal, max_history=150)
+    bank.ensure_bank_exists(bank_path)
+    _earn_many(bank_path, threads=4, per_thread=100)
+
+    assert bank.flush(10)
+    assert bank.load_bank(bank_path)["balance"] == 25 + 400
+    bank.clear_cache()
+    b = bank.load_bank(bank_path)
+    assert b["balance"] == 25 + 400
+    notes = [tx["note"] for tx in bank.iter_history(b, bank_path)]
+    assert len(notes) == len(set(notes)) == 400
+    assert bank.verify_history(b, bank_path, full=True)["ok"]
+    assert bank.write_behind_stats()["errors"] == 0
+
+
+def test_copy_loaded_before_a_write_is_refused(bank_path, bank_mode):
+    bank_mode(write_behind=True, max_history=150)
+    bank.ensure_bank_exists(bank_path)
+    assert bank.flush(10)
+    with sld_lock.file_lock(bank_path):  # keeps the writer out until `stale` is loaded
+        b = bank.load_bank(bank_path)
+        for i in range(300):
+            bank.earn(b, 1, f"e{i}")
+        bank.save_bank(b, bank_path)
+        stale = bank.load_bank(bank_path)
+    assert bank.flush(10)  # archives entries `stale` still holds as hot ones
+    bank.earn(stale, 1, "late")
+    with pytest.raises(StaleWriteError):
+        bank.save_bank(stale, bank_path)
+
+    bank.clear_cache()
+    b = bank.load_bank(bank_path)
+    assert b["balance"] == 25 + 300
+    assert bank.history_len(b) == 300
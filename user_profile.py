@@ -1,8 +1,9 @@
 import json
-import os
 import re
 from datetime import datetime
-from typing import Optional
+
+import sld_persist as _persist
+import sld_serial as _serial
 
 
 # ----------------------------
@@ -120,34 +121,11 @@ def _normalize_store(store: dict) -> dict:
 
 
 # ----------------------------
-# Atomic file ops
+# Atomic file ops (see sld_persist)
 # ----------------------------
 
-def _read_json(path: str) -> Optional[dict]:
-    try:
-        with open(path, "r", encoding="utf-8") as f:
-            return json.load(f)
-    except Exception:
-        return None
-
-
 def _atomic_save_json(data: dict, path: str) -> None:
-    folder = os.path.dirname(path) or "."
-    os.makedirs(folder, exist_ok=True)
-
-    tmp = path + ".tmp"
-    bak = path + ".bak"
-
-    with open(tmp, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=2, ensure_ascii=False)
-
-    if os.path.exists(path):
-        try:
-            os.replace(path, bak)
-        except Exception:
-            pass
-
-    os.replace(tmp, path)
+    _persist.atomic_save_json(data, path)
 
 
 # ----------------------------
@@ -155,24 +133,35 @@ def _atomic_save_json(data: dict, path: str) -> None:
 # ----------------------------
 
 def load_store(path: str) -> dict:
-    if os.path.exists(path):
-        data = _read_json(path)
-        if isinstance(data, dict):
-            return _normalize_store(data)
+    # newest intact generation; a checksum-verified file was normalized when saved
+    data, trusted, gen = _persist.read_generation(path, schema=1)
+    if not isinstance(data, dict):
+        return _default_store()
+    store = data if trusted else _normalize_store(data)
+    store["meta"].pop("fingerprint", None)
+    if gen == path:  # a recovery from .bak is written back by the next save
+        store["meta"]["fingerprint"] = _fingerprint(store)
+    return store
 
-    bak = path + ".bak"
-    if os.path.exists(bak):
-        data = _read_json(bak)
-        if isinstance(data, dict):
-            return _normalize_store(data)
 
-    return _default_store()
+def _fingerprint(store: dict) -> str:
+    # the store is small: digest all profiles
+    return _persist.fingerprint(store["profiles"])
 
 
 def save_store(store: dict, path: str) -> None:
     store = _normalize_store(store)
-    store["meta"]["last_saved_utc"] = _now_utc()
-    _atomic_save_json(store, path)
+    meta = store["meta"]
+    fp = _fingerprint(store)
+    if _persist.unchanged(meta, fp):
+        return  # nothing changed since load/last save
+    meta["last_saved_utc"] = _now_utc()
+    meta["fingerprint"] = fp
+    try:
+        _atomic_save_json(store, path)
+    except Exception:
+        meta.pop("fingerprint", None)
+        raise
 
 
 def get_or_create_profile(store: dict, user_id: str) -> dict:
@@ -230,14 +219,14 @@ def summarize_profile(profile: dict) -> str:
 
 def export_store_json(store: dict) -> str:
     store = _normalize_store(store)
-    return json.dumps(store, indent=2, ensure_ascii=False)
+    return _serial.dumps_str(_persist.unstamped(store), pretty=True)
 
 
 def import_store_json(json_text: str) -> dict:
     try:
         data = json.loads(json_text)
         if isinstance(data, dict):
-            return _normalize_store(data)
+            return _normalize_store(_persist.unstamped(data))
     except Exception:
         pass
     return _default_store()